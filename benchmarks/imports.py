@@ -0,0 +1,158 @@
+"""Measure how long each entry point takes to import in a fresh interpreter.
+
+Every module is imported ``--repeat`` times, each time in a new
+``python -c`` process, and the benchmark reports:
+
+* the median import time of the module itself,
+* the median wall time of the whole process (interpreter start included),
+* which heavy dependencies the import pulled in.
+
+An entry point fails when its process takes longer than ``--budget``
+seconds or imports a dependency it must not need (torch for the gateway,
+LangChain for scoring, ...).  The exit status is non-zero on any failure,
+so the benchmark can guard start-up time in CI.  Modules whose optional
+dependencies are missing are reported as skipped.
+
+Example::
+
+    python -m benchmarks.imports --repeat 5 --budget 0.8
+    python -m benchmarks.imports --profile server.utils
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+HEAVY = ("torch", "langchain", "langchain_core", "langchain_nvidia_ai_endpoints", "onnxruntime",
+         "redis", "flask", "numpy", "requests", "pyarrow")
+
+ENTRY_POINTS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    # name: (module, dependencies it must not import)
+    "package": ("ml", HEAVY),
+    "gateway": ("server.serial_to_JSON", ("torch", "langchain", "redis", "flask")),
+    "receiver": ("server.server", ("torch", "langchain", "onnxruntime")),
+    "streams": ("server.stream", ("torch", "langchain", "onnxruntime", "flask")),
+    "runtime": ("ml.runtime", ("torch", "langchain", "redis")),
+    "monitor": ("server.utils", ("torch", "langchain")),
+    "backfill": ("ml.backfill", ("torch", "langchain")),
+    "tools": ("tool.sensors", ("torch", "langchain")),
+    "agent": ("ml.rag_agent", ("torch", "langchain", "langchain_nvidia_ai_endpoints", "redis")),
+}
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+heavy = {heavy!r}
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in heavy if name in sys.modules]}}))
+"""
+
+
+@dataclass
+class ImportResult:
+    name: str
+    module: str
+    import_times: List[float] = field(default_factory=list)
+    process_times: List[float] = field(default_factory=list)
+    loaded: List[str] = field(default_factory=list)
+    forbidden: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def import_seconds(self) -> float:
+        return statistics.median(self.import_times) if self.import_times else float("nan")
+
+    @property
+    def process_seconds(self) -> float:
+        return statistics.median(self.process_times) if self.process_times else float("nan")
+
+    def passed(self, budget: float) -> bool:
+        return self.error is not None or (not self.forbidden and self.process_seconds <= budget)
+
+
+def measure(name: str, module: str, forbidden: Sequence[str], repeat: int = 5) -> ImportResult:
+    """Import ``module`` ``repeat`` times in fresh interpreters."""
+
+    result = ImportResult(name, module)
+    probe = _PROBE.format(module=module, heavy=HEAVY)
+    for _ in range(repeat):
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True)
+        wall = time.perf_counter() - started
+        if completed.returncode != 0:
+            lines = completed.stderr.strip().splitlines()
+            result.error = lines[-1] if lines else f"exit status {completed.returncode}"
+            return result
+        report = json.loads(completed.stdout.strip().splitlines()[-1])
+        result.import_times.append(report["seconds"])
+        result.process_times.append(wall)
+        result.loaded = report["loaded"]
+    result.forbidden = [dependency for dependency in result.loaded if dependency in forbidden]
+    return result
+
+
+def profile(module: str, top: int = 20) -> str:
+    """The ``top`` slowest imports (cumulative) of ``module`` from ``python -X importtime``."""
+
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        rows.append((int(cumulative_us), int(self_us), name))
+    rows.sort(reverse=True)
+    lines = [f"{'cumulative':>11}  {'self':>9}  module"]
+    lines += [f"{cumulative / 1e3:9.1f}ms  {own / 1e3:7.1f}ms  {name}" for cumulative, own, name in rows[:top]]
+    return "\n".join(lines)
+
+
+def format_report(results: Sequence[ImportResult], budget: float) -> str:
+    lines = [f"{'entry':<10} {'module':<24} {'import':>9} {'process':>9}  {'status':<6} heavy dependencies"]
+    for result in results:
+        if result.error is not None:
+            lines.append(f"{result.name:<10} {result.module:<24} {'-':>9} {'-':>9}  {'skip':<6} {result.error}")
+            continue
+        status = "ok" if result.passed(budget) else "FAIL"
+        loaded = ", ".join(
+            f"{name} (forbidden)" if name in result.forbidden else name for name in result.loaded
+        ) or "-"
+        lines.append(
+            f"{result.name:<10} {result.module:<24} {result.import_seconds * 1e3:7.0f}ms "
+            f"{result.process_seconds * 1e3:7.0f}ms  {status:<6} {loaded}"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark import time of the entry points.")
+    parser.add_argument("--entries", nargs="+", choices=sorted(ENTRY_POINTS), default=list(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per entry point.")
+    parser.add_argument("--budget", type=float, default=1.0, help="Allowed process wall time in seconds.")
+    parser.add_argument("--profile", metavar="MODULE", help="Only print the slowest imports of MODULE.")
+    args = parser.parse_args()
+
+    if args.profile:
+        print(profile(args.profile))
+        return
+
+    baseline = measure("python", "sys", (), repeat=args.repeat)
+    print(f"Interpreter start-up: {baseline.process_seconds * 1e3:.0f}ms")
+    results = [measure(name, *ENTRY_POINTS[name], repeat=args.repeat) for name in args.entries]
+    print(format_report(results, args.budget))
+    if not all(result.passed(args.budget) for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,135 @@
+"""Compare fp32 and dynamic int8 autoencoder scoring on the CPU.
+
+For every batch size the benchmark times :func:`ml.inference.score_batch`
+with the fp32 model and with its :func:`ml.inference.quantize_dynamic` copy,
+and reports the p50/p99 latency, windows per second and how much the int8
+reconstruction errors differ from the fp32 ones (which decides whether the
+anomaly threshold still holds).
+
+Example::
+
+    python -m benchmarks.quantization --batch-sizes 1 8 64 512 --threads 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from dataclasses import dataclass
+from typing import List, Sequence
+
+import numpy as np
+import torch
+
+from ml.inference import configure_threads, load_autoencoder, quantize_dynamic, score_batch
+from ml.model import AutoEncoder
+from ml.runtime import DEFAULT_THRESHOLD, MODEL_PATH
+
+
+@dataclass
+class QuantResult:
+    """Timings and accuracy of one precision at one batch size."""
+
+    precision: str
+    batch_size: int
+    latencies: List[float]
+    mean_abs_error_delta: float
+    max_rel_error_delta: float
+    flipped: int
+
+    @property
+    def windows_per_second(self) -> float:
+        return self.batch_size / float(np.mean(self.latencies))
+
+    def percentile(self, q: float) -> float:
+        return float(np.percentile(self.latencies, q))
+
+
+def make_windows(batch_size: int, window_size: int, *, seed: int = 0) -> torch.Tensor:
+    """Synthetic heart-rate-like windows: a slow trend plus noise."""
+
+    rng = np.random.default_rng(seed)
+    trend = rng.normal(75, 5, (batch_size, 1)) + np.linspace(0, rng.normal(0, 2), window_size)
+    return torch.from_numpy((trend + rng.normal(0, 1.5, (batch_size, window_size))).astype(np.float32))
+
+
+def time_model(model: torch.nn.Module, batch: torch.Tensor, *, iterations: int, warmup: int = 5) -> List[float]:
+    for _ in range(warmup):
+        score_batch(model, batch)
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        score_batch(model, batch)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def run(
+    model: AutoEncoder,
+    batch_sizes: Sequence[int],
+    *,
+    iterations: int = 200,
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[QuantResult]:
+    window_size = model.encoder[0].in_features
+    quantized = quantize_dynamic(model)
+    results = []
+    for batch_size in batch_sizes:
+        batch = make_windows(batch_size, window_size)
+        reference = score_batch(model, batch)
+        for precision, candidate in (("fp32", model), ("int8", quantized)):
+            errors = score_batch(candidate, batch)
+            delta = (errors - reference).abs()
+            results.append(
+                QuantResult(
+                    precision,
+                    batch_size,
+                    time_model(candidate, batch, iterations=iterations),
+                    float(delta.mean()),
+                    float((delta / reference.abs().clamp_min(1e-12)).max()),
+                    int(((errors > threshold) != (reference > threshold)).sum()),
+                )
+            )
+    return results
+
+
+def format_report(results: Sequence[QuantResult]) -> str:
+    lines = [
+        f"{'prec':>5} {'batch':>6} {'p50 ms':>8} {'p99 ms':>8} {'windows/s':>11} "
+        f"{'mean |Δerr|':>12} {'max rel Δ':>10} {'flipped':>8}"
+    ]
+    for r in results:
+        lines.append(
+            f"{r.precision:>5} {r.batch_size:>6} {r.percentile(50) * 1e3:>8.3f} {r.percentile(99) * 1e3:>8.3f} "
+            f"{r.windows_per_second:>11.0f} {r.mean_abs_error_delta:>12.3g} {r.max_rel_error_delta:>10.2%} "
+            f"{r.flipped:>8}"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark fp32 vs dynamic int8 autoencoder scoring.")
+    parser.add_argument("--checkpoint", default=str(MODEL_PATH),
+                        help="Trained checkpoint; a randomly initialised model is used if it is missing.")
+    parser.add_argument("--window-size", type=int, default=32, help="Input size of the fallback model.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64, 512])
+    parser.add_argument("--iterations", type=int, default=200, help="Timed forward passes per configuration.")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Anomaly threshold used to count flipped decisions.")
+    args = parser.parse_args()
+
+    threads = configure_threads(args.threads, interop_threads=1)
+    try:
+        model, _ = load_autoencoder(args.checkpoint)
+        source = args.checkpoint
+    except FileNotFoundError:
+        model = AutoEncoder(args.window_size).eval()
+        source = f"random AutoEncoder({args.window_size})"
+
+    print(f"Model: {source}, threads: {threads}, engine: {torch.backends.quantized.engine}")
+    print(format_report(run(model, args.batch_sizes, iterations=args.iterations, threshold=args.threshold)))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
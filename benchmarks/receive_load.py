@@ -0,0 +1,142 @@
+"""Load test for the ``/receive`` endpoint.
+
+Several client threads, each with its own keep-alive ``requests.Session``,
+post batches of synthetic readings for a fixed duration per batch size.  The
+report lists requests per second, readings per second and the p50/p99
+request latency, which makes it easy to compare the development server with
+``python -m server.serve``.
+
+Example::
+
+    python -m benchmarks.receive_load --url http://localhost:5000/receive \\
+        --batch-sizes 1 10 100 1000 --concurrency 8 --duration 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, List, Sequence
+
+import requests
+
+SENSORS = ("HeartRate", "Temp", "AccelX", "AccelY", "AccelZ")
+
+
+@dataclass
+class LoadResult:
+    """Outcome of one load level."""
+
+    batch_size: int
+    requests: int
+    errors: int
+    elapsed: float
+    latencies: List[float]
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def readings_per_second(self) -> float:
+        return self.requests_per_second * self.batch_size
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return float("nan")
+        ordered = sorted(self.latencies)
+        index = min(int(round(q / 100 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+
+def make_batch(batch_size: int, fmt: str = "rows") -> Any:
+    """Build a payload in one of the formats ``/receive`` accepts."""
+
+    names = [random.choice(SENSORS) for _ in range(batch_size)]
+    values = [round(random.uniform(-30, 280), 3) for _ in range(batch_size)]
+    if fmt == "columnar":
+        now = time.time()
+        return {"names": names, "values": values, "timestamps": [now] * batch_size}
+    return [{"sensor_name": name, "sensor_output": value} for name, value in zip(names, values)]
+
+
+def run_level(
+    url: str, batch_size: int, *, concurrency: int, duration: float, fmt: str = "rows"
+) -> LoadResult:
+    """Hammer ``url`` with ``batch_size`` readings per request for ``duration`` seconds."""
+
+    deadline = time.perf_counter() + duration
+    lock = threading.Lock()
+    latencies: List[float] = []
+    counts = {"requests": 0, "errors": 0}
+
+    def worker() -> None:
+        session = requests.Session()
+        local_latencies: List[float] = []
+        ok = errors = 0
+        while time.perf_counter() < deadline:
+            payload = make_batch(batch_size, fmt)
+            started = time.perf_counter()
+            try:
+                response = session.post(url, json=payload, timeout=30)
+                failed = response.status_code != 200
+            except requests.RequestException:
+                failed = True
+            local_latencies.append(time.perf_counter() - started)
+            if failed:
+                errors += 1
+            else:
+                ok += 1
+        session.close()
+        with lock:
+            latencies.extend(local_latencies)
+            counts["requests"] += ok
+            counts["errors"] += errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return LoadResult(batch_size, counts["requests"], counts["errors"], elapsed, latencies)
+
+
+def format_report(results: Sequence[LoadResult]) -> str:
+    lines = [f"{'batch':>6} {'req/s':>9} {'readings/s':>11} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}"]
+    for result in results:
+        lines.append(
+            f"{result.batch_size:>6} {result.requests_per_second:>9.1f} "
+            f"{result.readings_per_second:>11.1f} {result.percentile(50) * 1e3:>8.2f} "
+            f"{result.percentile(99) * 1e3:>8.2f} {result.errors:>7}"
+        )
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the /receive endpoint.")
+    parser.add_argument("--url", default="http://localhost:5000/receive")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of client threads.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per batch size.")
+    parser.add_argument("--format", choices=("rows", "columnar"), default="rows",
+                        help="Payload layout sent to /receive.")
+    args = parser.parse_args()
+
+    results = []
+    for batch_size in args.batch_sizes:
+        print(f"Running batch size {batch_size} for {args.duration:.0f}s ...")
+        results.append(
+            run_level(args.url, batch_size, concurrency=args.concurrency, duration=args.duration, fmt=args.format)
+        )
+    print()
+    print(format_report(results))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,446 @@
+"""End-to-end benchmark of ingest, storage, reads and anomaly scoring.
+
+Synthetic telemetry from :mod:`ml.data_generation` (N devices, five channels,
+injected anomalies) is driven through every stage of the pipeline:
+
+* ``generate``: the generator itself.
+* ``store``: :meth:`SensorLogStore.bulk_push_columns` in chunks.
+* ``receive``: columnar batches posted to ``/receive`` over one keep-alive
+  session.
+* ``uploader``: one :class:`server.uploader.BatchUploader` per device
+  flushing gzip batches to the same endpoint.
+* ``fetch_recent``, ``fetch_range``, ``fetch_range_1m``: history reads.
+* ``fleet_tick``: one monitoring tick over the whole fleet, i.e.
+  :meth:`SensorLogStore.fetch_recent_fleet` plus
+  :meth:`ml.detectors.Cascade.score_fleet`.
+* ``scoring``: :class:`ml.detectors.Cascade` on windows ending inside and
+  outside the injected anomalies, which gives detection recall and the
+  false-positive rate.
+
+Each stage reports operations per second, p50/p99 latency and the process's
+peak RSS (plus the traced allocation peak with ``--trace-memory``).  By
+default everything runs against an in-process fakeredis server and Flask app,
+so the numbers are comparable between runs rather than absolute;
+``--redis live`` uses the Redis configured through ``REDIS_HOST`` etc. and
+``--url`` an already running receiver.  Every run writes under its own
+``bench:<id>:`` key namespace, which is deleted afterwards, so a live Redis
+keeps no benchmark readings (an external ``--url`` receiver writes to its
+own keys instead).  ``--json`` saves the report for comparing runs.
+
+Example::
+
+    python -m benchmarks.suite --devices 8 --duration 300 --rate 5 --json suite.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import requests
+
+from ml.data_generation import DEFAULT_SPECS, SyntheticBatch, generate_readings
+
+
+@dataclass
+class StageResult:
+    """Timings of one benchmark stage."""
+
+    stage: str
+    operations: int
+    elapsed: float
+    latencies: List[float]
+    peak_rss_mb: float = float("nan")
+    traced_peak_mb: float = float("nan")
+    extra: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def throughput(self) -> float:
+        return self.operations / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, q: float) -> float:
+        if not self.latencies:
+            return float("nan")
+        return float(np.percentile(self.latencies, q))
+
+    def as_dict(self) -> Dict[str, object]:
+        out = asdict(self)
+        del out["latencies"]
+        out.update(throughput=self.throughput, p50=self.percentile(50), p99=self.percentile(99))
+        return out
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+@contextmanager
+def _stage(name: str, results: List[StageResult], trace_memory: bool) -> Iterator[StageResult]:
+    result = StageResult(name, 0, 0.0, [])
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result.elapsed = time.perf_counter() - started
+        if trace_memory:
+            result.traced_peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        result.peak_rss_mb = _peak_rss_mb()
+        results.append(result)
+
+
+def _timed(result: StageResult, call: Callable[[], object], operations: int) -> object:
+    started = time.perf_counter()
+    value = call()
+    result.latencies.append(time.perf_counter() - started)
+    result.operations += operations
+    return value
+
+
+# ----------------------------------------------------------------------
+# Environment
+# ----------------------------------------------------------------------
+def start_fake_redis() -> object:
+    """Start a fakeredis TCP server on a free port and point ``REDIS_*`` at it."""
+
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError as exc:
+        raise ImportError(
+            "The `fakeredis` package is required for --redis fake. Install it with `pip install fakeredis`."
+        ) from exc
+
+    server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    # Connection handlers must not keep the interpreter alive at exit.
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fakeredis", daemon=True).start()
+    os.environ["REDIS_HOST"], port = server.server_address[:2]
+    os.environ["REDIS_PORT"] = str(port)
+    os.environ.pop("REDIS_PASSWORD", None)
+    return server
+
+
+def start_receiver(store=None) -> tuple:
+    """Serve the Flask app on a free local port, writing to ``store``; returns ``(server, url)``."""
+
+    from werkzeug.serving import make_server
+
+    from server.server import app, reset_log_store
+
+    reset_log_store(store)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="receiver", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/receive"
+
+
+# ----------------------------------------------------------------------
+# Stages
+# ----------------------------------------------------------------------
+def bench_store(store, names: Sequence[str], batch: SyntheticBatch, result: StageResult, chunk: int) -> None:
+    values = batch.values.tolist()
+    timestamps = batch.timestamps.tolist()
+    devices = batch.devices.tolist()
+    for offset in range(0, len(values), chunk):
+        end = offset + chunk
+        _timed(
+            result,
+            lambda: store.bulk_push_columns(
+                names[offset:end], values[offset:end], timestamps[offset:end], devices[offset:end]
+            ),
+            len(values[offset:end]),
+        )
+
+
+def bench_receive(url: str, names: Sequence[str], batch: SyntheticBatch, result: StageResult, chunk: int) -> None:
+    values = batch.values.tolist()
+    timestamps = batch.timestamps.tolist()
+    devices = batch.devices.tolist()
+    with requests.Session() as session:
+        for offset in range(0, len(values), chunk):
+            end = offset + chunk
+            payload = {
+                "names": names[offset:end],
+                "values": values[offset:end],
+                "timestamps": timestamps[offset:end],
+                "devices": devices[offset:end],
+            }
+            response = _timed(result, lambda: session.post(url, json=payload, timeout=30), end - offset)
+            if response.status_code != 200:
+                result.extra["errors"] = result.extra.get("errors", 0) + 1
+    result.operations = len(values)
+
+
+def bench_uploader(url: str, names: Sequence[str], batch: SyntheticBatch, result: StageResult, chunk: int) -> None:
+    """One gateway per device, flushed round-robin as their buffers fill."""
+
+    from server.uploader import BatchUploader
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uploaders = {
+            device: BatchUploader(
+                url, max_batch=chunk, spool_path=os.path.join(tmp, f"{device}.jsonl"), max_retries=0, device=device
+            )
+            for device in np.unique(batch.devices).tolist()
+        }
+        pending = dict.fromkeys(uploaders, 0)
+        values = batch.values.tolist()
+        timestamps = batch.timestamps.tolist()
+        delivered = 0
+        for name, value, timestamp, device in zip(names, values, timestamps, batch.devices.tolist()):
+            uploaders[device].add(name, value, timestamp)
+            pending[device] += 1
+            if pending[device] == chunk:
+                delivered += _timed(result, uploaders[device].flush, 0)
+                pending[device] = 0
+        for device, uploader in uploaders.items():
+            if pending[device]:
+                delivered += _timed(result, uploader.flush, 0)
+            uploader.close()
+    result.operations = delivered
+    result.extra["undelivered"] = len(values) - delivered
+
+
+def bench_reads(store, batch: SyntheticBatch, results: List[StageResult], trace_memory: bool) -> None:
+    start, end = float(batch.timestamps.min()), float(batch.timestamps.max())
+    series = sorted(set(zip(batch.devices.tolist(), batch.sensors.tolist())))
+    with _stage("fetch_recent", results, trace_memory) as result:
+        for device, sensor in series:
+            readings = _timed(result, lambda: store.fetch_recent(sensor, 256, device=device), 0)
+            result.operations += len(readings)
+    with _stage("fetch_range", results, trace_memory) as result:
+        for device, sensor in series:
+            timestamps, _ = _timed(result, lambda: store.fetch_range(sensor, start, end, device=device), 0)
+            result.operations += len(timestamps)
+    with _stage("fetch_range_1m", results, trace_memory) as result:
+        for device, sensor in series:
+            timestamps, _ = _timed(result, lambda: store.fetch_range(sensor, start, end, step=60, device=device), 0)
+            result.operations += len(timestamps)
+
+
+def bench_fleet_tick(store, result: StageResult, *, window: int, ticks: int = 20) -> None:
+    """What one monitoring tick costs for the whole fleet: a fan-out read and one scoring batch."""
+
+    from ml.detectors import Cascade
+
+    cascade = Cascade()
+    sensors = [spec.name for spec in DEFAULT_SPECS]
+    devices = store.devices()
+
+    def tick() -> None:
+        histories = store.fetch_recent_fleet(sensors, devices, limit=window)
+        cascade.score_fleet(
+            {
+                device: {name: [r.sensor_output for r in readings] for name, readings in by_sensor.items()}
+                for device, by_sensor in histories.items()
+            }
+        )
+
+    for _ in range(ticks):
+        _timed(result, tick, len(devices) * len(sensors))
+    result.extra["devices"] = len(devices)
+
+
+def bench_scoring(
+    batch: SyntheticBatch,
+    result: StageResult,
+    *,
+    window: int,
+    normal_samples: int,
+    use_model: bool,
+    seed: int = 0,
+) -> None:
+    """Score windows that end inside every anomaly and at random normal samples.
+
+    An anomaly counts as detected when any window ending inside it is
+    flagged for its sensor; every flagged normal window is a false positive.
+    """
+
+    from ml.detectors import Cascade
+
+    from ml.runtime import load_default_model
+
+    cascade = Cascade(load_model=load_default_model if use_model else None)
+    rng = np.random.default_rng(seed)
+    channels = [spec.name for spec in DEFAULT_SPECS]
+    detected = set()
+    false_positives = normal_windows = 0
+
+    for device in np.unique(batch.devices):
+        series = {channel: batch.series(device, channel) for channel in channels}
+        samples = len(series[channels[0]][1])
+        # Anomaly spans as sample indices of their own channel.
+        spans = {}
+        for event_id, event in enumerate(batch.events):
+            if event.device == device:
+                times = series[event.sensor][0]
+                first = int(np.searchsorted(times, event.start))
+                last = int(np.searchsorted(times, event.end, side="right"))
+                spans.setdefault(event.sensor, []).append((event_id, first, last))
+
+        anomalous = np.zeros(samples, dtype=bool)
+        for channel in channels:
+            anomalous |= series[channel][2]
+        candidates = np.flatnonzero(~anomalous[window:]) + window
+        normal = rng.choice(candidates, size=min(normal_samples, candidates.size), replace=False)
+        ends = sorted(set(normal.tolist()) | {i for s in spans.values() for _, a, b in s for i in range(a, b)})
+
+        for end in ends:
+            if end < window - 1:
+                continue
+            windows = {channel: series[channel][1][end - window + 1:end + 1] for channel in channels}
+            scored = _timed(result, lambda: cascade.score(windows), len(channels))
+            for channel in channels:
+                flagged = scored[channel].anomaly
+                if series[channel][2][end]:
+                    if flagged:
+                        detected.update(e for e, a, b in spans.get(channel, ()) if a <= end < b)
+                else:
+                    normal_windows += 1
+                    false_positives += flagged
+
+    result.extra["events"] = len(batch.events)
+    result.extra["recall"] = len(detected) / len(batch.events) if batch.events else float("nan")
+    result.extra["false_positive_rate"] = false_positives / normal_windows if normal_windows else float("nan")
+    result.extra["model"] = float(use_model and cascade._model is not None)
+
+
+# ----------------------------------------------------------------------
+# Driver
+# ----------------------------------------------------------------------
+def run(
+    *,
+    devices: int = 4,
+    duration: float = 120.0,
+    rate_hz: float = 5.0,
+    anomaly_rate: float = 0.002,
+    chunk: int = 1000,
+    url: Optional[str] = None,
+    window: int = 32,
+    normal_samples: int = 500,
+    use_model: bool = True,
+    trace_memory: bool = False,
+    seed: int = 0,
+    namespace: Optional[str] = None,
+) -> List[StageResult]:
+    """Run every stage once against the Redis configured in the environment.
+
+    Readings are written under ``namespace`` (a fresh ``bench:<id>:`` by
+    default), and every key in it is deleted when the run ends.
+    """
+
+    from server.redis import SensorLogStore
+
+    results: List[StageResult] = []
+    with _stage("generate", results, trace_memory) as result:
+        batch = _timed(result, lambda: generate_readings(devices, duration, rate_hz, anomaly_rate=anomaly_rate,
+                                                         seed=seed), 0)
+        result.operations = len(batch)
+
+    store = SensorLogStore(namespace=namespace or f"bench:{uuid.uuid4().hex[:12]}:")
+    names = batch.sensors.tolist()
+    try:
+        with _stage("store", results, trace_memory) as result:
+            bench_store(store, names, batch, result, chunk)
+
+        receiver = None
+        if url is None:
+            receiver, url = start_receiver(store)
+        try:
+            # Separate keys per stage keep the history of each write path apart.
+            with _stage("receive", results, trace_memory) as result:
+                bench_receive(url, [f"receive:{name}" for name in names], batch, result, chunk)
+            with _stage("uploader", results, trace_memory) as result:
+                bench_uploader(url, [f"uploader:{name}" for name in names], batch, result, chunk)
+        finally:
+            if receiver is not None:
+                from server.server import reset_log_store
+
+                receiver.shutdown()
+                reset_log_store()
+
+        bench_reads(store, batch, results, trace_memory)
+        with _stage("fleet_tick", results, trace_memory) as result:
+            bench_fleet_tick(store, result, window=window)
+    finally:
+        store.clear()
+
+    with _stage("scoring", results, trace_memory) as result:
+        bench_scoring(batch, result, window=window, normal_samples=normal_samples, use_model=use_model, seed=seed)
+    return results
+
+
+def format_report(results: Sequence[StageResult]) -> str:
+    lines = [f"{'stage':<15} {'ops':>9} {'ops/s':>11} {'p50 ms':>9} {'p99 ms':>9} {'rss MB':>8} {'traced MB':>10}"]
+    for r in results:
+        lines.append(
+            f"{r.stage:<15} {r.operations:>9} {r.throughput:>11.0f} {r.percentile(50) * 1e3:>9.3f} "
+            f"{r.percentile(99) * 1e3:>9.3f} {r.peak_rss_mb:>8.1f} {r.traced_peak_mb:>10.1f}"
+        )
+        if r.extra:
+            lines.append(" " * 16 + ", ".join(f"{key}={value:.3g}" for key, value in r.extra.items()))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of ingest, storage, reads and scoring.")
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=120.0, help="Seconds of telemetry per device.")
+    parser.add_argument("--rate", type=float, default=5.0, help="Samples per second per channel.")
+    parser.add_argument("--anomaly-rate", type=float, default=0.002)
+    parser.add_argument("--chunk", type=int, default=1000, help="Readings per write, request or upload.")
+    parser.add_argument("--redis", choices=("fake", "live"), default="fake",
+                        help="In-process fakeredis server, or the Redis configured through REDIS_HOST etc.")
+    parser.add_argument("--url", default=None, help="Existing /receive endpoint; an in-process one by default.")
+    parser.add_argument("--window", type=int, default=32, help="Readings per scored window.")
+    parser.add_argument("--normal-samples", type=int, default=500,
+                        help="Normal windows scored per device for the false-positive rate.")
+    parser.add_argument("--no-model", action="store_true", help="Score with the classical detectors only.")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record traced allocation peaks (slows every stage down).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Write the report to this file as JSON.")
+    args = parser.parse_args()
+
+    if args.redis == "fake":
+        start_fake_redis()
+    results = run(
+        devices=args.devices,
+        duration=args.duration,
+        rate_hz=args.rate,
+        anomaly_rate=args.anomaly_rate,
+        chunk=args.chunk,
+        url=args.url,
+        window=args.window,
+        normal_samples=args.normal_samples,
+        use_model=not args.no_model,
+        trace_memory=args.trace_memory,
+        seed=args.seed,
+    )
+    print(format_report(results))
+    if args.json:
+        report = {"args": vars(args), "stages": [r.as_dict() for r in results]}
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
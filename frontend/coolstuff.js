@@ -1,113 +1,154 @@
 
-document.addEventListener("DOMContentLoaded", () => {
-    const table = document.querySelector("#employee-status table");
-    const tbody = table.querySelector("tbody");
-
-    // Convert rows to an array
-    const rows = Array.from(tbody.querySelectorAll("tr"));
-
-    // Define the correct class and colors for each status
-    const statusConfig = {
-        danger:  { class: "danger",  text: "Danger",  color: "#ef4444", textColor: "white" },
-        warning: { class: "warning", text: "Warning", color: "#facc15", textColor: "black" },
-        normal:  { class: "normal",  text: "Normal",  color: "#22c55e", textColor: "white" }
-    };
-
-    // Priority order (lower number = higher priority)
-    const priority = { danger: 1, warning: 2, normal: 3 };
-
-    rows.forEach(row => {
-        const statusEl = row.querySelector(".status");
-        if (!statusEl) return;
-
-        // Normalize text (remove spaces, lowercase)
-        const text = statusEl.textContent.trim().toLowerCase();
-
-        // Find which status it matches
-        let matched = null;
-        for (const key in statusConfig) {
-            if (text.includes(key)) {
-                matched = statusConfig[key];
-                break;
-            }
+// Base URL of the Flask server, from <meta name="sensor-api" content="..."> (same origin if missing)
+const apiMeta = document.querySelector('meta[name="sensor-api"]');
+const API_BASE = apiMeta ? apiMeta.content.replace(/\/$/, "") : "";
+
+// Who wears which device; devices without a name show their id
+const DEVICE_NAMES = {
+    // "wearable-07": "Molly Masalskis",
+};
+
+// Define the correct class and colors for each status
+const statusConfig = {
+    danger:  { class: "danger",  text: "Danger",  color: "#ef4444", textColor: "white" },
+    warning: { class: "warning", text: "Warning", color: "#facc15", textColor: "black" },
+    normal:  { class: "normal",  text: "Normal",  color: "#22c55e", textColor: "white" }
+};
+
+// Priority order (lower number = higher priority)
+const priority = { danger: 1, warning: 2, normal: 3 };
+
+function applyStatus(statusEl, status) {
+    const matched = statusConfig[status] || statusConfig.normal;
+    statusEl.className = `status ${matched.class}`;
+    statusEl.style.backgroundColor = matched.color;
+    statusEl.style.color = matched.textColor;
+    statusEl.textContent = matched.text;
+}
+
+// Apply a delta from the server: nested objects merge, null deletes a key
+function mergeDelta(target, delta) {
+    for (const key in delta) {
+        const value = delta[key];
+        if (value === null) {
+            delete target[key];
+        } else if (typeof value === "object" && typeof target[key] === "object" && target[key] !== null) {
+            mergeDelta(target[key], value);
+        } else {
+            target[key] = value;
         }
+    }
+    return target;
+}
+
+// Keep `devices` in sync with /api/stream and call onChange(devices, changed) after every event.
+// The browser reconnects by itself and resumes from the last event id.  When the
+// server refuses the stream (a 503 from a receiver whose stream slots are taken)
+// the browser gives up, so show /api/snapshot and open a new stream a little later.
+const STREAM_RETRY_MS = 5000;
+
+function subscribeDevices(onChange) {
+    const devices = {};
+
+    function replace(snapshot) {
+        for (const key in devices) delete devices[key];
+        Object.assign(devices, snapshot.devices);
+        onChange(devices, snapshot.devices);
+    }
 
-        // If found, fix the class and color
-        if (matched) {
-            statusEl.className = `status ${matched.class}`;
-            statusEl.style.backgroundColor = matched.color;
-            statusEl.style.color = matched.textColor;
-            statusEl.textContent = matched.text; // normalize the label
-        }
-    });
+    function connect() {
+        const source = new EventSource(`${API_BASE}/api/stream`);
+
+        source.addEventListener("snapshot", event => replace(JSON.parse(event.data)));
+
+        source.addEventListener("delta", event => {
+            const data = JSON.parse(event.data);
+            mergeDelta(devices, data.devices);
+            onChange(devices, data.devices);
+        });
+
+        source.addEventListener("error", () => {
+            if (source.readyState !== EventSource.CLOSED) return;
+            fetch(`${API_BASE}/api/snapshot`)
+                .then(response => response.ok ? response.json() : null)
+                .then(snapshot => { if (snapshot) replace(snapshot); })
+                .catch(() => {});
+            setTimeout(connect, STREAM_RETRY_MS);
+        });
+    }
 
-    // Sort rows based on corrected status
-    rows.sort((a, b) => {
-        const statusA = a.querySelector(".status").classList[1];
-        const statusB = b.querySelector(".status").classList[1];
-        return priority[statusA] - priority[statusB];
-    });
+    connect();
+}
 
-    // Clear and re-add in sorted order
-    tbody.innerHTML = "";
-    rows.forEach(row => tbody.appendChild(row));
-});
-document.addEventListener("DOMContentLoaded", async () => {
-    const tableBody = document.getElementById("sensor-table-body");
+function formatTime(ts) {
+    return ts ? new Date(ts * 1000).toLocaleTimeString() : "-";
+}
 
-        // Fetch live data from your endpoint
-        const response = await fetch("http://vibrator.d3llie.tech/data");
-        const data = await response.json();
-        console.log("Fetched data:", data);
-
-        // Access sensor_outputs
-        const outputs = data.sensor_outputs;
-        if (!outputs) throw new Error("Missing sensor_outputs in response");
-
-        // Get all arrays
-        const temps = outputs.Temp || [];
-        const heartRates = outputs.HeartRate || [];
-        const accelX = outputs.AccelX || [];
-        const accelY = outputs.AccelY || [];
-        const accelZ = outputs.AccelZ || [];
-
-        // Clear old table rows
-        tableBody.innerHTML = "";
-
-        // Figure out how many readings we have (based on the length of Temp)
-        const numReadings = temps.length;
-
-        for (let i = 0; i < numReadings; i++) {
-            const temp = temps[i];
-            const hr = heartRates[i];
-            const ax = accelX[i];
-            const ay = accelY[i];
-            const az = accelZ[i];
-
-            // Determine status
-            let statusText = "Normal";
-            let statusClass = "normal";
-
-            if (hr > 100 || temp > 38) {
-                statusText = "Danger";
-                statusClass = "danger";
-            } else if (hr > 85 || temp > 37.5) {
-                statusText = "Warning";
-                statusClass = "warning";
-            }
-
-            // Create table row
+function formatValue(value) {
+    return typeof value === "number" ? value.toFixed(2) : "-";
+}
+
+// Dashboard: one row per device, most urgent first
+document.addEventListener("DOMContentLoaded", () => {
+    const table = document.querySelector("#employee-status table");
+    if (!table) return;
+    const tbody = table.querySelector("tbody");
+
+    subscribeDevices(devices => {
+        const rows = Object.keys(devices).map(device => {
+            // Readings stored without a device arrive under the empty id
+            const name = DEVICE_NAMES[device] || device || "Unassigned wearable";
             const row = document.createElement("tr");
+            const params = new URLSearchParams({ device, name });
             row.innerHTML = `
-                <td>${temp.toFixed(2)}</td>
-                <td>${hr.toFixed(2)}</td>
-                <td>(${ax.toFixed(2)}, ${ay.toFixed(2)}, ${az.toFixed(2)})</td>
-                <td class="status ${statusClass}">${statusText}</td>
+                <td><a class="employee-item"></a></td>
+                <td><span class="status"></span></td>
             `;
+            const link = row.querySelector("a");
+            link.href = `healthsense.html?${params}`;
+            link.textContent = name;
+            applyStatus(row.querySelector(".status"), devices[device].status);
+            row.dataset.status = devices[device].status;
+            return row;
+        });
+
+        // Sort rows based on status
+        rows.sort((a, b) => priority[a.dataset.status] - priority[b.dataset.status]);
+
+        // Clear and re-add in sorted order
+        tbody.innerHTML = "";
+        rows.forEach(row => tbody.appendChild(row));
+    });
+});
 
-            tableBody.appendChild(row);
-        }
-
+// Employee page: live readings of the device named in the URL
+document.addEventListener("DOMContentLoaded", () => {
+    const tableBody = document.getElementById("sensor-table-body");
+    if (!tableBody) return;
+    const device = new URLSearchParams(window.location.search).get("device") ?? "";
+    const lastUpdated = document.getElementById("last-updated");
+    const maxRows = 20;
+
+    subscribeDevices((devices, changed) => {
+        const current = devices[device];
+        if (!current || !(device in changed)) return;
+        if (tableBody.querySelector("td[colspan]")) tableBody.innerHTML = "";
+
+        const values = current.values || {};
+        const row = document.createElement("tr");
+        row.innerHTML = `
+            <td>${formatValue(values.Temp)}</td>
+            <td>${formatValue(values.HeartRate)}</td>
+            <td>(${formatValue(values.AccelX)}, ${formatValue(values.AccelY)}, ${formatValue(values.AccelZ)})</td>
+            <td class="status"></td>
+        `;
+        applyStatus(row.querySelector(".status"), current.status);
+
+        // Newest reading on top
+        tableBody.insertBefore(row, tableBody.firstChild);
+        while (tableBody.rows.length > maxRows) tableBody.deleteRow(-1);
+        if (lastUpdated) lastUpdated.textContent = formatTime(current.ts);
+    });
 });
 
 document.addEventListener("DOMContentLoaded", () => {
@@ -116,7 +157,7 @@ document.addEventListener("DOMContentLoaded", () => {
     if (nameElement) {
         // Get the 'name' parameter from the URL
         const urlParams = new URLSearchParams(window.location.search);
-        const employeeName = urlParams.get("name");
+        const employeeName = urlParams.get("name") || urlParams.get("device");
 
         if (employeeName) {
             nameElement.textContent = employeeName;
@@ -124,4 +165,4 @@ document.addEventListener("DOMContentLoaded", () => {
             nameElement.textContent = "Unknown Employee";
         }
     }
-});
\ No newline at end of file
+});
@@ -1,7 +1,40 @@
-"""Machine learning helpers for training models on sensor data."""
+"""Machine learning helpers for training models on sensor data.
 
-from . import dataset, model, train
+Importing the package is free: every submodule is imported on first
+attribute access, so ``import ml`` never pulls in torch, Redis or LangChain
+and ``ml.runtime`` only costs NumPy.
+"""
+
+import importlib
 
 NUM_SENSORS = 3
 
-__all__ = [ "dataset", "model", "train"]
+__all__ = [
+    "artifact",
+    "backfill",
+    "data_augmentor",
+    "data_generation",
+    "dataset",
+    "detectors",
+    "inference",
+    "memory_writer",
+    "model",
+    "rag_agent",
+    "rag_memory",
+    "runtime",
+    "sweep",
+    "train",
+    "window_cache",
+]
+
+
+def __getattr__(name):
+    # Submodules are imported on first access so that light consumers such as
+    # ``ml.runtime`` do not pay for torch.
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
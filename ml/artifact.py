@@ -0,0 +1,231 @@
+"""Export the trained autoencoder as self-describing inference artifacts.
+
+Each artifact embeds the metadata :mod:`ml.runtime` needs (input size,
+normalisation and threshold), so scoring processes never rebuild
+:class:`ml.model.AutoEncoder` from Python or load a state dict.  Training
+fits the normalisation to its windows and calibrates the threshold as the
+:data:`THRESHOLD_QUANTILE` quantile of their reconstruction errors (see
+:func:`normalisation` and :func:`calibrate_threshold`).
+
+Usage::
+
+    python -m ml.artifact                      # re-export ml/autoencoder.pth
+    python -m ml.artifact --threshold 0.2 --formats npz ts
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+from torch import nn
+
+from ml.inference import load_autoencoder
+from ml.model import AutoEncoder
+from ml.runtime import (
+    ARTIFACT_VERSION,
+    DEFAULT_THRESHOLD,
+    MODEL_PATH,
+    NUMPY_ARTIFACT,
+    ONNX_ARTIFACT,
+    TORCHSCRIPT_ARTIFACT,
+)
+
+FORMATS = ("npz", "onnx", "ts")
+THRESHOLD_QUANTILE = 0.995
+"""Share of training windows whose reconstruction error stays below the threshold."""
+
+
+class ScoringModule(nn.Module):
+    """Normalise a batch of windows and return the reconstruction error of each."""
+
+    def __init__(self, model: AutoEncoder, offset: float = 0.0, scale: float = 1.0) -> None:
+        super().__init__()
+        self.model = model
+        self.register_buffer("offset", torch.tensor(float(offset)))
+        self.register_buffer("scale", torch.tensor(float(scale)))
+
+    def forward(self, windows: torch.Tensor) -> torch.Tensor:
+        x = (windows - self.offset) / self.scale
+        reconstruction = self.model(x)
+        return ((reconstruction - x) ** 2).mean(dim=1)
+
+
+def normalisation(windows: torch.Tensor) -> Tuple[float, float]:
+    """``(offset, scale)`` that standardise the training windows."""
+
+    offset = float(windows.mean())
+    scale = float(windows.std())
+    return offset, scale if scale > 0 else 1.0
+
+
+def calibrate_threshold(
+    model: AutoEncoder,
+    windows: torch.Tensor,
+    *,
+    offset: float = 0.0,
+    scale: float = 1.0,
+    quantile: float = THRESHOLD_QUANTILE,
+    batch_size: int = 4096,
+) -> float:
+    """The ``quantile`` of the reconstruction errors of ``windows`` (raw, unnormalised)."""
+
+    scoring = ScoringModule(model, offset, scale).eval()
+    with torch.inference_mode():
+        errors = torch.cat([scoring(windows[i:i + batch_size]) for i in range(0, len(windows), batch_size)])
+    return float(np.quantile(errors.numpy(), quantile))
+
+
+def artifact_meta(
+    model: AutoEncoder,
+    *,
+    threshold: float = DEFAULT_THRESHOLD,
+    offset: float = 0.0,
+    scale: float = 1.0,
+    calibrated: bool = False,
+) -> Dict[str, object]:
+    linears = [m for m in model.modules() if isinstance(m, nn.Linear)]
+    return {
+        "version": ARTIFACT_VERSION,
+        "input_dim": linears[0].in_features,
+        "threshold": float(threshold),
+        "offset": float(offset),
+        "scale": float(scale),
+        "calibrated": bool(calibrated),
+        "relu": _relu_flags(model),
+        "created": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _relu_flags(model: AutoEncoder) -> List[bool]:
+    """Whether each ``nn.Linear`` of the model, in order, is followed by a ReLU."""
+
+    flags: List[bool] = []
+    for stack in (model.encoder, model.decoder):
+        layers = list(stack)
+        for i, layer in enumerate(layers):
+            if isinstance(layer, nn.Linear):
+                flags.append(i + 1 < len(layers) and isinstance(layers[i + 1], nn.ReLU))
+    return flags
+
+
+def export_numpy(model: AutoEncoder, path: Union[str, Path], meta: Dict[str, object]) -> Path:
+    arrays = {}
+    linears = [m for m in model.modules() if isinstance(m, nn.Linear)]
+    for i, layer in enumerate(linears):
+        arrays[f"weight_{i}"] = layer.weight.detach().numpy().astype(np.float32)
+        arrays[f"bias_{i}"] = layer.bias.detach().numpy().astype(np.float32)
+    path = Path(path)
+    with open(path, "wb") as fh:
+        np.savez(fh, meta=np.array(json.dumps(meta)), **arrays)
+    return path
+
+
+def export_torchscript(model: AutoEncoder, path: Union[str, Path], meta: Dict[str, object]) -> Path:
+    module = torch.jit.script(ScoringModule(model, meta["offset"], meta["scale"]).eval())
+    path = Path(path)
+    torch.jit.save(module, str(path), _extra_files={"meta.json": json.dumps(meta)})
+    return path
+
+
+def export_onnx(model: AutoEncoder, path: Union[str, Path], meta: Dict[str, object]) -> Path:
+    try:
+        import onnx
+    except ImportError as exc:
+        raise ImportError("The `onnx` package is required for ONNX export. Install it with `pip install onnx`.") from exc
+
+    path = Path(path)
+    dummy = torch.zeros(1, int(meta["input_dim"]))
+    torch.onnx.export(
+        ScoringModule(model, meta["offset"], meta["scale"]).eval(),
+        (dummy,),
+        str(path),
+        input_names=["windows"],
+        output_names=["errors"],
+        dynamic_axes={"windows": {0: "batch"}, "errors": {0: "batch"}},
+        dynamo=False,
+    )
+    graph = onnx.load(str(path))
+    onnx.helper.set_model_props(graph, {"meta": json.dumps(meta)})
+    onnx.save(graph, str(path))
+    return path
+
+
+def export_artifacts(
+    model: AutoEncoder,
+    *,
+    threshold: float = DEFAULT_THRESHOLD,
+    offset: float = 0.0,
+    scale: float = 1.0,
+    calibrated: bool = False,
+    formats: Sequence[str] = FORMATS,
+    directory: Optional[Union[str, Path]] = None,
+) -> List[Path]:
+    """Write every requested artifact and return the paths that were written.
+
+    ``calibrated`` records that ``threshold`` was fitted to the data the
+    model was trained on rather than left at :data:`DEFAULT_THRESHOLD`.
+
+    ONNX export is skipped with a message when the ``onnx`` package is not
+    installed; the other formats only need torch and NumPy.
+    """
+
+    model.eval()
+    meta = artifact_meta(model, threshold=threshold, offset=offset, scale=scale, calibrated=calibrated)
+    targets = {"npz": NUMPY_ARTIFACT, "onnx": ONNX_ARTIFACT, "ts": TORCHSCRIPT_ARTIFACT}
+    exporters = {"npz": export_numpy, "onnx": export_onnx, "ts": export_torchscript}
+
+    written = []
+    for fmt in formats:
+        path = targets[fmt] if directory is None else Path(directory) / targets[fmt].name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            written.append(exporters[fmt](model, path, meta))
+        except ImportError as exc:
+            print(f"Skipping {fmt} artifact: {exc}")
+    return written
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export inference artifacts from a trained checkpoint.")
+    parser.add_argument("--checkpoint", default=str(MODEL_PATH))
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="Override the threshold calibrated at training time.")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    args = parser.parse_args()
+
+    model, _ = load_autoencoder(args.checkpoint)
+    threshold = model.threshold if args.threshold is None else args.threshold
+    written = export_artifacts(
+        model,
+        threshold=threshold,
+        offset=model.offset,
+        scale=model.scale,
+        calibrated=model.calibrated or args.threshold is not None,
+        formats=args.formats,
+    )
+    for path in written:
+        print(f"Wrote {path}")
+
+
+__all__ = [
+    "FORMATS",
+    "ScoringModule",
+    "THRESHOLD_QUANTILE",
+    "artifact_meta",
+    "calibrate_threshold",
+    "export_artifacts",
+    "export_numpy",
+    "export_onnx",
+    "export_torchscript",
+    "normalisation",
+]
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
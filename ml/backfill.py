@@ -0,0 +1,390 @@
+"""Re-score stored history with a newly trained autoencoder.
+
+The requested time range of every sensor (on every device) is cut into
+chunks aligned to multiples of ``chunk_seconds``.  A process pool scores
+the chunks: each worker loads the model and opens its Redis connection once,
+reads a chunk with one range query (plus the readings just before it, so
+the first windows see a full history), scores every reading's trailing
+window in a single batch and writes the reconstruction errors back as a
+series of their own::
+
+    HeartRate            -> HeartRate:anomaly
+    {wearable-07}:Temp   -> {wearable-07}:Temp:anomaly
+
+The score series is written with
+:meth:`~server.redis.SensorLogStore.replace_range`, one pipelined ``MULTI``
+per chunk that replaces whatever an earlier run stored there, and read back
+with ``store.fetch_range("HeartRate:anomaly", start, end)``.
+
+Scores are written for any model, but readings are only counted as
+anomalous against a calibrated threshold: for a model trained before
+calibration existed the report omits the count.
+
+Workers share nothing, so throughput grows with the number of cores until
+Redis saturates.  Every chunk that lies completely inside the range is
+appended to a JSON-lines checkpoint once written; an interrupted run picks
+up where it stopped when started again with the same model and chunk size.
+
+Usage::
+
+    python -m ml.backfill --since 604800 --workers 8
+    python -m ml.backfill --start 1717000000 --end 1717600000 --model ml/autoencoder.npz
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from ml.runtime import MODEL_PATH, Scorer, load_scorer, prepare_batch
+from server.redis import SensorLogStore
+
+DEFAULT_SENSORS = ("HeartRate", "Temp", "AccelX", "AccelY", "AccelZ")
+SCORE_SUFFIX = ":anomaly"
+CHECKPOINT_PATH = Path("backfill_checkpoint.jsonl")
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """One unit of work: ``sensor`` on ``device`` between ``start`` and ``stop`` (inclusive).
+
+    ``slot`` is the aligned start of the chunk; ``complete`` is false for
+    the partial chunks at the edges of the range, which are never
+    checkpointed.
+    """
+
+    device: Optional[str]
+    sensor: str
+    slot: float
+    start: float
+    stop: float
+    complete: bool
+
+    @property
+    def id(self) -> str:
+        return f"{self.device or ''}/{self.sensor}/{self.slot:.0f}"
+
+
+@dataclass
+class ChunkResult:
+    chunk: str
+    readings: int
+    anomalies: Optional[int]
+    """``None`` when the model has no calibrated threshold to count against."""
+    seconds: float
+
+
+@dataclass
+class BackfillStats:
+    """Totals of one backfill run."""
+
+    chunks: int = 0
+    skipped: int = 0
+    readings: int = 0
+    anomalies: Optional[int] = 0
+    seconds: float = 0.0
+
+    def report(self) -> str:
+        seconds = max(self.seconds, 1e-9)
+        anomalous = "no calibrated threshold" if self.anomalies is None else f"{self.anomalies:,} anomalous"
+        return (
+            f"Scored {self.readings:,} readings in {self.chunks} chunks ({self.skipped} already done) "
+            f"in {self.seconds:.2f}s: {self.readings / seconds:,.0f} readings/s, {anomalous}"
+        )
+
+
+def plan_chunks(
+    sensors: Sequence[str],
+    devices: Sequence[Optional[str]],
+    start: float,
+    end: float,
+    chunk_seconds: float,
+) -> List[Chunk]:
+    """Cut ``[start, end]`` into slot-aligned chunks for every device and sensor."""
+
+    chunks = []
+    first = math.floor(start / chunk_seconds) * chunk_seconds
+    slots = np.arange(first, end, chunk_seconds) if end > first else np.array([first])
+    for device in devices:
+        for sensor in sensors:
+            for slot in slots.tolist():
+                following = slot + chunk_seconds
+                chunk_start = max(slot, start)
+                # Chunks are half-open; the last one includes ``end`` itself.
+                stop = end if following > end else float(np.nextafter(following, -np.inf))
+                complete = slot >= start and following <= end
+                chunks.append(Chunk(device, sensor, slot, chunk_start, stop, complete))
+    return chunks
+
+
+def chunk_windows(history: np.ndarray, values: np.ndarray, window_size: int) -> np.ndarray:
+    """Trailing window of every reading in ``values`` as a ``[len(values), window_size]`` batch.
+
+    ``history`` holds the readings just before the chunk.  Rows with fewer
+    than ``window_size`` readings behind them are padded exactly like
+    :func:`ml.runtime.prepare_batch` pads short live windows.
+    """
+
+    series = np.concatenate([history, values]).astype(np.float32)
+    first = len(history)
+    batch = np.empty((len(values), window_size), dtype=np.float32)
+    full_from = max(window_size - 1, first)
+    if len(series) > full_from:
+        batch[full_from - first:] = sliding_window_view(series, window_size)[full_from - window_size + 1:]
+    for position in range(first, min(full_from, len(series))):
+        batch[position - first] = prepare_batch([series[: position + 1]], window_size)[0]
+    return batch
+
+
+# ----------------------------------------------------------------------
+# Worker side
+# ----------------------------------------------------------------------
+_store: Optional[SensorLogStore] = None
+_model = None
+_window_size = 0
+_threshold: Optional[float] = None
+
+
+def load_model(path: Union[str, Path]) -> Tuple[object, int, Optional[float]]:
+    """``(model, window size, threshold)`` for a ``.pth`` checkpoint or an exported artifact.
+
+    ``threshold`` is ``None`` for a model without a calibrated threshold.
+    """
+
+    path = Path(path)
+    if path.suffix == ".pth":
+        from ml.inference import configure_threads, load_autoencoder
+
+        # One intra-op thread per process; the pool provides the parallelism.
+        configure_threads(1)
+        model, input_dim = load_autoencoder(path)
+    else:
+        model = load_scorer(path)
+        input_dim = model.input_dim
+    return model, input_dim, model.threshold if model.calibrated else None
+
+
+def _init_worker(model_path: str, namespace: str) -> None:
+    global _store, _model, _window_size, _threshold
+    _store = SensorLogStore(namespace=namespace)
+    _model, _window_size, _threshold = load_model(model_path)
+
+
+def _errors(batch: np.ndarray) -> np.ndarray:
+    if isinstance(_model, Scorer):
+        return np.asarray(_model.score_windows(batch))
+    import torch
+
+    from ml.inference import score_batch
+
+    return score_batch(_model, torch.from_numpy(batch)).numpy()
+
+
+def score_chunk(chunk: Chunk) -> ChunkResult:
+    """Read, score and write back one chunk (runs inside a pool worker)."""
+
+    started = time.perf_counter()
+    timestamps, values = _store.fetch_range(chunk.sensor, chunk.start, chunk.stop, device=chunk.device)
+    scores = np.empty(0)
+    if len(values):
+        _, history = _store.fetch_before(chunk.sensor, chunk.start, _window_size - 1, device=chunk.device)
+        scores = _errors(chunk_windows(history, values, _window_size))
+    # Written even when empty, so stale scores of deleted readings disappear.
+    _store.replace_range(
+        f"{chunk.sensor}{SCORE_SUFFIX}", timestamps, scores, chunk.start, chunk.stop, device=chunk.device
+    )
+    anomalies = None if _threshold is None else int(np.count_nonzero(scores > _threshold))
+    return ChunkResult(chunk.id, len(values), anomalies, time.perf_counter() - started)
+
+
+# ----------------------------------------------------------------------
+# Checkpoints
+# ----------------------------------------------------------------------
+def run_key(model_path: Union[str, Path], chunk_seconds: float) -> str:
+    """Identity of a backfill: the model file and the chunk grid."""
+
+    stat = Path(model_path).stat()
+    blob = json.dumps([str(model_path), stat.st_size, stat.st_mtime_ns, chunk_seconds]).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+
+def read_checkpoint(path: Path, key: str) -> Set[str]:
+    """Ids of the chunks a previous run with the same ``key`` finished."""
+
+    if not path.exists():
+        return set()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    try:
+        if not lines or json.loads(lines[0]).get("run") != key:
+            return set()
+    except ValueError:
+        return set()
+    done = set()
+    for line in lines[1:]:
+        try:
+            done.add(json.loads(line)["chunk"])
+        except (ValueError, KeyError, TypeError):
+            continue  # torn line of an interrupted run; that chunk is scored again
+    return done
+
+
+def _truncate_torn_tail(path: Path) -> None:
+    """Cut ``path`` back to its last complete line before appending to it."""
+
+    with path.open("rb+") as handle:
+        data = handle.read()
+        if data and not data.endswith(b"\n"):
+            handle.truncate(data.rfind(b"\n") + 1)
+
+
+def _iter_completed(executor: ProcessPoolExecutor, chunks: Sequence[Chunk]) -> Iterator[Tuple[Chunk, ChunkResult]]:
+    futures = {executor.submit(score_chunk, chunk): chunk for chunk in chunks}
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+
+def backfill(
+    start: float,
+    end: float,
+    *,
+    sensors: Sequence[str] = DEFAULT_SENSORS,
+    devices: Optional[Sequence[Optional[str]]] = None,
+    model_path: Union[str, Path] = MODEL_PATH,
+    chunk_seconds: float = 3600.0,
+    workers: Optional[int] = None,
+    checkpoint: Optional[Union[str, Path]] = CHECKPOINT_PATH,
+    namespace: str = "",
+) -> BackfillStats:
+    """Score ``[start, end]`` of ``sensors`` across a process pool.
+
+    Parameters
+    ----------
+    devices:
+        Devices to re-score; ``None`` means the device-less keys plus every
+        registered device.
+    workers:
+        Pool size, by default one process per core.
+    checkpoint:
+        JSON-lines file recording finished chunks, or ``None`` to always
+        score everything.
+    """
+
+    if devices is None:
+        devices = [None, *SensorLogStore(namespace=namespace).devices()]
+    chunks = plan_chunks(sensors, devices, start, end, chunk_seconds)
+
+    done: Set[str] = set()
+    log = None
+    if checkpoint is not None:
+        checkpoint = Path(checkpoint)
+        key = run_key(model_path, chunk_seconds)
+        done = read_checkpoint(checkpoint, key)
+        if done:
+            _truncate_torn_tail(checkpoint)
+            log = checkpoint.open("a", encoding="utf-8")
+        else:
+            log = checkpoint.open("w", encoding="utf-8")
+            log.write(json.dumps({"run": key, "model": str(model_path), "chunk_seconds": chunk_seconds}) + "\n")
+            log.flush()
+
+    pending = [chunk for chunk in chunks if chunk.id not in done]
+    stats = BackfillStats(skipped=len(chunks) - len(pending))
+    workers = workers or os.cpu_count() or 1
+
+    # Keep BLAS from spawning a thread pool per worker on top of the pool itself.
+    for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(variable, "1")
+
+    started = time.perf_counter()
+    try:
+        # ``spawn`` rather than ``fork``: neither torch nor redis-py connection
+        # pools survive a fork reliably.
+        with ProcessPoolExecutor(
+            max_workers=min(workers, max(len(pending), 1)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(str(model_path), namespace),
+        ) as executor:
+            for chunk, result in _iter_completed(executor, pending):
+                stats.chunks += 1
+                stats.readings += result.readings
+                if result.anomalies is None:
+                    if stats.anomalies is not None:
+                        print(f"{model_path} has no calibrated threshold; scores are written but anomalies "
+                              "are not counted. Retrain it with `python -m ml.train`.")
+                    stats.anomalies = None
+                elif stats.anomalies is not None:
+                    stats.anomalies += result.anomalies
+                if log is not None and chunk.complete:
+                    log.write(json.dumps(asdict(result)) + "\n")
+                    log.flush()
+    finally:
+        stats.seconds = time.perf_counter() - started
+        if log is not None:
+            log.close()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-score stored sensor history with a trained autoencoder.")
+    parser.add_argument("--sensors", nargs="+", default=list(DEFAULT_SENSORS))
+    parser.add_argument("--devices", nargs="+", help="Device ids (default: every device plus device-less keys).")
+    parser.add_argument("--start", type=float, help="Unix start time (default: --since seconds ago).")
+    parser.add_argument("--end", type=float, help="Unix end time (default: now).")
+    parser.add_argument("--since", type=float, default=86400.0, help="Range length when --start is omitted.")
+    parser.add_argument("--model", default=str(MODEL_PATH),
+                        help="Checkpoint (.pth) or exported artifact (.npz/.onnx/.ts).")
+    parser.add_argument("--chunk-seconds", type=float, default=3600.0, help="Time span scored per task.")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count).")
+    parser.add_argument("--checkpoint", default=str(CHECKPOINT_PATH), help="Progress file for resuming.")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and score everything.")
+    args = parser.parse_args()
+
+    end = time.time() if args.end is None else args.end
+    start = end - args.since if args.start is None else args.start
+    if args.restart and Path(args.checkpoint).exists():
+        Path(args.checkpoint).unlink()
+
+    stats = backfill(
+        start,
+        end,
+        sensors=args.sensors,
+        devices=args.devices,
+        model_path=args.model,
+        chunk_seconds=args.chunk_seconds,
+        workers=args.workers,
+        checkpoint=args.checkpoint,
+    )
+    print(stats.report())
+
+
+__all__ = [
+    "BackfillStats",
+    "CHECKPOINT_PATH",
+    "Chunk",
+    "ChunkResult",
+    "SCORE_SUFFIX",
+    "backfill",
+    "chunk_windows",
+    "load_model",
+    "plan_chunks",
+    "read_checkpoint",
+    "run_key",
+    "score_chunk",
+]
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
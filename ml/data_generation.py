@@ -0,0 +1,251 @@
+"""Synthetic telemetry for bootstrapping, load tests and detector evaluation.
+
+:func:`generate_readings` simulates any number of wearable devices, each
+emitting the five channels of the Arduino firmware (``HeartRate``, ``Temp``,
+``AccelX``, ``AccelY``, ``AccelZ``) at a fixed rate.  Every channel follows
+a mean-reverting random walk around the envelope described by its
+:class:`SensorSpec`; the defaults come from ``data/Simulated_Data.xlsx``.
+Anomalies (spikes, drifts and readings stuck at a limit) are injected at a
+configurable rate and returned as labelled :class:`AnomalyEvent` objects so
+that detection recall can be measured.
+
+Usage::
+
+    python -m ml.data_generation --devices 4 --duration 600 --rate 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+ANOMALY_KINDS = ("spike", "drift", "stuck")
+
+
+@dataclass(frozen=True)
+class SensorSpec:
+    """Normal operating envelope of one channel.
+
+    ``low``/``high`` clip every generated value, like the sensors themselves
+    saturate (``Temp`` is pinned at 18 and 35 in the sample data).
+    """
+
+    name: str
+    mean: float
+    std: float
+    low: float
+    high: float
+    # Fraction of the deviation from ``mean`` kept from one sample to the next.
+    persistence: float = 0.9
+
+
+DEFAULT_SPECS = (
+    SensorSpec("HeartRate", 75.0, 5.0, 45.0, 190.0),
+    SensorSpec("Temp", 27.0, 4.0, 18.0, 35.0, persistence=0.98),
+    SensorSpec("AccelX", 0.0, 10.0, -50.0, 50.0, persistence=0.5),
+    SensorSpec("AccelY", 16.0, 10.0, -34.0, 66.0, persistence=0.5),
+    SensorSpec("AccelZ", -256.0, 10.0, -306.0, -206.0, persistence=0.5),
+)
+
+
+@dataclass(frozen=True)
+class AnomalyEvent:
+    """One injected anomaly; ``start``/``end`` are inclusive sample timestamps."""
+
+    device: str
+    sensor: str
+    kind: str
+    start: float
+    end: float
+
+
+@dataclass
+class SyntheticBatch:
+    """Generated readings in column form plus the injected anomalies."""
+
+    devices: np.ndarray
+    sensors: np.ndarray
+    values: np.ndarray
+    timestamps: np.ndarray
+    anomalous: np.ndarray
+    events: List[AnomalyEvent] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def series(self, device: str, sensor: str):
+        """``(timestamps, values, anomalous)`` of one channel of one device."""
+
+        mask = (self.devices == device) & (self.sensors == sensor)
+        return self.timestamps[mask], self.values[mask], self.anomalous[mask]
+
+
+def _channel(spec: SensorSpec, samples: int, rng: np.random.Generator) -> np.ndarray:
+    """Mean-reverting AR(1) series with the stationary std of ``spec``."""
+
+    phi = spec.persistence
+    shocks = rng.normal(0.0, spec.std * np.sqrt(1 - phi * phi), samples)
+    shocks[0] = rng.normal(0.0, spec.std)
+    deviation = np.empty(samples)
+    # A short Python loop per channel; samples per channel are modest and the
+    # recursion cannot be vectorised exactly.
+    level = 0.0
+    for i, shock in enumerate(shocks):
+        level = phi * level + shock
+        deviation[i] = level
+    return spec.mean + deviation
+
+
+def _inject(
+    values: np.ndarray, labels: np.ndarray, spec: SensorSpec, kind: str, start: int, length: int,
+    rng: np.random.Generator,
+) -> None:
+    end = min(start + length, len(values))
+    if kind == "spike":
+        end = start + 1
+        values[start] += rng.choice([-1, 1]) * rng.uniform(6, 10) * spec.std
+    elif kind == "drift":
+        values[start:end] += np.linspace(0, rng.choice([-1, 1]) * rng.uniform(4, 6) * spec.std, end - start)
+    else:  # stuck
+        values[start:end] = rng.choice([spec.low, spec.high])
+    labels[start:end] = True
+
+
+def generate_readings(
+    devices: int = 1,
+    duration: float = 60.0,
+    rate_hz: float = 1.0,
+    *,
+    specs: Sequence[SensorSpec] = DEFAULT_SPECS,
+    anomaly_rate: float = 0.002,
+    anomaly_length: int = 20,
+    start: Optional[float] = None,
+    seed: Optional[int] = None,
+) -> SyntheticBatch:
+    """Simulate ``devices`` wearables for ``duration`` seconds at ``rate_hz``.
+
+    Parameters
+    ----------
+    anomaly_rate:
+        Probability that an anomaly starts at any given sample of a channel.
+    anomaly_length:
+        Samples covered by ``drift`` and ``stuck`` anomalies.
+    start:
+        Timestamp of the first sample; defaults to ``now - duration``.
+    """
+
+    rng = np.random.default_rng(seed)
+    samples = max(int(duration * rate_hz), 1)
+    start = time.time() - duration if start is None else start
+    times = start + np.arange(samples) / rate_hz
+
+    device_cols, sensor_cols, value_cols, time_cols, label_cols = [], [], [], [], []
+    events: List[AnomalyEvent] = []
+    for d in range(devices):
+        device = f"device-{d:03d}"
+        # Each device gets its own jitter so their clocks do not line up exactly.
+        device_times = times + rng.uniform(0, 1 / rate_hz)
+        for spec in specs:
+            values = _channel(spec, samples, rng)
+            labels = np.zeros(samples, dtype=bool)
+            # Leave room before the first anomaly for a detection window.
+            onsets = np.flatnonzero(rng.random(samples) < anomaly_rate)
+            last_end = anomaly_length
+            for onset in onsets:
+                if onset < last_end:
+                    continue
+                kind = ANOMALY_KINDS[rng.integers(len(ANOMALY_KINDS))]
+                _inject(values, labels, spec, kind, int(onset), anomaly_length, rng)
+                stop = int(onset) + (1 if kind == "spike" else anomaly_length)
+                stop = min(stop, samples)
+                events.append(AnomalyEvent(device, spec.name, kind, float(device_times[onset]), float(device_times[stop - 1])))
+                last_end = stop + anomaly_length
+            np.clip(values, spec.low, spec.high, out=values)
+
+            device_cols.append(np.full(samples, device))
+            sensor_cols.append(np.full(samples, spec.name))
+            value_cols.append(values)
+            time_cols.append(device_times)
+            label_cols.append(labels)
+
+    order = np.argsort(np.concatenate(time_cols), kind="stable")
+    return SyntheticBatch(
+        np.concatenate(device_cols)[order],
+        np.concatenate(sensor_cols)[order],
+        np.concatenate(value_cols)[order],
+        np.concatenate(time_cols)[order],
+        np.concatenate(label_cols)[order],
+        events,
+    )
+
+
+def seed_redis_with_synthetic_data(
+    store=None,
+    *,
+    devices: int = 1,
+    duration: float = 600.0,
+    rate_hz: float = 1.0,
+    anomaly_rate: float = 0.002,
+    batch_size: int = 10_000,
+    seed: Optional[int] = None,
+) -> SyntheticBatch:
+    """Generate readings and push them to Redis through ``store.bulk_push_columns``.
+
+    A single device writes the device-less keys the training pipeline reads;
+    several devices are stored under their own device keys (see
+    :mod:`server.devices`).
+    """
+
+    if store is None:
+        from server.redis import SensorLogStore
+
+        store = SensorLogStore()
+    batch = generate_readings(devices, duration, rate_hz, anomaly_rate=anomaly_rate, seed=seed)
+    names = batch.sensors.tolist()
+    device_ids = batch.devices.tolist() if devices > 1 else None
+    for offset in range(0, len(batch), batch_size):
+        window = slice(offset, offset + batch_size)
+        store.bulk_push_columns(
+            names[window],
+            batch.values[window].tolist(),
+            batch.timestamps[window].tolist(),
+            None if device_ids is None else device_ids[window],
+        )
+    return batch
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Seed Redis with synthetic wearable telemetry.")
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=600.0, help="Seconds of history to generate.")
+    parser.add_argument("--rate", type=float, default=1.0, help="Samples per second per channel.")
+    parser.add_argument("--anomaly-rate", type=float, default=0.002,
+                        help="Probability that an anomaly starts at a given sample.")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    batch = seed_redis_with_synthetic_data(
+        devices=args.devices, duration=args.duration, rate_hz=args.rate, anomaly_rate=args.anomaly_rate, seed=args.seed
+    )
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {len(batch):,} readings with {len(batch.events)} anomalies in {elapsed:.2f}s")
+
+
+__all__ = [
+    "ANOMALY_KINDS",
+    "AnomalyEvent",
+    "DEFAULT_SPECS",
+    "SensorSpec",
+    "SyntheticBatch",
+    "generate_readings",
+    "seed_redis_with_synthetic_data",
+]
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
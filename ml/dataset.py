@@ -1,16 +1,42 @@
 from __future__ import annotations
 
-from typing import Iterable, List
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
+import numpy as np
 import torch
 from torch.utils.data import Dataset
 
 from ml.data_augmentor import augment_tensor
+from ml.window_cache import WindowCache
+from server.history_io import load_series
 from server.redis import SensorLogStore
 
 
 class RedisSensorDataset(Dataset):
-    """Create sliding windows of sensor readings fetched from Redis."""
+    """Create sliding windows of sensor readings fetched from Redis.
+
+    By default the last ``limit`` raw readings of each sensor are used, read
+    from the raw time index.  With ``resolution`` (seconds) the dataset
+    instead trains on the last ``limit`` steps of the history resampled to
+    that resolution, read from the matching rollup tier, which keeps weeks of
+    history cheap to load.
+
+    With ``export_dir`` the readings come from a directory written by
+    ``python -m server.history_io export`` instead, memory-mapped and without
+    any Redis connection.
+
+    With ``cache_dir`` the prepared windows are kept in a
+    :class:`~ml.window_cache.WindowCache`.  A later dataset with the same
+    parameters only fetches the readings that arrived since the cache was
+    written (at most ``limit`` per sensor) and appends their windows.  When
+    a sensor has ``limit`` or more new readings, or the cache would hold
+    more than ``2 * limit``, the cache is rebuilt from the latest ``limit``
+    readings instead, so it never trains on stale history.
+    ``update_cache=False`` maps the cached windows as they are without
+    fetching anything.
+    """
 
     def __init__(
         self,
@@ -20,21 +46,61 @@ class RedisSensorDataset(Dataset):
         window_size: int = 32,
         stride: int = 1,
         augment_factor: int = 10,
+        resolution: Optional[float] = None,
+        export_dir: Optional[Union[str, Path]] = None,
+        cache_dir: Optional[Union[str, Path]] = None,
+        update_cache: bool = True,
     ) -> None:
-        store = SensorLogStore()
-        windows: List[torch.Tensor] = []
+        if export_dir is not None and resolution is not None:
+            raise ValueError("resolution is only supported when reading from Redis")
+        sensor_names = list(sensor_names)
+        self._limit = limit
+        self._resolution = resolution
+        self._export_dir = export_dir
+        self._store = SensorLogStore() if export_dir is None else None
 
+        if cache_dir is not None:
+            cache = WindowCache(
+                cache_dir,
+                {
+                    "sensors": sensor_names,
+                    "limit": limit,
+                    "window_size": window_size,
+                    "stride": stride,
+                    "augment_factor": augment_factor,
+                    "resolution": resolution,
+                    "source": str(Path(export_dir).resolve()) if export_dir is not None else "redis",
+                },
+            )
+            if not cache.exists or update_cache:
+                fresh = {name: self._load_series(name, cache.last_timestamp(name)) for name in sensor_names}
+                if cache.exists and self._outdated(cache, fresh):
+                    cache.reset()
+                    fresh = {name: self._load_series(name) for name in sensor_names}
+                cache.append(fresh)
+            if not cache.rows:
+                raise ValueError(f"No sensor data with enough history for the chosen window size in {cache.path}")
+            self.X = cache.windows()
+            self.stats = cache.stats
+            self.window_size = window_size
+            self.input_dim = self.X.shape[1]
+            return
+
+        windows: List[torch.Tensor] = []
+        self.stats: Dict[str, Dict[str, float]] = {}
         for name in sensor_names:
-            readings = store.fetch_recent(name, limit=limit)
-            values = torch.tensor([r.sensor_output for r in readings], dtype=torch.float32)
+            _, series = self._load_series(name)
+            values = torch.from_numpy(series).float()
             if len(values) < window_size:
                 continue
+            self.stats[name] = {"count": len(series), "mean": float(series.mean()), "std": float(series.std())}
             # ``unfold`` creates a view of size [num_windows, window_size]
             sensor_windows = values.unfold(0, window_size, stride).contiguous()
             windows.append(sensor_windows)
 
         if not windows:
-            raise ValueError("No sensor data found in Redis with enough history for the chosen window size")
+            source = "Redis" if export_dir is None else str(export_dir)
+            raise ValueError(f"No sensor data found in {source} with enough history for the chosen window size")
 
         X = torch.cat(windows, dim=0)
 
@@ -47,10 +113,45 @@ class RedisSensorDataset(Dataset):
         self.window_size = window_size
         self.input_dim = self.X.shape[1]
 
+    def _outdated(self, cache: WindowCache, fresh: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> bool:
+        """Whether appending ``fresh`` would leave a gap or let the cache outgrow ``limit``."""
+
+        stats = cache.stats
+        for name, (timestamps, _) in fresh.items():
+            cached = stats.get(name, {}).get("count", 0)
+            if len(timestamps) >= self._limit or cached + len(timestamps) > 2 * self._limit:
+                return True
+        return False
+
+    def _load_series(self, name: str, since: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Chronological ``(timestamps, values)`` of ``name``, optionally only after ``since``.
+
+        At most the latest ``limit`` readings (or steps) are returned either way.
+        """
+
+        if self._export_dir is not None:
+            timestamps, values = load_series(self._export_dir, name, self._limit)
+        elif self._resolution is not None:
+            end = time.time()
+            start = end - self._limit * self._resolution
+            if since is not None:
+                start = max(start, since)
+            timestamps, values = self._store.fetch_range(name, start, end, step=self._resolution, fill="linear")
+            present = ~np.isnan(values)
+            timestamps, values = timestamps[present], values[present]
+        else:
+            # Full builds and cache updates both read the raw time index, so an
+            # update always extends exactly the series the cache was built from.
+            timestamps, values = self._store.fetch_before(name, float("inf"), self._limit)
+
+        if since is not None:
+            fresh = timestamps > since
+            timestamps, values = timestamps[fresh], values[fresh]
+        return timestamps, values
+
     def __len__(self) -> int:
         return len(self.X)
 
     def __getitem__(self, idx: int):
         sample = self.X[idx]
         return sample, sample
-
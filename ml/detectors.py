@@ -0,0 +1,395 @@
+"""Cheap statistical anomaly detectors used as a first stage before the autoencoder.
+
+Every detector produces a normalised score where ``1.0`` is its alarm level,
+so scores from different detectors (and sensors) can be compared directly:
+
+* ``range``: reading outside the plausible limits of the sensor, or pinned
+  exactly at a limit (``Temp`` clamped at 18/35 in the sample data).
+* ``zscore``: distance of the latest reading from the mean of the window.
+* ``mad``: robust z-score based on the median absolute deviation.
+* ``cusum``: two-sided CUSUM of the standardised readings, which catches
+  slow drifts a single z-score misses.
+* ``roc``: rate of change of the latest step relative to the typical step
+  size, which catches accelerometer spikes.
+
+:func:`detect_windows` evaluates all detectors for many sensors at once with
+NumPy (one row per sensor).  :class:`StreamingDetector` keeps EWMA state per
+sensor and updates every detector except ``mad`` in O(1) per sample.
+:class:`Cascade` uses the combined score to settle clear cases and only runs
+the autoencoder on the windows it is unsure about.
+"""
+
+from __future__ import annotations
+
+import warnings
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ml.runtime import DEFAULT_THRESHOLD, reconstruction_errors
+
+DETECTORS = ("range", "zscore", "mad", "cusum", "roc")
+
+SENSOR_LIMITS: Dict[str, Tuple[float, float]] = {
+    "HeartRate": (45.0, 190.0),
+    "Temp": (18.0, 35.0),
+}
+"""Plausible ``(low, high)`` per sensor, from ``data/Simulated_Data.xlsx``."""
+
+# Scale that makes the MAD a consistent estimator of the standard deviation.
+_MAD_SCALE = 0.6745
+
+
+@dataclass
+class DetectorConfig:
+    """Alarm levels of the individual detectors."""
+
+    z_limit: float = 4.0
+    mad_limit: float = 3.5
+    cusum_drift: float = 0.5
+    cusum_limit: float = 8.0
+    roc_limit: float = 6.0
+    limits: Mapping[str, Tuple[float, float]] = field(default_factory=lambda: dict(SENSOR_LIMITS))
+
+
+@dataclass
+class DetectorScores:
+    """Normalised scores of every detector, one entry per sensor."""
+
+    sensors: List[str]
+    scores: Dict[str, np.ndarray]
+
+    @property
+    def combined(self) -> np.ndarray:
+        """Highest detector score per sensor; detectors without a score count as 0."""
+
+        return np.vstack([np.nan_to_num(self.scores[name]) for name in DETECTORS]).max(axis=0)
+
+    @property
+    def reasons(self) -> List[str]:
+        """Name of the detector responsible for each combined score."""
+
+        stacked = np.vstack([np.nan_to_num(self.scores[name], nan=-np.inf) for name in DETECTORS])
+        return [DETECTORS[i] for i in stacked.argmax(axis=0)]
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        return {
+            sensor: {name: float(self.scores[name][i]) for name in DETECTORS}
+            for i, sensor in enumerate(self.sensors)
+        }
+
+
+def pad_windows(windows: Sequence[Sequence[float]]) -> np.ndarray:
+    """Stack ragged windows into a ``[n, max_len]`` array, left-padded with ``NaN``."""
+
+    width = max((len(w) for w in windows), default=0)
+    out = np.full((len(windows), width), np.nan)
+    for row, values in enumerate(windows):
+        if len(values):
+            out[row, width - len(values):] = values
+    return out
+
+
+def _limits(sensors: Sequence[str], config: DetectorConfig) -> Tuple[np.ndarray, np.ndarray]:
+    low = np.array([config.limits.get(s, (-np.inf, np.inf))[0] for s in sensors], dtype=np.float64)
+    high = np.array([config.limits.get(s, (-np.inf, np.inf))[1] for s in sensors], dtype=np.float64)
+    return low, high
+
+
+def _range_score(latest: np.ndarray, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    """0 inside the limits, 1 exactly at a limit (clamped), above 1 outside."""
+
+    width = np.where(np.isfinite(high - low), high - low, 1.0)
+    outside = np.maximum(low - latest, latest - high) / width
+    score = np.where(outside > 0, 1.0 + outside, 0.0)
+    clamped = np.isclose(latest, low) | np.isclose(latest, high)
+    return np.where(clamped, np.maximum(score, 1.0), np.where(np.isnan(latest), np.nan, score))
+
+
+def detect_windows(
+    sensors: Sequence[str],
+    windows: Sequence[Sequence[float]],
+    config: Optional[DetectorConfig] = None,
+) -> DetectorScores:
+    """Score the latest reading of every window against the rest of it.
+
+    Parameters
+    ----------
+    sensors:
+        Sensor name of each window, used for the range limits.
+    windows:
+        Chronological readings, one sequence per sensor.  Lengths may differ.
+    """
+
+    config = config or DetectorConfig()
+    sensors = list(sensors)
+    data = pad_windows(windows)
+    n = len(sensors)
+    if data.shape[1] == 0:
+        empty = np.full(n, np.nan)
+        return DetectorScores(sensors, {name: empty.copy() for name in DETECTORS})
+
+    latest = data[:, -1]
+    history = data[:, :-1]
+    scores: Dict[str, np.ndarray] = {}
+
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        # All-NaN rows (sensors without history) are expected and score NaN.
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        scores["range"] = _range_score(latest, *_limits(sensors, config))
+
+        mean = np.nanmean(history, axis=1) if history.shape[1] else np.full(n, np.nan)
+        std = np.nanstd(history, axis=1) if history.shape[1] else np.full(n, np.nan)
+        std = np.where(std > 0, std, np.nan)
+        scores["zscore"] = np.abs(latest - mean) / std / config.z_limit
+
+        median = np.nanmedian(data, axis=1)
+        mad = np.nanmedian(np.abs(data - median[:, None]), axis=1)
+        mad = np.where(mad > 0, mad, np.nan)
+        scores["mad"] = np.abs(_MAD_SCALE * (latest - median) / mad) / config.mad_limit
+
+        # CUSUM of the whole window standardised with its own statistics.
+        z = (data - np.nanmean(data, axis=1, keepdims=True)) / _positive(np.nanstd(data, axis=1, keepdims=True))
+        high = np.zeros(n)
+        low = np.zeros(n)
+        for column in np.nan_to_num(z).T:
+            high = np.maximum(0.0, high + column - config.cusum_drift)
+            low = np.maximum(0.0, low - column - config.cusum_drift)
+        scores["cusum"] = np.where(np.isnan(std), np.nan, np.maximum(high, low) / config.cusum_limit)
+
+        steps = np.diff(data, axis=1)
+        if steps.shape[1] >= 2:
+            typical = _positive(np.nanstd(steps[:, :-1], axis=1))
+            scores["roc"] = np.abs(steps[:, -1]) / typical / config.roc_limit
+        else:
+            scores["roc"] = np.full(n, np.nan)
+
+    return DetectorScores(sensors, scores)
+
+
+class StreamingDetector:
+    """O(1)-per-sample detectors for a fixed set of sensors.
+
+    Means and variances are exponentially weighted with ``alpha``, so the
+    state is a handful of floats per sensor.  ``mad`` needs the whole window
+    and is always ``NaN`` here; use :func:`detect_windows` when it matters.
+
+    Parameters
+    ----------
+    sensors:
+        Sensor order of the arrays passed to :meth:`update`.
+    alpha:
+        EWMA smoothing factor.
+    warmup:
+        Samples per sensor before the statistical detectors report scores.
+    """
+
+    def __init__(
+        self,
+        sensors: Sequence[str],
+        *,
+        alpha: float = 0.05,
+        warmup: int = 10,
+        config: Optional[DetectorConfig] = None,
+    ) -> None:
+        self.sensors = list(sensors)
+        self.alpha = alpha
+        self.warmup = warmup
+        self.config = config or DetectorConfig()
+        self._low, self._high = _limits(self.sensors, self.config)
+        n = len(self.sensors)
+        self._count = np.zeros(n, dtype=np.int64)
+        self._mean = np.zeros(n)
+        self._var = np.zeros(n)
+        self._step_var = np.zeros(n)
+        self._last = np.full(n, np.nan)
+        self._cusum_high = np.zeros(n)
+        self._cusum_low = np.zeros(n)
+
+    def update(self, values: Sequence[float]) -> DetectorScores:
+        """Fold in one reading per sensor (``NaN`` for none) and score it."""
+
+        x = np.asarray(values, dtype=np.float64)
+        seen = ~np.isnan(x)
+        ready = seen & (self._count >= self.warmup)
+        cfg = self.config
+        scores: Dict[str, np.ndarray] = {"mad": np.full(len(x), np.nan)}
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scores["range"] = _range_score(x, self._low, self._high)
+
+            # Score against the state *before* this sample.
+            std = _positive(np.sqrt(self._var))
+            z = (x - self._mean) / std
+            scores["zscore"] = np.where(ready, np.abs(z) / cfg.z_limit, np.nan)
+
+            z_step = np.where(ready, np.nan_to_num(z), 0.0)
+            self._cusum_high = np.where(seen, np.maximum(0.0, self._cusum_high + z_step - cfg.cusum_drift), self._cusum_high)
+            self._cusum_low = np.where(seen, np.maximum(0.0, self._cusum_low - z_step - cfg.cusum_drift), self._cusum_low)
+            scores["cusum"] = np.where(
+                ready, np.maximum(self._cusum_high, self._cusum_low) / cfg.cusum_limit, np.nan
+            )
+
+            step = x - self._last
+            step_std = _positive(np.sqrt(self._step_var))
+            scores["roc"] = np.where(ready, np.abs(step) / step_std / cfg.roc_limit, np.nan)
+
+            # EWMA updates; the first sample of a sensor initialises its mean.
+            a = np.where(self._count == 0, 1.0, self.alpha)
+            delta = np.where(seen, x - self._mean, 0.0)
+            self._mean = self._mean + a * delta
+            self._var = np.where(seen, (1 - a) * (self._var + a * delta * delta), self._var)
+            has_step = seen & ~np.isnan(self._last)
+            b = np.where(self._count <= 1, 1.0, self.alpha)
+            self._step_var = np.where(
+                has_step, (1 - b) * self._step_var + b * np.nan_to_num(step) ** 2, self._step_var
+            )
+            self._last = np.where(seen, x, self._last)
+            self._count += seen
+
+        return DetectorScores(self.sensors, scores)
+
+    def reset_cusum(self, sensors: Optional[Sequence[str]] = None) -> None:
+        """Clear the CUSUM accumulators, e.g. after an alarm was handled."""
+
+        mask = np.ones(len(self.sensors), dtype=bool) if sensors is None else np.isin(self.sensors, list(sensors))
+        self._cusum_high[mask] = 0.0
+        self._cusum_low[mask] = 0.0
+
+
+@dataclass
+class CascadeResult:
+    """Outcome of :meth:`Cascade.score` for one sensor.
+
+    ``score`` is on the autoencoder's scale: the reconstruction error when
+    the model ran, otherwise the classical score times the threshold, so it
+    can be compared with the same threshold either way.
+    """
+
+    sensor: str
+    anomaly: bool
+    score: float
+    classical: float
+    reason: str
+    stage: str
+    reconstruction_error: Optional[float] = None
+
+
+class Cascade:
+    """Run the cheap detectors first and the autoencoder only when they are unsure.
+
+    Parameters
+    ----------
+    model:
+        Trained autoencoder or :class:`ml.runtime.Scorer`, or ``None`` to
+        decide uncertain cases with the classical score alone.
+    load_model:
+        Called once to obtain the model the first time it is needed, so a
+        cascade that is never used never loads it.
+    threshold:
+        Reconstruction error above which the model flags an anomaly.
+        ``None`` uses the threshold calibrated into the model at training
+        time, or :data:`ml.runtime.DEFAULT_THRESHOLD` without a model.
+    lower, upper:
+        Combined classical scores below ``lower`` are normal and scores at or
+        above ``upper`` are anomalies without consulting the model.
+    """
+
+    def __init__(
+        self,
+        model=None,
+        *,
+        load_model: Optional[Callable[[], Any]] = None,
+        threshold: Optional[float] = None,
+        lower: float = 0.5,
+        upper: float = 1.0,
+        config: Optional[DetectorConfig] = None,
+    ) -> None:
+        self._model = model
+        self._load_model = load_model
+        self._threshold = threshold
+        self.lower = lower
+        self.upper = upper
+        self.config = config or DetectorConfig()
+
+    @property
+    def model(self):
+        if self._model is None and self._load_model is not None:
+            # Only try once: the loader may legitimately return None.
+            load, self._load_model = self._load_model, None
+            self._model = load()
+        return self._model
+
+    @property
+    def threshold(self) -> float:
+        if self._threshold is not None:
+            return self._threshold
+        return float(getattr(self.model, "threshold", DEFAULT_THRESHOLD))
+
+    def score(self, windows: Mapping[str, Sequence[float]]) -> Dict[str, CascadeResult]:
+        sensors = list(windows)
+        return dict(zip(sensors, self.score_many(sensors, [windows[s] for s in sensors])))
+
+    def score_fleet(
+        self, windows: Mapping[str, Mapping[str, Sequence[float]]]
+    ) -> Dict[str, Dict[str, CascadeResult]]:
+        """Score ``{device: {sensor: window}}`` for a whole fleet in one batch.
+
+        All devices share one detector pass and at most one autoencoder
+        forward pass.
+        """
+
+        labels = [(device, sensor) for device, sensors in windows.items() for sensor in sensors]
+        results = self.score_many([sensor for _, sensor in labels], [windows[d][s] for d, s in labels])
+        fleet: Dict[str, Dict[str, CascadeResult]] = {device: {} for device in windows}
+        for (device, sensor), result in zip(labels, results):
+            fleet[device][sensor] = result
+        return fleet
+
+    def score_many(self, sensors: Sequence[str], windows: Sequence[Sequence[float]]) -> List[CascadeResult]:
+        """Score parallel lists; ``sensors`` may repeat (one entry per device)."""
+
+        detected = detect_windows(sensors, windows, self.config)
+        combined = detected.combined
+        reasons = detected.reasons
+
+        uncertain = [i for i, value in enumerate(combined) if self.lower <= value < self.upper]
+        errors: Dict[int, float] = {}
+        if uncertain and self.model is not None:
+            batch = [windows[i] for i in uncertain]
+            errors = dict(zip(uncertain, reconstruction_errors(self.model, batch)))
+
+        threshold = self.threshold
+        results: List[CascadeResult] = []
+        for i, sensor in enumerate(sensors):
+            classical = float(combined[i])
+            if i in errors:
+                error = errors[i]
+                results.append(
+                    CascadeResult(sensor, error > threshold, error, classical, "autoencoder", "neural", error)
+                )
+            else:
+                results.append(
+                    CascadeResult(
+                        sensor, classical >= self.upper, classical * threshold, classical, reasons[i], "classical"
+                    )
+                )
+        return results
+
+
+def _positive(values: np.ndarray) -> np.ndarray:
+    return np.where(values > 0, values, np.nan)
+
+
+__all__ = [
+    "Cascade",
+    "CascadeResult",
+    "DETECTORS",
+    "DetectorConfig",
+    "DetectorScores",
+    "SENSOR_LIMITS",
+    "StreamingDetector",
+    "detect_windows",
+    "pad_windows",
+]
@@ -0,0 +1,157 @@
+"""Loading the trained autoencoder and scoring windows of readings.
+
+These helpers are shared by the agent tools in ``tool/sensors.py`` and
+the asynchronous monitor in ``server/utils.py``.  Nothing here depends on
+LangChain, so scoring processes can import it without the agent stack.
+
+For small CPU boxes such as the Pi gateway, :func:`load_autoencoder` can
+apply dynamic int8 quantization to the linear layers and
+:func:`configure_threads` pins torch's thread pools; see
+``benchmarks/quantization.py`` for the speed/accuracy trade-off.
+"""
+
+from __future__ import annotations
+
+import os
+import platform
+import warnings
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import torch
+from torch import nn
+
+from ml.model import AutoEncoder
+from ml.runtime import DEFAULT_THRESHOLD, MODEL_PATH
+from server.metrics import timed
+
+
+def configure_threads(num_threads: Optional[int] = None, interop_threads: Optional[int] = None) -> int:
+    """Pin torch's intra-op (and optionally inter-op) thread pools.
+
+    ``num_threads`` defaults to ``$TORCH_NUM_THREADS`` or the CPU count.  The
+    inter-op pool can only be sized before torch runs any parallel work, so
+    a late call leaves it unchanged.  Returns the intra-op thread count.
+    """
+
+    if num_threads is None:
+        num_threads = int(os.getenv("TORCH_NUM_THREADS", os.cpu_count() or 1))
+    torch.set_num_threads(num_threads)
+    if interop_threads is not None:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            pass
+    return torch.get_num_threads()
+
+
+def quantize_dynamic(model: AutoEncoder) -> AutoEncoder:
+    """Return a copy of ``model`` whose ``nn.Linear`` layers run in dynamic int8.
+
+    Weights are stored as int8 and activations are quantized on the fly, so
+    no calibration data is needed.  ARM boards use the ``qnnpack`` kernels.
+    """
+
+    engines = torch.backends.quantized.supported_engines
+    if platform.machine().lower() in ("aarch64", "arm64", "armv7l") and "qnnpack" in engines:
+        torch.backends.quantized.engine = "qnnpack"
+    with warnings.catch_warnings():
+        # torch.ao.quantization is deprecated in favour of torchao, which is
+        # not available on the gateway.
+        warnings.simplefilter("ignore")
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+@timed("model.load")
+def load_autoencoder(
+    path: Union[str, Path] = MODEL_PATH, *, quantize: bool = False
+) -> Tuple[AutoEncoder, int]:
+    """Restore the autoencoder saved by ``ml/train.py`` in evaluation mode.
+
+    The calibration stored with the weights is attached as ``offset``,
+    ``scale``, ``threshold`` and ``calibrated`` attributes, mirroring
+    :class:`ml.runtime.Scorer`; older checkpoints get the identity
+    normalisation, :data:`DEFAULT_THRESHOLD` and ``calibrated=False``.
+    With ``quantize`` the linear layers are converted with
+    :func:`quantize_dynamic`.
+    """
+
+    checkpoint = torch.load(path, map_location="cpu")
+
+    calibration = {}
+    if isinstance(checkpoint, dict) and "state_dict" in checkpoint:
+        state_dict = checkpoint["state_dict"]
+        input_dim = int(checkpoint.get("input_dim") or next(iter(state_dict.values())).shape[1])
+        calibration = checkpoint
+    else:  # Backwards compatibility with older checkpoints that only stored weights.
+        state_dict = checkpoint
+        first_layer_weight = next(iter(state_dict.values()))
+        input_dim = int(first_layer_weight.shape[1])
+
+    # Rebuild the layer widths the checkpoint was trained with.
+    hidden_dims = [int(v.shape[0]) for k, v in state_dict.items() if k.startswith("encoder.") and k.endswith(".weight")]
+    model = AutoEncoder(input_dim=input_dim, hidden_dims=hidden_dims or None)
+    model.load_state_dict(state_dict)
+    model.eval()
+    model.offset = float(calibration.get("offset", 0.0))
+    model.scale = float(calibration.get("scale", 1.0))
+    model.threshold = float(calibration.get("threshold", DEFAULT_THRESHOLD))
+    model.calibrated = "threshold" in calibration
+    if quantize:
+        model = quantize_dynamic(model)
+    return model, input_dim
+
+
+def prepare_window(values: torch.Tensor, window_size: int) -> torch.Tensor:
+    """Return the last ``window_size`` values as a ``[1, window_size]`` batch.
+
+    Short histories are left-padded with their latest value, and an empty
+    history becomes a window of zeros.
+    """
+
+    if len(values) >= window_size:
+        window = values[-window_size:]
+    elif len(values) > 0:
+        pad_value = values[-1]
+        padding = pad_value.repeat(window_size - len(values))
+        window = torch.cat([padding, values])
+    else:
+        window = torch.zeros(window_size)
+    return window.unsqueeze(0)
+
+
+@timed("model.forward")
+def score_batch(model: nn.Module, batch: torch.Tensor) -> torch.Tensor:
+    """Per-row reconstruction error of a ``[n, window_size]`` batch.
+
+    The batch is normalised with the model's ``offset`` and ``scale`` (see
+    :func:`load_autoencoder`) first, exactly as it was during training.
+    """
+
+    with torch.inference_mode():
+        x = (batch - getattr(model, "offset", 0.0)) / getattr(model, "scale", 1.0)
+        reconstruction = model(x)
+        return ((reconstruction - x) ** 2).mean(dim=1)
+
+
+def score_windows(model: AutoEncoder, windows: Sequence[Sequence[float]], window_size: int) -> List[float]:
+    """Reconstruction error of every window, computed in one forward pass."""
+
+    if not windows:
+        return []
+    batch = torch.cat(
+        [prepare_window(torch.as_tensor(values, dtype=torch.float32), window_size) for values in windows]
+    )
+    return score_batch(model, batch).tolist()
+
+
+__all__ = [
+    "DEFAULT_THRESHOLD",
+    "MODEL_PATH",
+    "configure_threads",
+    "load_autoencoder",
+    "prepare_window",
+    "quantize_dynamic",
+    "score_batch",
+    "score_windows",
+]
@@ -0,0 +1,152 @@
+"""Background batching for anomaly memory writes.
+
+Embedding and index insertion are too slow to run inline in the monitoring
+loop.  :class:`BatchedMemoryWriter` queues entries, coalesces them and hands
+each batch to ``memory.add_entries`` on a worker thread so the event loop only
+pays for a ``put_nowait``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, List, Optional, Sequence, Tuple
+
+from ml.rag_memory import Entry, Timestamp
+
+
+class BatchedMemoryWriter:
+    """Coalesce memory entries and flush them off the event loop.
+
+    Parameters
+    ----------
+    memory:
+        Any object exposing ``add_entries(entries)`` and ``query(...)``, such
+        as :class:`ml.rag_memory.LocalVectorMemory`.
+    max_batch:
+        Flush as soon as this many entries are waiting.
+    flush_interval:
+        Flush at least this often (seconds).  This is also the flush horizon:
+        :meth:`query` always sees every entry submitted more than
+        ``flush_interval`` seconds earlier.
+    """
+
+    def __init__(self, memory: Any, *, max_batch: int = 256, flush_interval: float = 1.0) -> None:
+        if max_batch <= 0:
+            raise ValueError("max_batch must be a positive integer")
+        self.memory = memory
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+
+        self._pending: List[Tuple[float, Entry]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> "BatchedMemoryWriter":
+        """Start the background flush task on the running event loop."""
+
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    async def close(self) -> None:
+        """Stop the background task and write out everything still queued.
+
+        The task is asked to stop and awaited rather than cancelled, so a
+        flush it is in the middle of runs to completion.
+        """
+
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def __aenter__(self) -> "BatchedMemoryWriter":
+        return self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def submit(self, sensor: str, score: float, values: Sequence[float], timestamp: Timestamp) -> None:
+        """Queue an entry without blocking.  Mirrors ``memory.add_entry``."""
+
+        self._pending.append((time.monotonic(), (sensor, score, list(values), timestamp)))
+        if len(self._pending) >= self.max_batch and self._wakeup is not None:
+            self._wakeup.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def flush(self, *, older_than: Optional[float] = None) -> int:
+        """Write queued entries to the memory in a worker thread.
+
+        When ``older_than`` is given only entries submitted before that
+        ``time.monotonic()`` value are written.  Returns the number of entries
+        written.  If a write fails or the flush is cancelled, the entries not
+        yet written go back to the front of the queue for the next flush.
+        """
+
+        lock = self._flush_lock or asyncio.Lock()
+        async with lock:
+            if older_than is None:
+                batch, self._pending = self._pending, []
+            else:
+                split = 0
+                while split < len(self._pending) and self._pending[split][0] <= older_than:
+                    split += 1
+                batch, self._pending = self._pending[:split], self._pending[split:]
+            if not batch:
+                return 0
+
+            written = 0
+            try:
+                for written in range(0, len(batch), self.max_batch):
+                    chunk = [entry for _, entry in batch[written:written + self.max_batch]]
+                    await asyncio.to_thread(self.memory.add_entries, chunk)
+                written = len(batch)
+            finally:
+                if written < len(batch):
+                    self._pending[:0] = batch[written:]
+            return written
+
+    async def query(self, *args: Any, **kwargs: Any) -> Any:
+        """Run ``memory.query`` in a worker thread.
+
+        Entries older than the flush horizon that are still queued are written
+        first, so results never miss them.
+        """
+
+        await self.flush(older_than=time.monotonic() - self.flush_interval)
+        return await asyncio.to_thread(self.memory.query, *args, **kwargs)
+
+    # ------------------------------------------------------------------
+    # Background task
+    # ------------------------------------------------------------------
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as exc:  # pragma: no cover - keep the writer alive
+                print(f"⚠️ Failed to write anomaly memories: {exc}")
+
+
+__all__ = ["BatchedMemoryWriter"]
@@ -13,10 +13,11 @@ def _build_mlp(dims: Sequence[int]) -> nn.Sequential:
     """Create a simple feed-forward network following ``dims`` dimensions."""
 
     layers = []
-    for in_features, out_features in zip(dims[:-1], dims[1:]):
+    last = len(dims) - 2
+    for index, (in_features, out_features) in enumerate(zip(dims[:-1], dims[1:])):
         layers.append(nn.Linear(in_features, out_features))
         # Skip the activation on the final layer – the caller decides.
-        if out_features != dims[-1]:
+        if index != last:
             layers.append(nn.ReLU())
     return nn.Sequential(*layers)
 
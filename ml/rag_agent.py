@@ -1,15 +1,24 @@
+"""LLM agent that answers questions about the sensors by calling tools.
+
+Nothing remote is touched at import time: the chat client and the LangChain
+tools are only imported and built by :func:`build_agent`, and the shared
+``AGENT`` is created on first access (see :func:`get_agent`).
+"""
+
 from __future__ import annotations
 
 import time
 import argparse
 import json
 import re
+import threading
 from dataclasses import dataclass
-from typing import Any, Dict, Iterable, Mapping, Optional, Sequence
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Mapping, Optional, Sequence
 
-from langchain_nvidia_ai_endpoints import ChatNVIDIA
+from server.metrics import span
 
-from tool.sensor_tool import detect_anomalies, sensor_data_retriever
+if TYPE_CHECKING:  # pragma: no cover - imported lazily in build_agent
+    from langchain_nvidia_ai_endpoints import ChatNVIDIA
 
 DEFAULT_MODEL = "nvidia/nvidia-nemotron-nano-9b-v2"
 
@@ -23,6 +32,7 @@ When asked for a summary or to analyze something, always specify which sensor to
 Example:
 Call `sensor_data_retriever(sensor_name="HeartRate")`.
 Your options for sensor names are HeartRate, AccelY, Temp, AccelX, and AccelZ you must choose one whenever you analyze something.
+When a question names a device, pass it as the `device` argument of either tool.
 """
 
 
@@ -107,7 +117,8 @@ class SimpleReactiveAgent:
 
         for _ in range(self.max_iterations):
             prompt = self._build_prompt(question, events)
-            response = _coerce_content(self.llm.invoke(prompt))
+            with span("llm.call", prompt_chars=len(prompt)):
+                response = _coerce_content(self.llm.invoke(prompt))
             payload = _extract_json_object(response)
 
             if not payload:
@@ -194,7 +205,11 @@ class SimpleReactiveAgent:
         return "\n".join(lines)
 
     def _invoke_tool(self, name: str, args: Any) -> Any:
-        tool = self.tools[name]
+        with span(f"tool.{name}"):
+            return self._call_tool(self.tools[name], args)
+
+    @staticmethod
+    def _call_tool(tool: Any, args: Any) -> Any:
         func = getattr(tool, "func", tool)
 
         if isinstance(args, Mapping):
@@ -211,6 +226,10 @@ class SimpleReactiveAgent:
 
 
 def build_agent(*, max_iterations: int = 3, model: Optional[str] = None) -> SimpleReactiveAgent:
+    from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+    from tool.sensor_tool import detect_anomalies, sensor_data_retriever
+
     llm = ChatNVIDIA(model=model or DEFAULT_MODEL, temperature=0.6)
     tool_map = {tool.name: tool for tool in (sensor_data_retriever, detect_anomalies)}
     return SimpleReactiveAgent(
@@ -221,7 +240,26 @@ def build_agent(*, max_iterations: int = 3, model: Optional[str] = None) -> Simp
     )
 
 
-AGENT = build_agent()
+_agent: Optional[SimpleReactiveAgent] = None
+_agent_lock = threading.Lock()
+
+
+def get_agent() -> SimpleReactiveAgent:
+    """Return the shared agent, building it on first use."""
+
+    global _agent
+    with _agent_lock:
+        if _agent is None:
+            _agent = build_agent()
+        return _agent
+
+
+def __getattr__(name: str) -> Any:
+    # ``AGENT`` used to be built at import time; keep the name working
+    # without constructing the LLM client until someone asks for it.
+    if name == "AGENT":
+        return get_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def main() -> None:
@@ -1,19 +1,558 @@
-from langchain_community.vectorstores import FAISS
-from langchain_nvidia_ai_endpoints import NVIDIAEmbeddings
-from langchain.docstore.document import Document
+"""Anomaly memories the monitoring loop can recall when explaining a score.
+
+Two backends are available:
+
+* :class:`VectorMemory` embeds a short text description of every entry with
+  the hosted NVIDIA embedding model and keeps it in a LangChain FAISS store.
+* :class:`LocalVectorMemory` embeds the numeric features of an entry (sensor
+  one-hot, window statistics and score) locally and keeps the vectors in a
+  preallocated NumPy array that can be backed by a memory-mapped file.  It
+  never touches the network, so it is cheap enough to call on every
+  monitoring step.  Rows are partitioned by sensor and time bucket so that
+  filtered queries only scan the partitions they need.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+SENSORS: Tuple[str, ...] = ("HeartRate", "Temp", "AccelX", "AccelY", "AccelZ")
+"""Known sensor names; anything else shares a trailing "other" slot."""
+
+_STAT_NAMES = ("mean", "std", "min", "max", "last", "slope")
+
+EMBED_DIM = len(SENSORS) + 1 + len(_STAT_NAMES) + 1
+"""Width of the vectors produced by :func:`embed_features`."""
+
+_FORMAT_VERSION = 2
+
+_META_DTYPE = np.dtype(
+    [
+        ("sensor", "<i2"),
+        ("timestamp", "<f8"),
+        ("score", "<f4"),
+        ("mean", "<f4"),
+        # Number of original entries a row stands for once compacted.
+        ("count", "<u4"),
+    ]
+)
+
+Timestamp = Union[datetime, float, int, str]
+Entry = Tuple[str, float, Sequence[float], Timestamp]
+"""``(sensor, score, values, timestamp)`` – the arguments of ``add_entry``."""
+
 
 class VectorMemory:
+    """Text memory backed by the hosted NVIDIA embedding endpoint."""
+
     def __init__(self):
+        from langchain_nvidia_ai_endpoints import NVIDIAEmbeddings
+
         self.embeddings = NVIDIAEmbeddings(model="nvidia/nv-embed-v1", api_key=os.getenv("NVIDIA_API_KEY"))
-        self.store = FAISS.from_texts([], self.embeddings)
+        # ``FAISS.from_texts`` cannot build an index from an empty list, so the
+        # store is created together with the first document.
+        self.store = None
 
     def add_entry(self, sensor, score, values, timestamp):
+        from langchain.docstore.document import Document
+
         doc = Document(
             page_content=f"{sensor} at {timestamp}: avg={sum(values)/len(values):.2f}, anomaly={score:.4f}",
             metadata={"sensor": sensor, "timestamp": str(timestamp), "score": score}
         )
-        self.store.add_documents([doc])
+        if self.store is None:
+            from langchain_community.vectorstores import FAISS
+
+            self.store = FAISS.from_documents([doc], self.embeddings)
+        else:
+            self.store.add_documents([doc])
+
+    def add_entries(self, entries: Iterable[Entry]) -> None:
+        for entry in entries:
+            self.add_entry(*entry)
 
     def query(self, query_text):
+        if self.store is None:
+            return []
         return self.store.similarity_search(query_text, k=3)
 
+
+@dataclass
+class MemoryEntry:
+    """One recalled memory together with its similarity to the query."""
+
+    sensor: str
+    score: float
+    mean: float
+    timestamp: datetime
+    similarity: float
+    count: int = 1
+
+    @property
+    def page_content(self) -> str:
+        """Text rendering compatible with the LangChain documents of :class:`VectorMemory`."""
+
+        return (
+            f"{self.sensor} at {self.timestamp.isoformat()}: "
+            f"avg={self.mean:.2f}, anomaly={self.score:.4f}"
+        )
+
+
+def _sensor_index(sensor: str) -> int:
+    try:
+        return SENSORS.index(sensor)
+    except ValueError:
+        return len(SENSORS)
+
+
+def _to_epoch(timestamp: Timestamp) -> float:
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.timestamp()
+    if isinstance(timestamp, str):
+        return _to_epoch(datetime.fromisoformat(timestamp))
+    return float(timestamp)
+
+
+def _signed_log(x: np.ndarray) -> np.ndarray:
+    # Sensors live on very different scales (HeartRate ~75, AccelZ ~250), so
+    # compress magnitudes before they are compared.
+    return np.sign(x) * np.log1p(np.abs(x))
+
+
+def window_statistics(values: Sequence[float]) -> np.ndarray:
+    """Return ``mean, std, min, max, last, slope`` of one window of readings."""
+
+    x = np.asarray(values, dtype=np.float64)
+    if x.size == 0:
+        return np.zeros(len(_STAT_NAMES))
+    slope = (x[-1] - x[0]) / (x.size - 1) if x.size > 1 else 0.0
+    return np.array([x.mean(), x.std(), x.min(), x.max(), x[-1], slope])
+
+
+def embed_features(sensor: str, score: float, values: Sequence[float]) -> np.ndarray:
+    """Deterministically embed one entry into a unit vector of size :data:`EMBED_DIM`."""
+
+    return _embed_batch([sensor], np.array([score]), [window_statistics(values)])[0]
+
+
+def _embed_batch(
+    sensors: Sequence[str], scores: np.ndarray, stats: Sequence[np.ndarray]
+) -> np.ndarray:
+    n = len(sensors)
+    vectors = np.zeros((n, EMBED_DIM), dtype=np.float32)
+    vectors[np.arange(n), [_sensor_index(s) for s in sensors]] = 1.0
+
+    offset = len(SENSORS) + 1
+    if n:
+        vectors[:, offset:offset + len(_STAT_NAMES)] = _signed_log(np.stack(stats))
+    vectors[:, -1] = _signed_log(np.asarray(scores, dtype=np.float64))
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class _Partition:
+    """Row ids of one ``(sensor, time bucket)`` partition, appended in chunks."""
+
+    __slots__ = ("_chunks", "_rows")
+
+    def __init__(self) -> None:
+        self._chunks: List[np.ndarray] = []
+        self._rows: Optional[np.ndarray] = None
+
+    def append(self, rows: np.ndarray) -> None:
+        self._chunks.append(rows)
+        self._rows = None
+
+    @property
+    def rows(self) -> np.ndarray:
+        if self._rows is None:
+            self._rows = np.concatenate(self._chunks) if self._chunks else np.empty(0, dtype=np.int64)
+            self._chunks = [self._rows]
+        return self._rows
+
+
+class LocalVectorMemory:
+    """Offline anomaly memory with exact top-k search over a NumPy array.
+
+    Rows are indexed by sensor and by ``bucket_seconds`` wide time buckets.
+    Queries first narrow the candidate rows with these partitions and the
+    metadata filters, then only score the survivors, so the cost of a
+    filtered query depends on the matching history rather than on the total
+    size of the memory.
+
+    Parameters
+    ----------
+    path:
+        Optional directory used to persist the memory.  Vectors and metadata
+        are stored as raw memory-mapped arrays, so reopening a memory of any
+        size is instant.  Without a path everything stays in RAM.
+    capacity:
+        Number of rows to preallocate.  The arrays double in size whenever
+        they fill up.
+    bucket_seconds:
+        Width of the time partitions.  Fixed once the memory is created.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        *,
+        capacity: int = 4096,
+        bucket_seconds: float = 3600.0,
+    ) -> None:
+        self._path = Path(path) if path is not None else None
+        self._lock = threading.RLock()
+        self._count = 0
+        self._capacity = 0
+        self._bucket_seconds = float(bucket_seconds)
+
+        if self._path is not None and (self._path / "meta.json").exists():
+            header = json.loads((self._path / "meta.json").read_text())
+            if header.get("version") != _FORMAT_VERSION or header.get("dim") != EMBED_DIM:
+                raise ValueError(f"Incompatible memory file format in {self._path}")
+            self._count = int(header["count"])
+            self._bucket_seconds = float(header["bucket_seconds"])
+            self._allocate(max(int(header["capacity"]), capacity))
+        else:
+            self._allocate(max(capacity, 1))
+
+        self._rebuild_partitions()
+
+    # ------------------------------------------------------------------
+    # Storage helpers
+    # ------------------------------------------------------------------
+    def _allocate(self, capacity: int) -> None:
+        if self._path is None:
+            vectors = np.zeros((capacity, EMBED_DIM), dtype=np.float32)
+            meta = np.zeros(capacity, dtype=_META_DTYPE)
+            if self._capacity:
+                vectors[: self._count] = self._vectors[: self._count]
+                meta[: self._count] = self._meta[: self._count]
+            self._vectors, self._meta = vectors, meta
+        else:
+            self._path.mkdir(parents=True, exist_ok=True)
+            self._vectors = self._open_memmap("vectors.f32", (capacity, EMBED_DIM), np.float32)
+            self._meta = self._open_memmap("meta.bin", (capacity,), _META_DTYPE)
+        self._capacity = capacity
+        self._write_header()
+
+    def _open_memmap(self, name: str, shape: Tuple[int, ...], dtype) -> np.memmap:
+        file_path = self._path / name
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        # Growing the file keeps existing rows in place; the new tail reads as zeros.
+        with open(file_path, "ab") as handle:
+            if handle.tell() < size:
+                handle.truncate(size)
+        return np.memmap(file_path, dtype=dtype, mode="r+", shape=shape)
+
+    def _write_header(self) -> None:
+        if self._path is None:
+            return
+        header = {
+            "version": _FORMAT_VERSION,
+            "dim": EMBED_DIM,
+            "count": self._count,
+            "capacity": self._capacity,
+            "bucket_seconds": self._bucket_seconds,
+        }
+        tmp = self._path / "meta.json.tmp"
+        tmp.write_text(json.dumps(header))
+        tmp.replace(self._path / "meta.json")
+
+    def _bucket(self, timestamps: np.ndarray) -> np.ndarray:
+        return np.floor(np.asarray(timestamps) / self._bucket_seconds).astype(np.int64)
+
+    def _rebuild_partitions(self) -> None:
+        self._partitions: Dict[int, Dict[int, _Partition]] = {}
+        self._bucket_keys: Dict[int, List[int]] = {}
+        self._index_rows(np.arange(self._count, dtype=np.int64))
+
+    def _group(self, meta: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sort ``meta`` rows by partition; return the order and group boundaries."""
+
+        sensors = meta["sensor"].astype(np.int64)
+        buckets = self._bucket(meta["timestamp"])
+        # ``lexsort`` is stable, so rows keep their insertion order per partition.
+        order = np.lexsort((buckets, sensors))
+        sensors, buckets = sensors[order], buckets[order]
+        boundaries = np.flatnonzero((np.diff(sensors) != 0) | (np.diff(buckets) != 0)) + 1
+        starts = np.r_[0, boundaries]
+        ends = np.r_[boundaries, order.size]
+        return order, starts, ends
+
+    def _index_rows(self, rows: np.ndarray) -> None:
+        if rows.size == 0:
+            return
+        meta = self._meta[rows]
+        order, starts, ends = self._group(meta)
+        rows, meta = rows[order], meta[order]
+        buckets = self._bucket(meta["timestamp"])
+
+        for start, end in zip(starts, ends):
+            sensor, bucket = int(meta["sensor"][start]), int(buckets[start])
+            by_bucket = self._partitions.setdefault(sensor, {})
+            if bucket not in by_bucket:
+                by_bucket[bucket] = _Partition()
+                keys = self._bucket_keys.setdefault(sensor, [])
+                keys.insert(bisect_left(keys, bucket), bucket)
+            by_bucket[bucket].append(rows[start:end])
+
+    def _candidates(
+        self,
+        sensors: Optional[Iterable[str]],
+        start: Optional[float],
+        end: Optional[float],
+        min_score: Optional[float],
+    ) -> np.ndarray:
+        if sensors is None:
+            sensor_ids = list(self._partitions)
+        else:
+            sensor_ids = sorted({_sensor_index(s) for s in sensors})
+
+        lo = int(self._bucket(start)) if start is not None else None
+        hi = int(self._bucket(end)) if end is not None else None
+        chunks = []
+        for sensor in sensor_ids:
+            buckets = self._bucket_keys.get(sensor, [])
+            first = bisect_left(buckets, lo) if lo is not None else 0
+            last = bisect_right(buckets, hi) if hi is not None else len(buckets)
+            chunks.extend(self._partitions[sensor][b].rows for b in buckets[first:last])
+        if not chunks:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.concatenate(chunks)
+        if start is None and end is None and min_score is None:
+            return rows
+        meta = self._meta[rows]
+        mask = np.ones(rows.size, dtype=bool)
+        if start is not None:
+            mask &= meta["timestamp"] >= start
+        if end is not None:
+            mask &= meta["timestamp"] <= end
+        if min_score is not None:
+            mask &= meta["score"] >= min_score
+        return rows[mask]
+
+    def __len__(self) -> int:
+        return self._count
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def add_entry(self, sensor: str, score: float, values: Sequence[float], timestamp: Timestamp) -> None:
+        """Store a single entry.  Prefer :meth:`add_entries` for bulk inserts."""
+
+        self.add_entries([(sensor, score, values, timestamp)])
+
+    def add_entries(self, entries: Iterable[Entry]) -> int:
+        """Embed and append ``entries`` in one vectorised step.
+
+        Returns the number of stored rows.
+        """
+
+        entries = list(entries)
+        if not entries:
+            return 0
+
+        sensors = [entry[0] for entry in entries]
+        scores = np.array([float(entry[1]) for entry in entries])
+        stats = [window_statistics(entry[2]) for entry in entries]
+        vectors = _embed_batch(sensors, scores, stats)
+
+        with self._lock:
+            needed = self._count + len(entries)
+            if needed > self._capacity:
+                capacity = self._capacity
+                while capacity < needed:
+                    capacity *= 2
+                self._allocate(capacity)
+
+            rows = slice(self._count, needed)
+            self._vectors[rows] = vectors
+            meta = self._meta[rows]
+            meta["sensor"] = [_sensor_index(s) for s in sensors]
+            meta["timestamp"] = [_to_epoch(entry[3]) for entry in entries]
+            meta["score"] = scores
+            meta["mean"] = [s[0] for s in stats]
+            meta["count"] = 1
+            self._index_rows(np.arange(self._count, needed, dtype=np.int64))
+            self._count = needed
+            self._write_header()
+        return len(entries)
+
+    def query_vector(
+        self,
+        vector: np.ndarray,
+        k: int = 3,
+        *,
+        sensors: Optional[Iterable[str]] = None,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+        min_score: Optional[float] = None,
+    ) -> List[MemoryEntry]:
+        """Return the ``k`` entries whose embeddings are closest to ``vector``.
+
+        Parameters
+        ----------
+        sensors:
+            Restrict the search to these sensors.  ``None`` searches all.
+        start, end:
+            Inclusive time range of the candidate entries.
+        min_score:
+            Skip entries with a lower anomaly score.
+        """
+
+        with self._lock:
+            if self._count == 0 or k <= 0:
+                return []
+            rows = self._candidates(
+                sensors,
+                _to_epoch(start) if start is not None else None,
+                _to_epoch(end) if end is not None else None,
+                min_score,
+            )
+            if rows.size == 0:
+                return []
+            similarities = self._vectors[rows] @ np.asarray(vector, dtype=np.float32)
+            k = min(k, rows.size)
+            top = np.argpartition(-similarities, k - 1)[:k]
+            top = top[np.argsort(-similarities[top])]
+            return [self._entry(int(rows[i]), float(similarities[i])) for i in top]
+
+    def query(
+        self,
+        sensor: str,
+        values: Sequence[float],
+        score: float = 0.0,
+        *,
+        k: int = 3,
+        any_sensor: bool = False,
+        start: Optional[Timestamp] = None,
+        end: Optional[Timestamp] = None,
+        min_score: Optional[float] = None,
+    ) -> List[MemoryEntry]:
+        """Find past entries that look like the given window of ``sensor`` readings.
+
+        Only the history of ``sensor`` is searched unless ``any_sensor`` is set.
+        """
+
+        return self.query_vector(
+            embed_features(sensor, score, values),
+            k=k,
+            sensors=None if any_sensor else [sensor],
+            start=start,
+            end=end,
+            min_score=min_score,
+        )
+
+    def compact(
+        self,
+        older_than: Timestamp,
+        *,
+        max_score: float,
+        drop_before: Optional[Timestamp] = None,
+    ) -> int:
+        """Apply the retention policy and return the number of rows removed.
+
+        Entries older than ``drop_before`` are discarded.  Remaining entries
+        older than ``older_than`` with a score below ``max_score`` are merged
+        into one row per ``(sensor, time bucket)``: the count-weighted mean of
+        their vectors, scores, means and timestamps.  Anomalous entries are
+        always kept verbatim.
+        """
+
+        with self._lock:
+            if self._count == 0:
+                return 0
+            meta = np.array(self._meta[: self._count])
+            keep = np.ones(self._count, dtype=bool)
+            if drop_before is not None:
+                keep &= meta["timestamp"] >= _to_epoch(drop_before)
+            merge = keep & (meta["timestamp"] < _to_epoch(older_than)) & (meta["score"] < max_score)
+            keep &= ~merge
+
+            merged_vectors, merged_meta = self._merge_groups(np.flatnonzero(merge), meta)
+            kept = np.flatnonzero(keep)
+            total = kept.size + len(merged_meta)
+            removed = self._count - total
+            if removed == 0:
+                return 0
+
+            # ``kept`` is increasing, so rows only ever move towards the front
+            # and the in-place copy never overwrites a row it still needs.
+            self._vectors[: kept.size] = self._vectors[kept]
+            self._meta[: kept.size] = meta[kept]
+            self._vectors[kept.size:total] = merged_vectors
+            self._meta[kept.size:total] = merged_meta
+            self._count = total
+            self._rebuild_partitions()
+            self.flush()
+            return removed
+
+    def _merge_groups(self, rows: np.ndarray, meta: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if rows.size == 0:
+            return np.empty((0, EMBED_DIM), dtype=np.float32), np.empty(0, dtype=_META_DTYPE)
+
+        order, starts, _ = self._group(meta[rows])
+        rows = rows[order]
+        group_meta = meta[rows]
+        weights = group_meta["count"].astype(np.float64)
+        totals = np.add.reduceat(weights, starts)
+
+        def weighted_mean(column: np.ndarray) -> np.ndarray:
+            return np.add.reduceat(column * weights, starts) / totals
+
+        vectors = np.add.reduceat(self._vectors[rows] * weights[:, None], starts, axis=0)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        merged = np.zeros(starts.size, dtype=_META_DTYPE)
+        merged["sensor"] = group_meta["sensor"][starts]
+        merged["timestamp"] = weighted_mean(group_meta["timestamp"])
+        merged["score"] = weighted_mean(group_meta["score"].astype(np.float64))
+        merged["mean"] = weighted_mean(group_meta["mean"].astype(np.float64))
+        merged["count"] = totals
+        return vectors.astype(np.float32), merged
+
+    def flush(self) -> None:
+        """Write memory-mapped arrays back to disk."""
+
+        with self._lock:
+            if isinstance(self._vectors, np.memmap):
+                self._vectors.flush()
+                self._meta.flush()
+            self._write_header()
+
+    def _entry(self, row: int, similarity: float) -> MemoryEntry:
+        meta = self._meta[row]
+        index = int(meta["sensor"])
+        return MemoryEntry(
+            sensor=SENSORS[index] if index < len(SENSORS) else "other",
+            score=float(meta["score"]),
+            mean=float(meta["mean"]),
+            timestamp=datetime.fromtimestamp(float(meta["timestamp"]), tz=timezone.utc),
+            similarity=similarity,
+            count=int(meta["count"]),
+        )
+
+
+__all__ = [
+    "EMBED_DIM",
+    "LocalVectorMemory",
+    "MemoryEntry",
+    "SENSORS",
+    "VectorMemory",
+    "embed_features",
+    "window_statistics",
+]
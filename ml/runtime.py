@@ -0,0 +1,228 @@
+"""Lightweight runtime for the exported autoencoder artifacts.
+
+Training writes the model three ways (see :mod:`ml.artifact`), each carrying
+its own metadata (input size, input normalisation and anomaly threshold):
+
+* ``ml/autoencoder.npz``: layer weights for a pure NumPy forward pass.  This
+  is the default because it needs nothing beyond NumPy, so a scoring process
+  starts without importing torch at all.
+* ``ml/autoencoder.onnx``: executed with ``onnxruntime`` when installed.
+* ``ml/autoencoder.ts``: TorchScript, for when torch is loaded anyway.
+
+Only the backend that is actually used gets imported.  Every backend scores
+windows exactly like :func:`ml.inference.score_windows`.
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from server.metrics import timed
+
+MODEL_PATH = Path("ml/autoencoder.pth")
+DEFAULT_THRESHOLD = 0.1
+
+NUMPY_ARTIFACT = Path("ml/autoencoder.npz")
+ONNX_ARTIFACT = Path("ml/autoencoder.onnx")
+TORCHSCRIPT_ARTIFACT = Path("ml/autoencoder.ts")
+ARTIFACT_PATHS = (NUMPY_ARTIFACT, ONNX_ARTIFACT, TORCHSCRIPT_ARTIFACT)
+"""Artifacts in order of preference for :func:`load_scorer`."""
+
+ARTIFACT_VERSION = 1
+
+
+def prepare_batch(windows: Sequence[Sequence[float]], window_size: int) -> np.ndarray:
+    """NumPy twin of :func:`ml.inference.prepare_window` for a list of windows.
+
+    Each row holds the last ``window_size`` values; short histories are
+    left-padded with their latest value and empty ones are all zeros.  A
+    2-D array that is already wide enough is sliced without copying rows
+    one by one.
+    """
+
+    if isinstance(windows, np.ndarray) and windows.ndim == 2 and windows.shape[1] >= window_size:
+        return np.ascontiguousarray(windows[:, windows.shape[1] - window_size:], dtype=np.float32)
+    batch = np.zeros((len(windows), window_size), dtype=np.float32)
+    for row, values in enumerate(windows):
+        values = np.asarray(values, dtype=np.float32)[-window_size:]
+        if values.size:
+            batch[row, : window_size - values.size] = values[-1]
+            batch[row, window_size - values.size:] = values
+    return batch
+
+
+class Scorer:
+    """Reconstruction-error scorer backed by one exported artifact.
+
+    Attributes
+    ----------
+    input_dim:
+        Window length the model expects.
+    threshold:
+        Reconstruction error above which a window is anomalous.
+    offset, scale:
+        Windows are normalised as ``(x - offset) / scale`` before scoring.
+    calibrated:
+        Whether ``threshold`` was fitted to the training data.
+    """
+
+    def __init__(self, path: Path, meta: dict) -> None:
+        self.path = path
+        self.meta = meta
+        self.input_dim = int(meta["input_dim"])
+        self.threshold = float(meta.get("threshold", DEFAULT_THRESHOLD))
+        self.offset = float(meta.get("offset", 0.0))
+        self.scale = float(meta.get("scale", 1.0))
+        self.calibrated = bool(meta.get("calibrated", False))
+
+    @timed("model.forward")
+    def score_windows(self, windows: Sequence[Sequence[float]]) -> List[float]:
+        """Reconstruction error of every window, computed in one batch."""
+
+        if not len(windows):
+            return []
+        return self._errors(prepare_batch(windows, self.input_dim)).astype(float).tolist()
+
+    def _errors(self, batch: np.ndarray) -> np.ndarray:  # pragma: no cover - abstract
+        raise NotImplementedError
+
+
+class NumpyScorer(Scorer):
+    """Linear/ReLU forward pass over the weights stored in an ``.npz`` artifact."""
+
+    def __init__(self, path: Path) -> None:
+        with np.load(path) as archive:
+            meta = json.loads(str(archive["meta"]))
+            self._layers = [
+                (archive[f"weight_{i}"].T.copy(), archive[f"bias_{i}"], bool(relu))
+                for i, relu in enumerate(meta["relu"])
+            ]
+        super().__init__(path, meta)
+
+    def _errors(self, batch: np.ndarray) -> np.ndarray:
+        x = (batch - self.offset) / self.scale
+        out = x
+        for weight, bias, relu in self._layers:
+            out = out @ weight + bias
+            if relu:
+                np.maximum(out, 0.0, out=out)
+        return ((out - x) ** 2).mean(axis=1)
+
+
+class OnnxScorer(Scorer):
+    """Run an ``.onnx`` artifact with ``onnxruntime``."""
+
+    def __init__(self, path: Path) -> None:
+        try:
+            import onnxruntime
+        except ImportError as exc:
+            raise ImportError(
+                "The `onnxruntime` package is required for ONNX artifacts. Install it with `pip install onnxruntime`."
+            ) from exc
+
+        self._session = onnxruntime.InferenceSession(str(path), providers=["CPUExecutionProvider"])
+        meta = json.loads(self._session.get_modelmeta().custom_metadata_map["meta"])
+        super().__init__(path, meta)
+
+    def _errors(self, batch: np.ndarray) -> np.ndarray:
+        # Normalisation is part of the exported graph.
+        return self._session.run(None, {"windows": batch})[0]
+
+
+class TorchScriptScorer(Scorer):
+    """Run a TorchScript artifact; imports torch on construction."""
+
+    def __init__(self, path: Path) -> None:
+        import torch
+
+        extra_files = {"meta.json": ""}
+        self._torch = torch
+        self._module = torch.jit.load(str(path), map_location="cpu", _extra_files=extra_files)
+        self._module.eval()
+        super().__init__(path, json.loads(extra_files["meta.json"]))
+
+    def _errors(self, batch: np.ndarray) -> np.ndarray:
+        with self._torch.inference_mode():
+            return self._module(self._torch.from_numpy(batch)).numpy()
+
+
+_BACKENDS = {".npz": NumpyScorer, ".onnx": OnnxScorer, ".ts": TorchScriptScorer}
+
+
+def reconstruction_errors(model, windows: Sequence[Sequence[float]]) -> List[float]:
+    """Score ``windows`` with a :class:`Scorer` or a torch ``AutoEncoder``.
+
+    torch is only imported for the latter.
+    """
+
+    if isinstance(model, Scorer):
+        return model.score_windows(windows)
+    from ml.inference import score_windows
+
+    return score_windows(model, windows, model.encoder[0].in_features)
+
+
+def find_artifact() -> Optional[Path]:
+    """Return the preferred artifact that exists, if any."""
+
+    return next((path for path in ARTIFACT_PATHS if path.exists()), None)
+
+
+@timed("model.load")
+def load_scorer(path: Optional[Union[str, Path]] = None) -> Scorer:
+    """Load ``path`` (or the preferred existing artifact) with the matching backend."""
+
+    path = Path(path) if path is not None else find_artifact()
+    if path is None:
+        raise FileNotFoundError(
+            "No inference artifact found. Run `python -m ml.train` or `python -m ml.artifact` first."
+        )
+    backend = _BACKENDS.get(path.suffix)
+    if backend is None:
+        raise ValueError(f"Unknown artifact type: {path}")
+    scorer = backend(path)
+    if scorer.meta.get("version") != ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported artifact version in {path}")
+    return scorer
+
+
+def load_default_model(*, checkpoint: bool = True):
+    """The preferred exported artifact, else the training checkpoint, else ``None``.
+
+    A model without a calibrated threshold is skipped: with the default
+    threshold on unnormalised readings it flags far more normal windows
+    than the statistical detectors alone.  With ``checkpoint=False`` the
+    torch checkpoint is never considered, so torch is never imported.
+    """
+
+    model = None
+    if find_artifact() is not None:
+        model = load_scorer()
+    elif checkpoint and MODEL_PATH.exists():
+        from ml.inference import load_autoencoder
+
+        model = load_autoencoder(MODEL_PATH)[0]
+    if model is not None and not model.calibrated:
+        print("Ignoring the autoencoder: it has no calibrated threshold. Retrain it with `python -m ml.train`.")
+        return None
+    return model
+
+
+__all__ = [
+    "ARTIFACT_PATHS",
+    "DEFAULT_THRESHOLD",
+    "MODEL_PATH",
+    "NumpyScorer",
+    "OnnxScorer",
+    "Scorer",
+    "TorchScriptScorer",
+    "find_artifact",
+    "load_default_model",
+    "load_scorer",
+    "prepare_batch",
+    "reconstruction_errors",
+]
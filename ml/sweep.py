@@ -0,0 +1,457 @@
+"""Parallel hyperparameter and window-size sweep for the autoencoder.
+
+``ml/train.py`` trains one fixed configuration.  This module trains the
+product of several window sizes, augmentation factors, learning rates,
+batch sizes and layer layouts, each a *trial*, and ranks them.
+
+The sensor history is read once, by the parent process, into a
+:class:`multiprocessing.shared_memory.SharedMemory` block.  A pool of
+worker processes attaches to that block without copying it, and every
+trial slices its own windows from it: the first ``1 - validation`` of each
+sensor's history (plus augmented copies) for training, and the rest for the
+validation error.  Windows are standardised with the offset and scale
+:func:`ml.artifact.normalisation` computes once from the training share, as
+``ml/train.py`` does, so trials are ranked for the pipeline that is actually
+trained and the error is not dominated by the channel with the largest
+values.  Each worker pins torch to ``threads`` threads, so
+``workers * threads`` should not exceed the core count.
+
+After every epoch a trial publishes its validation error in a second shared
+block.  The median stopping rule stops a trial after ``grace`` epochs when
+its best error so far is worse than the median of the other trials' running
+average errors at the same epoch.  Finished trials are ranked by Pareto
+front over validation error and single-window inference latency, then by
+validation error, and written as a CSV table.
+
+Usage::
+
+    python -m ml.sweep --window-sizes 16 32 64 --augment-factors 0 10 20 --workers 4 --threads 1
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+DEFAULT_SENSORS = ("HeartRate", "Temp", "AccelX", "AccelY", "AccelZ")
+RESULTS_PATH = Path("sweep_results.csv")
+
+
+@dataclass(frozen=True)
+class Trial:
+    """One configuration; ``hidden_dims`` empty means the default pyramid."""
+
+    index: int
+    window_size: int
+    augment_factor: int
+    learning_rate: float
+    batch_size: int
+    hidden_dims: Tuple[int, ...] = ()
+
+    @property
+    def layout(self) -> str:
+        return "-".join(map(str, self.hidden_dims)) or "pyramid"
+
+
+@dataclass
+class TrialResult:
+    trial: Trial
+    val_loss: float
+    epochs: int
+    stopped: bool
+    latency_ms: float
+    parameters: int
+    seconds: float
+    train_windows: int
+    front: int = 0
+    curve: List[float] = field(default_factory=list, repr=False)
+
+    def row(self) -> Dict[str, object]:
+        row = {key: value for key, value in asdict(self.trial).items() if key != "hidden_dims"}
+        row["layout"] = self.trial.layout
+        row.update(
+            val_loss=round(self.val_loss, 6),
+            latency_ms=round(self.latency_ms, 4),
+            front=self.front,
+            epochs=self.epochs,
+            stopped=self.stopped,
+            parameters=self.parameters,
+            train_windows=self.train_windows,
+            seconds=round(self.seconds, 2),
+        )
+        return row
+
+
+def make_trials(
+    window_sizes: Sequence[int],
+    augment_factors: Sequence[int],
+    learning_rates: Sequence[float],
+    batch_sizes: Sequence[int],
+    layouts: Sequence[Tuple[int, ...]] = ((),),
+) -> List[Trial]:
+    """Every combination of the given values, numbered in order."""
+
+    grid = itertools.product(window_sizes, augment_factors, learning_rates, batch_sizes, layouts)
+    return [Trial(index, *values) for index, values in enumerate(grid)]
+
+
+def median_should_stop(
+    curves: np.ndarray, index: int, epoch: int, *, grace: int = 5, min_trials: int = 3
+) -> bool:
+    """Median stopping rule for trial ``index`` after ``epoch`` (0-based).
+
+    ``curves`` holds one row of per-epoch validation errors per trial,
+    ``NaN`` where an epoch has not been reached.  The trial stops when its
+    best error is worse than the median running average of at least
+    ``min_trials`` other trials that reached the same epoch.
+    """
+
+    if epoch + 1 < grace:
+        return False
+    others = np.delete(curves[:, : epoch + 1], index, axis=0)
+    reached = others[~np.isnan(others[:, epoch])]
+    if len(reached) < min_trials:
+        return False
+    median = float(np.median(reached.mean(axis=1)))
+    return float(np.nanmin(curves[index, : epoch + 1])) > median
+
+
+def pareto_fronts(points: Sequence[Tuple[float, float]]) -> List[int]:
+    """Front number (1 = non-dominated) of each ``(error, latency)`` point, both minimised."""
+
+    fronts = [0] * len(points)
+    remaining = set(range(len(points)))
+    front = 0
+    while remaining:
+        front += 1
+        current = {
+            i for i in remaining
+            if not any(
+                points[j][0] <= points[i][0] and points[j][1] <= points[i][1] and points[j] != points[i]
+                for j in remaining
+            )
+        }
+        for i in current:
+            fronts[i] = front
+        remaining -= current
+    return fronts
+
+
+# ----------------------------------------------------------------------
+# Shared data
+# ----------------------------------------------------------------------
+def load_history(
+    sensors: Sequence[str], limit: int, export_dir: Optional[Union[str, Path]] = None
+) -> Dict[str, np.ndarray]:
+    """Last ``limit`` readings of every sensor from Redis or an export directory."""
+
+    if export_dir is not None:
+        from server.history_io import load_series
+
+        return {name: load_series(export_dir, name, limit)[1] for name in sensors}
+
+    from server.redis import SensorLogStore
+
+    store = SensorLogStore()
+    return {
+        name: np.array([r.sensor_output for r in store.fetch_recent(name, limit=limit)], dtype=np.float32)
+        for name in sensors
+    }
+
+
+_history: Optional[shared_memory.SharedMemory] = None
+_curves_block: Optional[shared_memory.SharedMemory] = None
+_series: List[np.ndarray] = []
+_curves: Optional[np.ndarray] = None
+_settings: Dict[str, object] = {}
+
+
+def _init_worker(
+    history_name: str, lengths: Sequence[int], curves_name: str, shape: Tuple[int, int], settings: Dict[str, object]
+) -> None:
+    global _history, _curves_block, _series, _curves, _settings
+    import torch
+
+    torch.set_num_threads(int(settings["threads"]))
+    _history = shared_memory.SharedMemory(name=history_name)
+    flat = np.ndarray((sum(lengths),), dtype=np.float32, buffer=_history.buf)
+    bounds = np.cumsum([0, *lengths])
+    _series = [flat[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    _curves_block = shared_memory.SharedMemory(name=curves_name)
+    _curves = np.ndarray(shape, dtype=np.float64, buffer=_curves_block.buf)
+    _settings = settings
+
+
+def _windows(trial: Trial, validation: float):
+    import torch
+
+    from ml.data_augmentor import augment_tensor
+
+    train, val = [], []
+    for series in _series:
+        split = int(len(series) * (1 - validation))
+        if split < trial.window_size or len(series) - split < trial.window_size:
+            continue
+        # Windows are views into shared memory; torch.cat makes the only copy.
+        values = torch.from_numpy(series)
+        train.append(values[:split].unfold(0, trial.window_size, 1))
+        val.append(values[split:].unfold(0, trial.window_size, 1))
+    if not train:
+        raise ValueError(f"Not enough history for window size {trial.window_size}")
+    X = torch.cat(train)
+    if trial.augment_factor > 0:
+        augmented = torch.cat([augment_tensor(row, n_augments=trial.augment_factor) for row in X], dim=0)
+        X = torch.cat([X, augmented], dim=0)
+    # Augment raw readings, then standardise, in the same order as ml/train.py.
+    offset, scale = float(_settings["offset"]), float(_settings["scale"])
+    return (X - offset) / scale, (torch.cat(val) - offset) / scale
+
+
+def _normalisation(arrays: Sequence[np.ndarray], validation: float) -> Tuple[float, float]:
+    """``(offset, scale)`` of the training share of every series, computed once for all trials."""
+
+    import torch
+
+    from ml.artifact import normalisation
+
+    train = [values[:int(len(values) * (1 - validation))] for values in arrays]
+    return normalisation(torch.from_numpy(np.concatenate(train)))
+
+
+def _latency_ms(model, window_size: int, repeats: int = 200) -> float:
+    import torch
+
+    window = torch.zeros(1, window_size)
+    timings = []
+    with torch.inference_mode():
+        for _ in range(10):
+            model(window)
+        for _ in range(repeats):
+            started = time.perf_counter()
+            model(window)
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e3
+
+
+def run_trial(trial: Trial) -> TrialResult:
+    """Train and evaluate one trial inside a pool worker."""
+
+    import torch
+
+    from ml.model import AutoEncoder, count_parameters, reconstruction_loss
+
+    started = time.perf_counter()
+    torch.manual_seed(int(_settings["seed"]) + trial.index)
+    X, val = _windows(trial, float(_settings["validation"]))
+    model = AutoEncoder(input_dim=trial.window_size, hidden_dims=trial.hidden_dims or None)
+    optimizer = torch.optim.Adam(model.parameters(), lr=trial.learning_rate)
+
+    epochs = int(_settings["epochs"])
+    stopped = False
+    curve: List[float] = []
+    for epoch in range(epochs):
+        model.train()
+        for batch in X[torch.randperm(len(X))].split(trial.batch_size):
+            loss = reconstruction_loss(model(batch), batch)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+
+        model.eval()
+        with torch.inference_mode():
+            val_loss = reconstruction_loss(model(val), val).item()
+        curve.append(val_loss)
+        _curves[trial.index, epoch] = val_loss
+        if epoch + 1 < epochs and median_should_stop(
+            _curves, trial.index, epoch, grace=int(_settings["grace"]), min_trials=int(_settings["min_trials"])
+        ):
+            stopped = True
+            break
+
+    return TrialResult(
+        trial=trial,
+        val_loss=min(curve),
+        epochs=len(curve),
+        stopped=stopped,
+        latency_ms=_latency_ms(model, trial.window_size),
+        parameters=count_parameters(model),
+        seconds=time.perf_counter() - started,
+        train_windows=len(X),
+        curve=curve,
+    )
+
+
+def sweep(
+    history: Dict[str, np.ndarray],
+    trials: Sequence[Trial],
+    *,
+    epochs: int = 40,
+    workers: Optional[int] = None,
+    threads: int = 1,
+    validation: float = 0.2,
+    grace: int = 5,
+    min_trials: int = 3,
+    seed: int = 0,
+) -> List[TrialResult]:
+    """Run ``trials`` on ``history`` across a process pool and return them ranked.
+
+    Parameters
+    ----------
+    history:
+        Chronological readings per sensor, shared with the workers.
+    workers:
+        Trials trained at once; defaults to the core count divided by
+        ``threads``.
+    threads:
+        Torch threads per worker.
+    grace, min_trials:
+        Parameters of :func:`median_should_stop`.
+    """
+
+    workers = workers or max((os.cpu_count() or 1) // threads, 1)
+    arrays = [np.ascontiguousarray(values, dtype=np.float32) for values in history.values() if len(values)]
+    if not arrays:
+        raise ValueError("No sensor history to sweep over")
+    lengths = [len(values) for values in arrays]
+    shape = (len(trials), epochs)
+
+    history_block = shared_memory.SharedMemory(create=True, size=max(sum(lengths), 1) * 4)
+    curves_block = shared_memory.SharedMemory(create=True, size=max(shape[0] * shape[1], 1) * 8)
+    try:
+        np.ndarray((sum(lengths),), dtype=np.float32, buffer=history_block.buf)[:] = np.concatenate(arrays)
+        np.ndarray(shape, dtype=np.float64, buffer=curves_block.buf).fill(np.nan)
+        offset, scale = _normalisation(arrays, validation)
+        settings = {"threads": threads, "epochs": epochs, "validation": validation,
+                    "grace": grace, "min_trials": min_trials, "seed": seed, "offset": offset, "scale": scale}
+
+        for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ.setdefault(variable, str(threads))
+
+        results: List[TrialResult] = []
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(trials)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(history_block.name, lengths, curves_block.name, shape, settings),
+        ) as executor:
+            futures = [executor.submit(run_trial, trial) for trial in trials]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                note = f" (stopped after {result.epochs} epochs)" if result.stopped else ""
+                print(
+                    f"Trial {result.trial.index}: window={result.trial.window_size} "
+                    f"augment={result.trial.augment_factor} lr={result.trial.learning_rate} "
+                    f"layout={result.trial.layout} val_loss={result.val_loss:.5f} "
+                    f"latency={result.latency_ms:.3f}ms{note}"
+                )
+    finally:
+        history_block.close()
+        history_block.unlink()
+        curves_block.close()
+        curves_block.unlink()
+
+    fronts = pareto_fronts([(result.val_loss, result.latency_ms) for result in results])
+    for result, front in zip(results, fronts):
+        result.front = front
+    return sorted(results, key=lambda result: (result.front, result.val_loss, result.latency_ms))
+
+
+def write_results(results: Sequence[TrialResult], path: Union[str, Path] = RESULTS_PATH) -> Path:
+    """Write the ranked results as CSV, best first."""
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rows = [dict(rank=rank, **result.row()) for rank, result in enumerate(results, start=1)]
+    with path.open("w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def format_table(results: Sequence[TrialResult], top: Optional[int] = None) -> str:
+    columns = ("rank", "window_size", "augment_factor", "learning_rate", "batch_size", "layout",
+               "val_loss", "latency_ms", "front", "epochs")
+    rows = [[str(rank)] + [str(result.row()[name]) for name in columns[1:]]
+            for rank, result in enumerate(results[:top], start=1)]
+    widths = [max(len(name), *(len(row[i]) for row in rows)) for i, name in enumerate(columns)]
+    lines = ["  ".join(name.rjust(width) for name, width in zip(columns, widths))]
+    lines += ["  ".join(value.rjust(width) for value, width in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
+
+
+def _layout(text: str) -> Tuple[int, ...]:
+    return () if text == "pyramid" else tuple(int(width) for width in text.split(","))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sweep autoencoder hyperparameters in parallel.")
+    parser.add_argument("--sensors", nargs="+", default=list(DEFAULT_SENSORS))
+    parser.add_argument("--limit", type=int, default=2000, help="Readings per sensor to load.")
+    parser.add_argument("--export-dir", help="Read history from a server.history_io export instead of Redis.")
+    parser.add_argument("--window-sizes", nargs="+", type=int, default=[16, 32, 64])
+    parser.add_argument("--augment-factors", nargs="+", type=int, default=[0, 20])
+    parser.add_argument("--learning-rates", nargs="+", type=float, default=[1e-3])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[64])
+    parser.add_argument("--layouts", nargs="+", type=_layout, default=[()],
+                        help="Encoder widths such as 16,8, or 'pyramid' for the default.")
+    parser.add_argument("--epochs", type=int, default=40)
+    parser.add_argument("--workers", type=int, help="Trials trained at once (default: cores / threads).")
+    parser.add_argument("--threads", type=int, default=1, help="Torch threads per worker.")
+    parser.add_argument("--validation", type=float, default=0.2, help="Trailing share of history held out.")
+    parser.add_argument("--grace", type=int, default=5, help="Epochs before a trial may be stopped.")
+    parser.add_argument("--min-trials", type=int, default=3, help="Peers needed for the median stopping rule.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=str(RESULTS_PATH), help="CSV file for the ranked results.")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    history = load_history(args.sensors, args.limit, args.export_dir)
+    print(f"Loaded {sum(len(v) for v in history.values()):,} readings in {time.perf_counter() - started:.2f}s")
+
+    trials = make_trials(args.window_sizes, args.augment_factors, args.learning_rates, args.batch_sizes, args.layouts)
+    results = sweep(
+        history,
+        trials,
+        epochs=args.epochs,
+        workers=args.workers,
+        threads=args.threads,
+        validation=args.validation,
+        grace=args.grace,
+        min_trials=args.min_trials,
+        seed=args.seed,
+    )
+    print(format_table(results))
+    print(f"Results saved to {write_results(results, args.output)}")
+
+
+__all__ = [
+    "RESULTS_PATH",
+    "Trial",
+    "TrialResult",
+    "format_table",
+    "load_history",
+    "make_trials",
+    "median_should_stop",
+    "pareto_fronts",
+    "run_trial",
+    "sweep",
+    "write_results",
+]
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
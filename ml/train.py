@@ -1,18 +1,27 @@
 from __future__ import annotations
 
+import argparse
 from pathlib import Path
+from typing import Optional, Union
 
 import torch
 from torch.utils.data import DataLoader
 
+from ml.artifact import calibrate_threshold, export_artifacts, normalisation
 from ml.dataset import RedisSensorDataset
 from ml.model import AutoEncoder, TrainingConfig, reconstruction_loss
+from ml.runtime import MODEL_PATH
 
+WINDOW_CACHE = Path("ml/.window_cache")
 
-MODEL_PATH = Path("ml/autoencoder.pth")
 
+def train(*, cache_dir: Optional[Union[str, Path]] = WINDOW_CACHE, update_cache: bool = True) -> None:
+    """Train the autoencoder, reusing cached windows from ``cache_dir`` when present.
+
+    The cache is brought up to date with the latest readings first unless
+    ``update_cache`` is false (see :class:`ml.dataset.RedisSensorDataset`).
+    """
 
-def train() -> None:
     cfg = TrainingConfig(epochs=40, batch_size=64)
     dataset = RedisSensorDataset(
         ["HeartRate", "temp", "AccelX", "AccelY", "AccelZ"],
@@ -20,15 +29,20 @@ def train() -> None:
         window_size=32,
         stride=1,
         augment_factor=20,
+        cache_dir=cache_dir,
+        update_cache=update_cache,
     )
     loader = DataLoader(dataset, batch_size=cfg.batch_size, shuffle=True)
 
     model = AutoEncoder(input_dim=dataset.input_dim)
     optimizer = torch.optim.Adam(model.parameters(), lr=cfg.learning_rate)
+    # Scoring applies the same normalisation (it is stored with the model).
+    offset, scale = normalisation(dataset.X)
 
     for epoch in range(cfg.epochs):
         total_loss = 0.0
         for batch, _ in loader:
+            batch = (batch - offset) / scale
             pred = model(batch)
             loss = reconstruction_loss(pred, batch)
             optimizer.zero_grad()
@@ -39,11 +53,35 @@ def train() -> None:
         epoch_loss = total_loss / len(loader)
         print(f"Epoch {epoch + 1}/{cfg.epochs}, Loss: {epoch_loss:.4f}")
 
+    model.eval()
+    threshold = calibrate_threshold(model, dataset.X, offset=offset, scale=scale)
+    print(f"Anomaly threshold: {threshold:.4f}")
+
     MODEL_PATH.parent.mkdir(parents=True, exist_ok=True)
-    torch.save({"state_dict": model.state_dict(), "input_dim": dataset.input_dim}, MODEL_PATH)
+    torch.save(
+        {
+            "state_dict": model.state_dict(),
+            "input_dim": dataset.input_dim,
+            "offset": offset,
+            "scale": scale,
+            "threshold": threshold,
+        },
+        MODEL_PATH,
+    )
     print(f"Model saved to {MODEL_PATH}")
+    for path in export_artifacts(model, threshold=threshold, offset=offset, scale=scale, calibrated=True):
+        print(f"Inference artifact saved to {path}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the sensor autoencoder.")
+    parser.add_argument("--frozen-cache", action="store_true",
+                        help="Train on the cached windows as they are, without fetching newer readings.")
+    parser.add_argument("--no-cache", action="store_true", help="Rebuild windows in memory without caching.")
+    args = parser.parse_args()
+    train(cache_dir=None if args.no_cache else WINDOW_CACHE, update_cache=not args.frozen_cache)
 
 
 if __name__ == "__main__":
-    train()
+    main()
 
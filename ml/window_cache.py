@@ -0,0 +1,215 @@
+"""On-disk cache of prepared training windows.
+
+Building :class:`ml.dataset.RedisSensorDataset` means fetching history,
+slicing it into windows and running the augmentations, all of which is
+repeated by every training run.  :class:`WindowCache` keeps the result in a
+raw ``float32`` file next to a small JSON header::
+
+    <root>/<key>/
+        windows.f32   # rows x window_size, memory-mapped on open
+        meta.json     # row count, source hash, statistics, per-sensor state
+
+``key`` is a hash of the dataset parameters, so a different window size,
+stride or source never reuses stale windows.  Opening a cache maps the file
+copy-on-write and wraps it with ``torch.from_numpy``; nothing is read until a
+batch touches it.  :meth:`WindowCache.append` only slices the readings newer
+than what is already cached (keeping the partial window left at the end of
+the previous run) and appends the new rows to the file.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Tuple, Union
+
+import numpy as np
+import torch
+
+from ml.data_augmentor import augment_tensor
+
+_FORMAT_VERSION = 1
+
+Series = Tuple[np.ndarray, np.ndarray]
+"""``(timestamps, values)`` of one sensor in chronological order."""
+
+
+def cache_key(params: Mapping[str, object]) -> str:
+    """Stable short hash of the dataset parameters."""
+
+    blob = json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+
+class WindowCache:
+    """Memory-mapped store of the windows built for one set of dataset parameters.
+
+    Parameters
+    ----------
+    root:
+        Directory holding one sub-directory per parameter set.
+    params:
+        Everything that influences the windows.  Must contain
+        ``window_size``, ``stride`` and ``augment_factor``.
+    """
+
+    def __init__(self, root: Union[str, Path], params: Mapping[str, object]) -> None:
+        # Round-trip through JSON so the parameters compare equal to the stored header.
+        self.params = json.loads(json.dumps(dict(params), sort_keys=True, default=str))
+        self.window_size = int(self.params["window_size"])
+        self.stride = int(self.params["stride"])
+        self.augment_factor = int(self.params["augment_factor"])
+        self.path = Path(root) / cache_key(self.params)
+        self._header: Optional[dict] = None
+
+        meta = self.path / "meta.json"
+        if meta.exists():
+            header = json.loads(meta.read_text())
+            if header.get("version") == _FORMAT_VERSION and header.get("params") == self.params:
+                self._header = header
+
+    @property
+    def exists(self) -> bool:
+        return self._header is not None
+
+    @property
+    def rows(self) -> int:
+        return int(self._header["rows"]) if self._header else 0
+
+    @property
+    def source_hash(self) -> Optional[str]:
+        """SHA-256 over every reading the cached windows were built from."""
+
+        return self._header["source_hash"] if self._header else None
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-sensor ``count``, ``mean`` and ``std`` of the source readings."""
+
+        if not self._header:
+            return {}
+        stats = {}
+        for sensor, state in self._header["sensors"].items():
+            count = state["count"]
+            std = math.sqrt(state["m2"] / count) if count else float("nan")
+            stats[sensor] = {"count": count, "mean": state["mean"], "std": std}
+        return stats
+
+    def reset(self) -> None:
+        """Forget every cached window; the next :meth:`append` starts a new file."""
+
+        self._header = None
+
+    def last_timestamp(self, sensor: str) -> Optional[float]:
+        """Timestamp of the newest cached reading of ``sensor``."""
+
+        if not self._header or sensor not in self._header["sensors"]:
+            return None
+        return self._header["sensors"][sensor]["last_timestamp"]
+
+    def windows(self) -> torch.Tensor:
+        """Return every cached window as a ``[rows, window_size]`` tensor without copying."""
+
+        if not self.rows:
+            return torch.empty((0, self.window_size))
+        # Copy-on-write keeps the array writable for torch without ever
+        # modifying the file.
+        array = np.memmap(
+            self.path / "windows.f32", dtype=np.float32, mode="c", shape=(self.rows, self.window_size)
+        )
+        return torch.from_numpy(array)
+
+    def append(self, series: Mapping[str, Series]) -> int:
+        """Window the readings newer than the cache, append them and return how many rows were added.
+
+        Readings at or before a sensor's :meth:`last_timestamp` are ignored,
+        so callers may pass overlapping ranges.
+        """
+
+        header = self._header or {
+            "version": _FORMAT_VERSION,
+            "params": self.params,
+            "rows": 0,
+            "source_hash": hashlib.sha256().hexdigest(),
+            "sensors": {},
+        }
+        digest = header["source_hash"]
+        blocks = []
+
+        for sensor, (timestamps, values) in series.items():
+            timestamps = np.asarray(timestamps, dtype=np.float64)
+            values = np.asarray(values, dtype=np.float64)
+            state = header["sensors"].setdefault(
+                sensor, {"last_timestamp": None, "tail": [], "count": 0, "mean": 0.0, "m2": 0.0}
+            )
+            if state["last_timestamp"] is not None:
+                fresh = timestamps > state["last_timestamp"]
+                timestamps, values = timestamps[fresh], values[fresh]
+            if values.size == 0:
+                continue
+
+            digest = hashlib.sha256(
+                digest.encode("ascii") + sensor.encode("utf-8") + timestamps.tobytes() + values.tobytes()
+            ).hexdigest()
+            _merge_moments(state, values)
+            state["last_timestamp"] = float(timestamps[-1])
+
+            # Continue from the readings that did not complete a window last time.
+            pending = np.concatenate([np.asarray(state["tail"], dtype=np.float64), values])
+            if pending.size >= self.window_size:
+                windows = np.lib.stride_tricks.sliding_window_view(pending, self.window_size)[:: self.stride]
+                consumed = len(windows) * self.stride
+                blocks.append(windows.astype(np.float32))
+            else:
+                consumed = 0
+            state["tail"] = pending[consumed:].tolist()
+
+        added = 0
+        if blocks:
+            rows = self._augment(np.concatenate(blocks))
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(self.path / "windows.f32", "r+b" if header["rows"] else "wb") as handle:
+                # Anything past the committed row count belongs to an interrupted write.
+                handle.truncate(header["rows"] * self.window_size * 4)
+                handle.seek(0, os.SEEK_END)
+                handle.write(np.ascontiguousarray(rows, dtype=np.float32).tobytes())
+                handle.flush()
+                os.fsync(handle.fileno())
+            added = len(rows)
+            header["rows"] += added
+
+        header["source_hash"] = digest
+        self._write_header(header)
+        return added
+
+    def _augment(self, windows: np.ndarray) -> np.ndarray:
+        if self.augment_factor <= 0:
+            return windows
+        base = torch.from_numpy(windows)
+        augmented = torch.cat([augment_tensor(row, n_augments=self.augment_factor) for row in base], dim=0)
+        return torch.cat([base, augmented], dim=0).numpy()
+
+    def _write_header(self, header: dict) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps(header))
+        tmp.replace(self.path / "meta.json")
+        self._header = header
+
+
+def _merge_moments(state: dict, values: np.ndarray) -> None:
+    """Fold ``values`` into the running count/mean/M2 (Chan et al. parallel update)."""
+
+    count, mean = values.size, float(values.mean())
+    m2 = float(((values - mean) ** 2).sum())
+    total = state["count"] + count
+    delta = mean - state["mean"]
+    state["m2"] += m2 + delta * delta * state["count"] * count / total
+    state["mean"] += delta * count / total
+    state["count"] = total
+
+
+__all__ = ["WindowCache", "cache_key"]
@@ -0,0 +1,45 @@
+"""Redis key layout for a fleet of wearables.
+
+Readings of a device live under ``"{namespace}{<device>}:<sensor>"``.  The
+braces are a Redis Cluster hash tag: only ``<device>`` is hashed, so the
+sensor list, its ``:ts`` index and every ``:rollup:<tier>`` key of one
+device land in the same slot, while different devices spread over the
+cluster.  Readings without a device keep the original single-wearable keys
+(``"{namespace}<sensor>"``), so existing history stays readable.
+
+Every device that has written a reading is recorded in the
+``"{namespace}devices"`` set, which fan-out reads use to enumerate the fleet.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Optional
+
+DEVICE_PATTERN = re.compile(r"[A-Za-z0-9_.:@-]{1,64}")
+"""Accepted device ids; braces would break the hash tag."""
+
+REGISTRY_KEY = "devices"
+
+
+def check_device_id(device: str) -> str:
+    """Return ``device`` or raise ``ValueError`` if it cannot be used in a key."""
+
+    if not isinstance(device, str) or not DEVICE_PATTERN.fullmatch(device):
+        raise ValueError(f"Invalid device id: {device!r}")
+    return device
+
+
+def sensor_key(sensor_name: str, device: Optional[str] = None, namespace: str = "") -> str:
+    """Key of the raw history list of ``sensor_name`` on ``device``."""
+
+    if device is None:
+        return f"{namespace}{sensor_name}"
+    return f"{namespace}{{{device}}}:{sensor_name}"
+
+
+def registry_key(namespace: str = "") -> str:
+    return f"{namespace}{REGISTRY_KEY}"
+
+
+__all__ = ["DEVICE_PATTERN", "REGISTRY_KEY", "check_device_id", "registry_key", "sensor_key"]
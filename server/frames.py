@@ -0,0 +1,333 @@
+"""Decoder for the binary serial frames of the wearable firmware.
+
+The original firmware prints ``Name:value`` lines padded with twenty empty
+lines per loop, so most of the 115200 baud link carries newlines and one
+``readline()`` per value caps capture at a few hertz.  The binary format
+packs one sample of all five channels into a fixed 32 byte frame:
+
+======  =====  ==============================================
+offset  type   field
+======  =====  ==============================================
+0       2B     sync ``A5 5A``
+2       u8     length of the following payload (27)
+3       u8     format version (1)
+4       u16    sequence number, wraps at 65536
+6       u32    device time in milliseconds (``millis()``)
+10      5×f32  HeartRate, Temp, AccelX, AccelY, AccelZ (NaN = none)
+30      u16    CRC-16/CCITT-FALSE of bytes 2..29
+======  =====  ==============================================
+
+All fields are little-endian.  :class:`FrameDecoder` takes whatever
+``serial.read(serial.in_waiting)`` returned.  It finds the sync word with
+``bytes.find`` and maps each run of back-to-back frames with a single
+``np.frombuffer`` call.  Only the CRC is checked frame by frame, with the C
+implementation in :mod:`binascii`.  Sequence numbers reveal lost frames.
+Bytes outside frames are parsed as the old text lines, so older firmware
+(and boot messages of new firmware) keep working.
+"""
+
+from __future__ import annotations
+
+import time
+from binascii import crc_hqx
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from server.metrics import count, timed
+
+SYNC = b"\xa5\x5a"
+FRAME_VERSION = 1
+CHANNELS = ("HeartRate", "Temp", "AccelX", "AccelY", "AccelZ")
+
+FRAME_DTYPE = np.dtype(
+    [
+        ("sync", "<u2"),
+        ("length", "u1"),
+        ("version", "u1"),
+        ("seq", "<u2"),
+        ("device_ms", "<u4"),
+        ("values", "<f4", (len(CHANNELS),)),
+        ("crc", "<u2"),
+    ]
+)
+FRAME_SIZE = FRAME_DTYPE.itemsize
+PAYLOAD_LENGTH = FRAME_SIZE - 5
+"""Bytes between the length field and the CRC."""
+
+_SYNC_WORD = int.from_bytes(SYNC, "little")
+_SEQ_MODULO = 1 << 16
+_MS_MODULO = 1 << 32
+MAX_LINE = 256
+"""Longest text line kept while waiting for its newline."""
+
+
+@timed("serial.parse")
+def parse_line(data):
+    """Split a ``Name:value`` serial line into ``(name, value)`` or return None."""
+    try:
+        name, value = data.split(":")
+        return name.strip(), float(value.strip())
+    except ValueError:
+        count("serial_invalid_lines")
+        return None
+
+
+def frame_crc(frame: bytes) -> int:
+    """CRC the firmware appends to ``frame`` (length byte through the last channel)."""
+
+    return crc_hqx(frame[2:FRAME_SIZE - 2], 0xFFFF)
+
+
+def encode_frames(seq: Sequence[int], device_ms: Sequence[int], values: Sequence[Sequence[float]]) -> bytes:
+    """Build frames exactly as the firmware sends them (for simulators and tests)."""
+
+    frames = np.zeros(len(seq), dtype=FRAME_DTYPE)
+    frames["sync"] = _SYNC_WORD
+    frames["length"] = PAYLOAD_LENGTH
+    frames["version"] = FRAME_VERSION
+    frames["seq"] = np.asarray(seq, dtype=np.int64) % _SEQ_MODULO
+    frames["device_ms"] = np.asarray(device_ms, dtype=np.int64) % _MS_MODULO
+    frames["values"] = values
+    blob = bytearray(frames.tobytes())
+    for offset in range(0, len(blob), FRAME_SIZE):
+        blob[offset + FRAME_SIZE - 2: offset + FRAME_SIZE] = frame_crc(blob[offset:offset + FRAME_SIZE]).to_bytes(
+            2, "little"
+        )
+    return bytes(blob)
+
+
+@dataclass
+class DecodedFrames:
+    """Everything decoded from one :meth:`FrameDecoder.feed` call.
+
+    ``values`` has one row per frame and one column per channel.
+    ``timestamps`` are host Unix seconds derived from the device clock.
+    ``text`` holds ``(name, value, received_at)`` readings from text lines.
+    ``gaps`` lists ``(last sequence before the gap, frames missing)``.
+    """
+
+    seq: np.ndarray
+    timestamps: np.ndarray
+    values: np.ndarray
+    text: List[Tuple[str, float, float]] = field(default_factory=list)
+    gaps: List[Tuple[int, int]] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.seq) + len(self.text)
+
+    def columns(self, channels: Sequence[str] = CHANNELS) -> Tuple[List[str], List[float], List[float]]:
+        """``(names, values, timestamps)`` of every reading, skipping NaN channels."""
+
+        present = ~np.isnan(self.values)
+        names = np.broadcast_to(np.asarray(channels, dtype=object), self.values.shape)[present].tolist()
+        values = self.values[present].astype(np.float64).tolist()
+        timestamps = np.broadcast_to(self.timestamps[:, None], self.values.shape)[present].tolist()
+        for name, value, received_at in self.text:
+            names.append(name)
+            values.append(value)
+            timestamps.append(received_at)
+        return names, values, timestamps
+
+
+class FrameDecoder:
+    """Incremental decoder for a serial byte stream of frames and/or text lines.
+
+    Parameters
+    ----------
+    clock:
+        Host clock used to anchor the device's millisecond counter.
+    max_skew:
+        Re-anchor the device clock when it drifts this many seconds from
+        the host clock (for example after the wearable rebooted).
+    """
+
+    def __init__(self, *, clock: Callable[[], float] = time.time, max_skew: float = 2.0) -> None:
+        self._buffer = bytearray()
+        self._clock = clock
+        self.max_skew = max_skew
+        self._last_seq: Optional[int] = None
+        self._last_ms: Optional[int] = None
+        self._wraps = 0
+        self._anchor: Optional[float] = None
+
+        self.frames = 0
+        self.lost = 0
+        self.corrupt = 0
+        self.skipped_bytes = 0
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def feed(self, data: bytes) -> DecodedFrames:
+        """Decode ``data`` together with whatever was left over from earlier calls."""
+
+        received_at = self._clock()
+        buffer = self._buffer
+        buffer += data
+        size = len(buffer)
+        records: List[np.ndarray] = []
+        text: List[Tuple[str, float, float]] = []
+        position = 0
+
+        while position < size:
+            start = buffer.find(SYNC, position)
+            if start < 0:
+                # Keep a trailing first sync byte, it may start the next frame.
+                end = size - 1 if buffer[-1] == SYNC[0] else size
+                position = self._parse_text(buffer, position, end, received_at, text, partial=True)
+                break
+            if start > position:
+                self._parse_text(buffer, position, start, received_at, text, partial=False)
+            available = (size - start) // FRAME_SIZE
+            if available == 0:
+                position = start  # wait for the rest of the frame
+                break
+
+            frames = np.frombuffer(buffer, dtype=FRAME_DTYPE, count=available, offset=start)
+            framed = (frames["sync"] == _SYNC_WORD) & (frames["length"] == PAYLOAD_LENGTH)
+            run = available if framed.all() else int(framed.argmin())
+            if run == 0:
+                # Sync bytes inside noise or a truncated frame: resync one byte later.
+                self.skipped_bytes += 1
+                position = start + 1
+                del frames
+                continue
+
+            # Frames up to the first CRC failure are kept.  A failed frame may
+            # be a sync word inside noise that hides the real frame start, so
+            # the search resumes one byte after it rather than a frame later.
+            view = memoryview(buffer)
+            valid = 0
+            offsets = range(start, start + run * FRAME_SIZE, FRAME_SIZE)
+            for offset, crc in zip(offsets, frames["crc"][:run].tolist()):
+                if crc_hqx(view[offset + 2: offset + FRAME_SIZE - 2], 0xFFFF) != crc:
+                    break
+                valid += 1
+            view.release()
+            if valid:
+                records.append(frames[:valid].copy())
+            del frames
+            position = start + valid * FRAME_SIZE
+            if valid < run:
+                self.corrupt += 1
+                count("serial_frames_corrupt")
+                position += 1
+
+        del buffer[:position]
+        return self._assemble(records, text, received_at)
+
+    def _parse_text(
+        self,
+        buffer: bytearray,
+        start: int,
+        end: int,
+        received_at: float,
+        out: List[Tuple[str, float, float]],
+        *,
+        partial: bool,
+    ) -> int:
+        """Parse the complete lines in ``buffer[start:end]`` and return where parsing stopped.
+
+        With ``partial`` an unterminated last line is left in the buffer
+        (unless it is implausibly long); otherwise it is dropped.
+        """
+
+        segment = bytes(buffer[start:end])
+        stop = end
+        if partial:
+            newline = segment.rfind(b"\n")
+            tail = len(segment) - newline - 1
+            if tail <= MAX_LINE:
+                segment = segment[:newline + 1]
+                stop = start + newline + 1
+        lines = segment.split(b"\n")
+        if not partial and lines and lines[-1].strip():
+            self.skipped_bytes += len(lines.pop())
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue  # the text firmware pads every loop with empty lines
+            parsed = parse_line(line.decode("utf-8", errors="replace"))
+            if parsed is not None:
+                out.append((parsed[0], parsed[1], received_at))
+        return stop
+
+    def _assemble(
+        self, records: List[np.ndarray], text: List[Tuple[str, float, float]], received_at: float
+    ) -> DecodedFrames:
+        frames = np.concatenate(records) if records else np.empty(0, dtype=FRAME_DTYPE)
+        seq = frames["seq"].astype(np.int64)
+        gaps: List[Tuple[int, int]] = []
+        if len(seq):
+            previous = np.concatenate([[seq[0] - 1 if self._last_seq is None else self._last_seq], seq[:-1]])
+            steps = (seq - previous) % _SEQ_MODULO
+            # A jump of more than half the sequence space is a restart, not loss.
+            missing = np.where((steps > 1) & (steps < _SEQ_MODULO // 2), steps - 1, 0)
+            for index in np.flatnonzero(missing):
+                gaps.append((int(previous[index]), int(missing[index])))
+            lost = int(missing.sum())
+            self.lost += lost
+            self.frames += len(seq)
+            self._last_seq = int(seq[-1])
+            count("serial_frames", len(seq))
+            if lost:
+                count("serial_frames_lost", lost)
+        return DecodedFrames(
+            seq=seq,
+            timestamps=self._host_times(frames["device_ms"], received_at),
+            values=frames["values"].reshape(len(frames), len(CHANNELS)),
+            text=text,
+            gaps=gaps,
+        )
+
+    def _host_times(self, device_ms: np.ndarray, received_at: float) -> np.ndarray:
+        if not len(device_ms):
+            return np.empty(0)
+        ms = device_ms.astype(np.int64)
+        previous = np.concatenate([[ms[0] if self._last_ms is None else self._last_ms], ms[:-1]])
+        # Unwrap the 32-bit millisecond counter (it rolls over every ~49.7 days).
+        wraps = self._wraps + np.cumsum(previous - ms > _MS_MODULO // 2)
+        self._wraps = int(wraps[-1])
+        self._last_ms = int(ms[-1])
+        seconds = (ms + wraps * _MS_MODULO) / 1e3
+        if self._anchor is None or abs(self._anchor + seconds[-1] - received_at) > self.max_skew:
+            # The newest frame was read just now; anchor the device clock there.
+            self._anchor = received_at - seconds[-1]
+        return self._anchor + seconds
+
+
+def read_frames(port, decoder: Optional[FrameDecoder] = None) -> Iterator[DecodedFrames]:
+    """Yield decoded batches from a ``serial.Serial`` port until it is closed.
+
+    Every read takes all bytes the driver already holds (at least one,
+    waiting up to the port's timeout), so a busy link is drained in a few
+    large reads instead of one ``readline()`` per value.
+    """
+
+    decoder = decoder or FrameDecoder()
+    while port.is_open:
+        data = port.read(port.in_waiting or 1)
+        if not data:
+            continue
+        batch = decoder.feed(data)
+        if len(batch):
+            yield batch
+
+
+__all__ = [
+    "CHANNELS",
+    "DecodedFrames",
+    "FRAME_DTYPE",
+    "FRAME_SIZE",
+    "FRAME_VERSION",
+    "FrameDecoder",
+    "PAYLOAD_LENGTH",
+    "SYNC",
+    "encode_frames",
+    "frame_crc",
+    "parse_line",
+    "read_frames",
+]
@@ -0,0 +1,454 @@
+"""Bulk export and import of sensor history.
+
+``export`` streams a time range of every requested sensor out of Redis into
+an export directory of chunked columnar files::
+
+    export/
+        manifest.json
+        HeartRate/00000.npy
+        HeartRate/00001.npy
+        Temp/00000.npy
+
+Chunks are ``.npy`` files holding :data:`~server.timeseries.RAW_DTYPE`
+records (the same ``(timestamp, value)`` layout Redis stores), compressed
+``.npz`` archives with ``timestamp`` and ``value`` arrays, or ``.parquet``
+files with the same two columns when ``pyarrow`` is installed.  ``.npy``
+chunks can be memory-mapped, which is what :class:`ml.dataset.RedisSensorDataset`
+uses to train from an export without touching Redis.
+
+``import`` loads an export directory, single chunk files, or wide CSV/XLSX
+tables (one column per sensor plus an optional ``timestamp`` column, like
+``data/Simulated_Data.xlsx``) back into Redis through
+:meth:`~server.redis.SensorLogStore.bulk_push_columns`, which writes every
+batch in one pipeline.
+
+Usage::
+
+    python -m server.history_io export out/ --sensors HeartRate Temp --since 86400
+    python -m server.history_io import out/
+    python -m server.history_io import data/Simulated_Data.xlsx --interval 1
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from numbers import Number
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from server.redis import SensorLogStore
+from server.timeseries import RAW_DTYPE
+
+try:  # pragma: no cover - optional dependency
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pq = None
+
+FORMATS = ("npy", "npz", "parquet")
+MANIFEST = "manifest.json"
+DEFAULT_SENSORS = ("HeartRate", "Temp", "AccelX", "AccelY", "AccelZ")
+TIMESTAMP_COLUMNS = ("timestamp", "ts", "time")
+
+PathLike = Union[str, Path]
+
+
+@dataclass
+class Throughput:
+    """Readings and bytes moved by one export or import run."""
+
+    readings: int = 0
+    nbytes: int = 0
+    seconds: float = 0.0
+
+    def report(self, verb: str) -> str:
+        seconds = max(self.seconds, 1e-9)
+        return (
+            f"{verb} {self.readings:,} readings ({self.nbytes / 1e6:.1f} MB) in {self.seconds:.2f}s: "
+            f"{self.readings / seconds:,.0f} readings/s, {self.nbytes / 1e6 / seconds:.1f} MB/s"
+        )
+
+
+def _require_pyarrow() -> None:
+    if pq is None:
+        raise ImportError(
+            "The `pyarrow` package is required for Parquet files. Install it with `pip install pyarrow`."
+        )
+
+
+def write_chunk(path: Path, timestamps: np.ndarray, values: np.ndarray, fmt: str) -> Path:
+    """Write one chunk in ``fmt`` to ``path`` (the suffix is added) and return its path."""
+
+    path = path.with_suffix(f".{fmt}")
+    if fmt == "npy":
+        records = np.empty(len(values), dtype=RAW_DTYPE)
+        records["timestamp"] = timestamps
+        records["value"] = values
+        np.save(path, records)
+    elif fmt == "npz":
+        np.savez_compressed(path, timestamp=timestamps, value=values)
+    elif fmt == "parquet":
+        _require_pyarrow()
+        pq.write_table(pa.table({"timestamp": timestamps, "value": values}), path)
+    else:
+        raise ValueError(f"format must be one of {FORMATS}, got {fmt!r}")
+    return path
+
+
+def read_chunk(path: PathLike, *, mmap: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """Return ``(timestamps, values)`` of a chunk written by :func:`write_chunk`.
+
+    ``.npy`` chunks are memory-mapped unless ``mmap`` is false, so the
+    returned arrays are views that only page in what is actually read.
+    """
+
+    path = Path(path)
+    if path.suffix == ".npy":
+        records = np.load(path, mmap_mode="r" if mmap else None)
+        return records["timestamp"], records["value"]
+    if path.suffix == ".npz":
+        with np.load(path) as archive:
+            return archive["timestamp"], archive["value"]
+    if path.suffix == ".parquet":
+        _require_pyarrow()
+        table = pq.read_table(path, columns=["timestamp", "value"])
+        return table.column("timestamp").to_numpy(), table.column("value").to_numpy()
+    raise ValueError(f"Unsupported chunk file: {path}")
+
+
+def read_manifest(directory: PathLike) -> dict:
+    with open(Path(directory) / MANIFEST, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def export_history(
+    store: SensorLogStore,
+    directory: PathLike,
+    sensors: Sequence[str],
+    start: float,
+    end: float,
+    *,
+    fmt: str = "npy",
+    chunk_size: int = 100_000,
+    device: Optional[str] = None,
+) -> Throughput:
+    """Stream ``[start, end]`` of every sensor of ``device`` into chunk files under ``directory``."""
+
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}, got {fmt!r}")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest: Dict[str, object] = {"format": fmt, "start": start, "end": end, "device": device, "sensors": {}}
+    stats = Throughput()
+    began = time.perf_counter()
+
+    for sensor in sensors:
+        sensor_dir = directory / sensor
+        sensor_dir.mkdir(exist_ok=True)
+        chunks: List[str] = []
+        rows = 0
+        for index, (timestamps, values) in enumerate(store.iter_range(sensor, start, end, chunk_size, device=device)):
+            path = write_chunk(sensor_dir / f"{index:05d}", timestamps, values, fmt)
+            chunks.append(str(path.relative_to(directory)))
+            rows += len(values)
+            stats.nbytes += path.stat().st_size
+        manifest["sensors"][sensor] = {"rows": rows, "chunks": chunks}
+        stats.readings += rows
+
+    with open(directory / MANIFEST, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2)
+    stats.seconds = time.perf_counter() - began
+    return stats
+
+
+def load_series(
+    directory: PathLike, sensor: str, limit: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the last ``limit`` ``(timestamps, values)`` of ``sensor`` from an export directory.
+
+    Only the trailing chunks needed to cover ``limit`` are opened, and
+    ``.npy`` chunks are memory-mapped, so a window of a large export costs
+    roughly the bytes it contains.
+    """
+
+    entry = read_manifest(directory)["sensors"].get(sensor)
+    if not entry or not entry["chunks"]:
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+
+    times: List[np.ndarray] = []
+    parts: List[np.ndarray] = []
+    remaining = limit
+    for chunk in reversed(entry["chunks"]):
+        timestamps, values = read_chunk(Path(directory) / chunk)
+        if remaining is not None:
+            keep = slice(max(len(values) - remaining, 0), None)
+            timestamps, values = timestamps[keep], values[keep]
+            remaining -= len(values)
+        times.append(timestamps)
+        parts.append(values)
+        if remaining == 0:
+            break
+    return (
+        np.concatenate(times[::-1]).astype(np.float64, copy=False),
+        np.concatenate(parts[::-1]).astype(np.float64, copy=False),
+    )
+
+
+def load_values(directory: PathLike, sensor: str, limit: Optional[int] = None) -> np.ndarray:
+    """Values-only shortcut for :func:`load_series`."""
+
+    return load_series(directory, sensor, limit)[1]
+
+
+Columns = Tuple[List[str], np.ndarray, np.ndarray]
+"""``(names, values, timestamps)`` ready for ``bulk_push_columns``."""
+
+
+def _iter_export(directory: Path, batch_size: int) -> Iterator[Columns]:
+    manifest = read_manifest(directory)
+    for sensor, entry in manifest["sensors"].items():
+        for chunk in entry["chunks"]:
+            yield from _iter_chunk(directory / chunk, sensor, batch_size)
+
+
+def _iter_chunk(path: Path, sensor: str, batch_size: int) -> Iterator[Columns]:
+    timestamps, values = read_chunk(path)
+    for offset in range(0, len(values), batch_size):
+        window = slice(offset, offset + batch_size)
+        count = len(values[window])
+        yield [sensor] * count, np.asarray(values[window]), np.asarray(timestamps[window])
+
+
+def _to_epoch(value: object) -> float:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return _to_epoch(datetime.fromisoformat(str(value)))
+
+
+def _is_number(value: object) -> bool:
+    if isinstance(value, Number):
+        return True
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _table_rows(rows: Iterator[Sequence[object]]) -> Tuple[List[Optional[str]], Iterator[Sequence[object]]]:
+    """Find the header of a wide table and return it with the data rows.
+
+    The header is the first row of text cells directly followed by a row of
+    numbers, which skips titles and summary blocks such as the parameter
+    table at the top of ``Simulated_Data.xlsx``.
+    """
+
+    header: Optional[List[Optional[str]]] = None
+    for row in rows:
+        cells = [cell for cell in row if cell not in (None, "")]
+        if header is not None:
+            # Timestamp cells may be ISO strings; every other cell must be numeric.
+            data_cells = [
+                cell
+                for name, cell in zip(header, row)
+                if cell not in (None, "") and (name or "").lower() not in TIMESTAMP_COLUMNS
+            ]
+            if data_cells and all(_is_number(cell) for cell in data_cells):
+
+                def data() -> Iterator[Sequence[object]]:
+                    yield row
+                    yield from rows
+
+                return header, data()
+        if cells and all(isinstance(cell, str) and not _is_number(cell) for cell in cells):
+            header = [str(cell).strip() if cell not in (None, "") else None for cell in row]
+        else:
+            header = None
+    raise ValueError("No table with a header row followed by numeric rows was found")
+
+
+def _iter_table(
+    rows: Iterator[Sequence[object]], batch_size: int, start: float, interval: float
+) -> Iterator[Columns]:
+    """Turn a wide table into column batches, one reading per sensor cell."""
+
+    header, data = _table_rows(rows)
+    time_col = next((i for i, name in enumerate(header) if name and name.lower() in TIMESTAMP_COLUMNS), None)
+    sensor_cols = [(i, name) for i, name in enumerate(header) if name and i != time_col]
+
+    names: List[str] = []
+    values: List[float] = []
+    timestamps: List[float] = []
+    for line, row in enumerate(data):
+        if not any(cell not in (None, "") for cell in row):
+            break
+        moment = _to_epoch(row[time_col]) if time_col is not None else start + line * interval
+        for i, name in sensor_cols:
+            cell = row[i] if i < len(row) else None
+            if cell in (None, "") or not _is_number(cell):
+                continue
+            names.append(name)
+            values.append(float(cell))
+            timestamps.append(moment)
+        if len(names) >= batch_size:
+            yield names, np.asarray(values), np.asarray(timestamps)
+            names, values, timestamps = [], [], []
+    if names:
+        yield names, np.asarray(values), np.asarray(timestamps)
+
+
+def _csv_rows(path: Path) -> Iterator[List[str]]:
+    with open(path, "r", encoding="utf-8", newline="") as fh:
+        sample = fh.read(4096)
+        fh.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=",\t;")
+        for row in csv.reader(fh, dialect):
+            yield [cell.strip() for cell in row]
+
+
+def _xlsx_rows(path: Path) -> Iterator[Sequence[object]]:
+    try:
+        import openpyxl
+    except ImportError as exc:  # pragma: no cover - optional dependency
+        raise ImportError(
+            "The `openpyxl` package is required to import .xlsx files. Install it with `pip install openpyxl`."
+        ) from exc
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def iter_source(
+    path: PathLike,
+    *,
+    batch_size: int = 50_000,
+    sensor: Optional[str] = None,
+    start: Optional[float] = None,
+    interval: float = 1.0,
+) -> Iterator[Columns]:
+    """Yield column batches from an export directory or a single file.
+
+    Parameters
+    ----------
+    path:
+        Export directory, ``.npy``/``.npz``/``.parquet`` chunk, ``.csv``/``.tsv``
+        or ``.xlsx`` table.
+    batch_size:
+        Maximum readings per yielded batch.
+    sensor:
+        Sensor name for a single chunk file; defaults to its parent directory.
+    start, interval:
+        Timestamp of the first row and spacing in seconds for tables without
+        a ``timestamp`` column.  ``start`` defaults to ``now - rows * interval``
+        so the last row lands at the current time.
+    """
+
+    path = Path(path)
+    if path.is_dir():
+        return _iter_export(path, batch_size)
+    suffix = path.suffix.lower()
+    if suffix in (".npy", ".npz", ".parquet"):
+        return _iter_chunk(path, sensor or path.parent.name, batch_size)
+    if suffix in (".csv", ".tsv", ".txt"):
+        if start is None:
+            with open(path, "r", encoding="utf-8") as fh:
+                start = time.time() - sum(1 for _ in fh) * interval
+        return _iter_table(_csv_rows(path), batch_size, start, interval)
+    if suffix in (".xlsx", ".xlsm"):
+        if start is None:
+            start = time.time() - sum(1 for _ in _xlsx_rows(path)) * interval
+        return _iter_table(_xlsx_rows(path), batch_size, start, interval)
+    raise ValueError(f"Unsupported input: {path}")
+
+
+def import_history(
+    store: SensorLogStore, batches: Iterator[Columns], device: Optional[str] = None
+) -> Throughput:
+    """Push every batch for ``device`` with one pipelined ``bulk_push_columns`` call each."""
+
+    stats = Throughput()
+    began = time.perf_counter()
+    for names, values, timestamps in batches:
+        stats.readings += store.bulk_push_columns(names, values.tolist(), timestamps.tolist(), device)
+        stats.nbytes += values.nbytes + timestamps.nbytes
+    stats.seconds = time.perf_counter() - began
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export sensor history from Redis or import it back.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Write a time range to chunked columnar files.")
+    export.add_argument("directory")
+    export.add_argument("--sensors", nargs="+", default=list(DEFAULT_SENSORS))
+    export.add_argument("--start", type=float, help="Unix start time (default: --since seconds ago).")
+    export.add_argument("--end", type=float, help="Unix end time (default: now).")
+    export.add_argument("--since", type=float, default=86400.0, help="Range length when --start is omitted.")
+    export.add_argument("--format", choices=FORMATS, default="npy")
+    export.add_argument("--chunk-size", type=int, default=100_000, help="Readings per chunk file.")
+    export.add_argument("--device", help="Device whose readings are exported (default: device-less keys).")
+
+    load = commands.add_parser("import", help="Bulk-load an export, chunk file, CSV or XLSX into Redis.")
+    load.add_argument("path")
+    load.add_argument("--batch-size", type=int, default=50_000, help="Readings per pipelined write.")
+    load.add_argument("--sensor", help="Sensor name for a single chunk file.")
+    load.add_argument("--start", type=float, help="Timestamp of the first table row.")
+    load.add_argument("--interval", type=float, default=1.0, help="Seconds between table rows.")
+    load.add_argument("--device", help="Device the readings are stored under (default: device-less keys).")
+
+    args = parser.parse_args()
+    store = SensorLogStore()
+
+    if args.command == "export":
+        end = time.time() if args.end is None else args.end
+        start = end - args.since if args.start is None else args.start
+        stats = export_history(
+            store,
+            args.directory,
+            args.sensors,
+            start,
+            end,
+            fmt=args.format,
+            chunk_size=args.chunk_size,
+            device=args.device,
+        )
+        print(stats.report("Exported"))
+    else:
+        batches = iter_source(
+            args.path, batch_size=args.batch_size, sensor=args.sensor, start=args.start, interval=args.interval
+        )
+        print(import_history(store, batches, args.device).report("Imported"))
+
+
+__all__ = [
+    "FORMATS",
+    "Throughput",
+    "export_history",
+    "import_history",
+    "iter_source",
+    "load_series",
+    "load_values",
+    "read_chunk",
+    "read_manifest",
+    "write_chunk",
+]
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
+
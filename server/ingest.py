@@ -0,0 +1,197 @@
+"""Request body decoding for the ``/receive`` endpoint.
+
+Gateways can upload readings in two shapes:
+
+* the original row format, a list of objects::
+
+      [{"sensor_name": "Temp", "sensor_output": 29.1}, ...]
+
+* a column-oriented batch, which is far cheaper to build and parse for large
+  uploads::
+
+      {"names": ["Temp", "HeartRate"], "values": [29.1, 72], "timestamps": [1718000000.2, 1718000000.2]}
+
+  ``timestamps`` (Unix seconds) is optional; missing entries are stamped
+  with the time the batch was received.
+
+Readings may name the wearable they come from: ``device_id`` on a row,
+``"device"`` for a whole columnar batch or a parallel ``"devices"`` list.
+The ``X-Device-Id`` request header is the fallback for readings without
+one, and readings without any device use the single-wearable keys.
+
+Bodies are JSON by default (parsed with ``orjson`` when it is installed) or
+MessagePack when the request uses ``Content-Type: application/msgpack``, and
+may be gzip-compressed with ``Content-Encoding: gzip``.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, List, Optional
+
+from server.devices import check_device_id
+
+try:  # pragma: no cover - optional speedup
+    import orjson
+except ImportError:  # pragma: no cover - fall back to the standard library
+    orjson = None
+
+try:  # pragma: no cover - optional binary format
+    import msgpack
+except ImportError:  # pragma: no cover - handled at runtime
+    msgpack = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+MAX_DECOMPRESSED_BYTES = 64 * 1024 * 1024
+"""Refuse compressed bodies that inflate beyond this size."""
+
+MAX_TIMESTAMP = 4_102_444_800.0
+"""2100-01-01 in Unix seconds; later timestamps are almost always milliseconds."""
+
+
+class IngestError(ValueError):
+    """Raised when a request body cannot be turned into readings."""
+
+
+@dataclass
+class ColumnBatch:
+    """Readings of one upload as parallel columns."""
+
+    names: List[str]
+    values: List[float]
+    timestamps: List[float]
+    skipped: int = 0
+    devices: Optional[List[Optional[str]]] = None
+    """Device of each reading, or ``None`` when the batch names no device at all."""
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+def decompress(body: bytes, content_encoding: Optional[str]) -> bytes:
+    """Undo a ``gzip`` (or ``deflate``) ``Content-Encoding``."""
+
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding in ("", "identity"):
+        return body
+    if encoding not in ("gzip", "x-gzip", "deflate"):
+        raise IngestError(f"Unsupported Content-Encoding: {content_encoding}")
+
+    # wbits=47 auto-detects gzip and zlib headers.
+    inflater = zlib.decompressobj(wbits=47)
+    try:
+        data = inflater.decompress(body, MAX_DECOMPRESSED_BYTES)
+    except zlib.error as exc:
+        raise IngestError(f"Invalid {encoding} body: {exc}") from exc
+    if inflater.unconsumed_tail:
+        raise IngestError("Decompressed body is too large")
+    return data
+
+
+def decode_body(body: bytes, content_type: Optional[str], content_encoding: Optional[str] = None) -> Any:
+    """Parse ``body`` according to its ``Content-Type`` and ``Content-Encoding``."""
+
+    body = decompress(body, content_encoding)
+    media_type = (content_type or "application/json").split(";", 1)[0].strip().lower()
+    if media_type in MSGPACK_TYPES:
+        if msgpack is None:
+            raise IngestError("MessagePack bodies require the `msgpack` package on the server")
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as exc:
+            raise IngestError(f"Invalid MessagePack body: {exc}") from exc
+
+    try:
+        return orjson.loads(body) if orjson is not None else json.loads(body)
+    except ValueError as exc:
+        raise IngestError(f"Invalid JSON body: {exc}") from exc
+
+
+def _to_epoch(timestamp: Any) -> float:
+    if isinstance(timestamp, str):
+        parsed = datetime.fromisoformat(timestamp)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    return float(timestamp)
+
+
+def to_columns(
+    payload: Any, *, received_at: Optional[float] = None, device: Optional[str] = None
+) -> ColumnBatch:
+    """Normalise either upload shape into a :class:`ColumnBatch`.
+
+    ``device`` applies to readings that do not name their own.  Rows without
+    a sensor name or value, with a NaN or infinite value, a timestamp
+    outside ``[0, MAX_TIMESTAMP]``, or an unusable device id, are dropped
+    and counted in ``skipped``.
+    """
+
+    received_at = time.time() if received_at is None else received_at
+
+    if isinstance(payload, dict) and "names" in payload:
+        names = payload["names"]
+        values = payload.get("values")
+        timestamps = payload.get("timestamps")
+        devices = payload.get("devices")
+        if not isinstance(names, list) or not isinstance(values, list) or len(values) != len(names):
+            raise IngestError("Columnar batches need 'names' and 'values' lists of equal length")
+        if timestamps is None or timestamps == []:
+            timestamps = [None] * len(names)
+        elif not isinstance(timestamps, list) or len(timestamps) != len(names):
+            raise IngestError("'timestamps' must be a list as long as 'names'")
+        if devices is None or devices == []:
+            devices = [payload.get("device", device)] * len(names)
+        elif not isinstance(devices, list) or len(devices) != len(names):
+            raise IngestError("'devices' must be a list as long as 'names'")
+        rows = zip(names, values, timestamps, devices)
+    elif isinstance(payload, list):
+        rows = (
+            (row.get("sensor_name"), row.get("sensor_output"), row.get("timestamp"), row.get("device_id", device))
+            if isinstance(row, dict)
+            else (None, None, None, None)
+            for row in payload
+        )
+    else:
+        raise IngestError("Expected a list of JSON objects or a columnar batch")
+
+    batch = ColumnBatch([], [], [])
+    devices = []
+    for name, value, timestamp, reading_device in rows:
+        if name is None or value is None:
+            batch.skipped += 1
+            continue
+        try:
+            value = float(value)
+            timestamp = received_at if timestamp is None else _to_epoch(timestamp)
+            if reading_device is not None:
+                reading_device = check_device_id(str(reading_device))
+        except (TypeError, ValueError):
+            batch.skipped += 1
+            continue
+        if not (math.isfinite(value) and 0.0 <= timestamp <= MAX_TIMESTAMP):
+            batch.skipped += 1
+            continue
+        batch.names.append(str(name))
+        batch.values.append(value)
+        batch.timestamps.append(timestamp)
+        devices.append(reading_device)
+    if any(d is not None for d in devices):
+        batch.devices = devices
+    return batch
+
+
+__all__ = [
+    "ColumnBatch",
+    "IngestError",
+    "MAX_TIMESTAMP",
+    "decode_body",
+    "decompress",
+    "to_columns",
+]
@@ -0,0 +1,357 @@
+"""Cached fleet aggregate behind the live dashboards.
+
+One background thread per worker reads the recent history of every device
+in a single pipelined round trip (:meth:`SensorLogStore.fetch_recent_fleet`)
+each ``interval`` seconds, scores it with :class:`ml.detectors.Cascade`
+and keeps a compact snapshot::
+
+    {"version": "3f9a1c2e-42", "time": 1717171717.5, "devices": {
+        "wearable-07": {"status": "warning", "score": 0.62, "sensor": "Temp",
+                        "ts": 1717171717.0,
+                        "values": {"HeartRate": 74.1, "Temp": 34.9, ...},
+                        "statuses": {"HeartRate": "normal", "Temp": "warning", ...}}}}
+
+``status`` is ``"danger"`` when the cascade flags an anomaly (uncertain
+windows are decided by the model against its calibrated threshold when the
+cascade has one), ``"warning"`` in the uncertain band otherwise and
+``"normal"`` below it; a device takes the status of its worst sensor.
+``score`` is the classical score of that sensor.  Readings without a device
+appear under the empty id ``""``, which no real device id can take.
+
+Every refresh that changes something also produces a delta holding only the
+changed fields (keys that disappeared map to ``null``), which
+:func:`event_stream` pushes as server-sent events.  Snapshots and deltas are
+serialised once per version and shared by every subscriber, so however many
+dashboards are open Redis sees one read per interval per worker.  The
+thread pauses after ``idle_after`` seconds without requests or subscribers.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from ml.detectors import Cascade, CascadeResult
+from server import metrics
+from server.redis import SensorLogStore
+
+SENSORS = ("HeartRate", "Temp", "AccelX", "AccelY", "AccelZ")
+DEFAULT_DEVICE = ""
+"""Name under which readings stored without a device are reported.
+
+Device ids are at least one character long (see :mod:`server.devices`), so
+this can never collide with a real device.
+"""
+
+RETRY_MS = 3000
+"""Reconnect delay suggested to ``EventSource`` clients."""
+
+Event = Tuple[str, str, str]
+"""``(id, event, data)`` of one server-sent event."""
+
+_SEVERITY = {"normal": 0, "warning": 1, "danger": 2}
+
+_MISSING = object()
+
+
+def diff(old: Mapping[str, Any], new: Mapping[str, Any]) -> Dict[str, Any]:
+    """Fields of ``new`` that differ from ``old``, recursing into nested dicts.
+
+    Keys missing from ``new`` map to ``None``; merging the result into
+    ``old`` (with ``None`` deleting) yields ``new``.
+    """
+
+    changes: Dict[str, Any] = {}
+    for key, value in new.items():
+        before = old.get(key, _MISSING)
+        if isinstance(value, dict) and isinstance(before, dict):
+            nested = diff(before, value)
+            if nested:
+                changes[key] = nested
+        elif value != before:
+            changes[key] = value
+    for key in old.keys() - new.keys():
+        changes[key] = None
+    return changes
+
+
+def _dumps(payload: Any) -> str:
+    return json.dumps(payload, separators=(",", ":"))
+
+
+class LiveAggregate:
+    """Periodically refreshed snapshot of every device's latest readings.
+
+    Parameters
+    ----------
+    store:
+        Store to read from; its connection pool is only used by the
+        refresh thread.
+    sensors:
+        Sensors shown on the dashboards.
+    interval:
+        Seconds between refreshes while someone is watching.
+    limit:
+        Readings per sensor fed to the detectors.
+    history:
+        Deltas kept for clients resuming with ``Last-Event-ID``; older
+        clients receive a fresh snapshot instead.
+    idle_after:
+        Stop polling Redis this many seconds after the last request when no
+        stream is open.
+    """
+
+    def __init__(
+        self,
+        store: SensorLogStore,
+        *,
+        sensors: Sequence[str] = SENSORS,
+        interval: float = 1.0,
+        limit: int = 32,
+        history: int = 128,
+        idle_after: float = 60.0,
+        cascade: Optional[Cascade] = None,
+    ) -> None:
+        self._store = store
+        self.sensors = tuple(sensors)
+        self.interval = interval
+        self.limit = limit
+        self.idle_after = idle_after
+        self.cascade = cascade or Cascade()
+
+        # Versions restart with every process; the epoch tells a resuming
+        # client that its Last-Event-ID came from another worker.
+        self._epoch = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._devices: Dict[str, dict] = {}
+        self._snapshot_json = _dumps({"version": self.event_id(0), "time": None, "devices": {}})
+        self._deltas: Deque[Tuple[int, str]] = deque(maxlen=history)
+        self._refreshed: Optional[float] = None
+        self._changed = threading.Condition()
+
+        self._subscribers = 0
+        self._demand = time.monotonic()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> "LiveAggregate":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="live-aggregate", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if self._subscribers == 0 and time.monotonic() - self._demand > self.idle_after:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            try:
+                self.refresh()
+            except Exception as exc:  # keep serving the last snapshot
+                metrics.count("live_refresh_errors")
+                print(f"Live aggregate refresh failed: {exc}")
+            self._stop.wait(self.interval)
+
+    def _touch(self) -> None:
+        self._demand = time.monotonic()
+        self._wake.set()
+
+    # ------------------------------------------------------------------
+    # Refreshing
+    # ------------------------------------------------------------------
+    def refresh(self) -> None:
+        """Read and score the fleet once and publish a delta if anything changed."""
+
+        with metrics.span("live.refresh"):
+            devices: List[Optional[str]] = [None, *self._store.devices()]
+            histories = self._store.fetch_recent_fleet(self.sensors, devices, limit=self.limit)
+            current = self._summarise(histories)
+
+        with self._changed:
+            self._refreshed = time.monotonic()
+            delta = diff(self._devices, current)
+            if delta or self._version == 0:
+                self._version += 1
+                self._devices = current
+                event_id = self.event_id(self._version)
+                self._snapshot_json = _dumps({"version": event_id, "time": time.time(), "devices": current})
+                self._deltas.append((self._version, _dumps({"version": event_id, "devices": delta})))
+            self._changed.notify_all()
+
+    def _summarise(self, histories: Mapping[Optional[str], Mapping[str, list]]) -> Dict[str, dict]:
+        windows = {
+            device: {name: [r.sensor_output for r in readings] for name, readings in by_sensor.items() if readings}
+            for device, by_sensor in histories.items()
+        }
+        windows = {device: by_sensor for device, by_sensor in windows.items() if by_sensor}
+        if not windows:
+            return {}
+
+        summary: Dict[str, dict] = {}
+        for device, results in self.cascade.score_fleet(windows).items():
+            latest = {name: histories[device][name][-1] for name in results}
+            statuses = {name: self._status(result) for name, result in results.items()}
+            worst = max(results.values(), key=lambda result: (_SEVERITY[statuses[result.sensor]], result.classical))
+            summary[DEFAULT_DEVICE if device is None else device] = {
+                "status": statuses[worst.sensor],
+                "score": round(worst.classical, 2),
+                "sensor": worst.sensor,
+                "ts": round(max(r.timestamp.timestamp() for r in latest.values()), 3),
+                "values": {name: round(r.sensor_output, 2) for name, r in latest.items()},
+                "statuses": statuses,
+            }
+        return summary
+
+    def _status(self, result: CascadeResult) -> str:
+        if result.anomaly:
+            return "danger"
+        if result.classical >= self.cascade.lower:
+            return "warning"
+        return "normal"
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    def event_id(self, version: int) -> str:
+        return f"{self._epoch}-{version}"
+
+    def _parse_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        epoch, _, version = (event_id or "").partition("-")
+        if epoch != self._epoch or not version.isdigit():
+            return None
+        return int(version)
+
+    def snapshot(self, timeout: Optional[float] = None) -> Tuple[str, str]:
+        """``(event id, JSON)`` of the current snapshot.
+
+        When the aggregate was idle, waits up to ``timeout`` (default two
+        intervals) for a fresh refresh first.
+        """
+
+        self._touch()
+        timeout = 2 * self.interval if timeout is None else timeout
+        with self._changed:
+            self._changed.wait_for(self._fresh, timeout)
+            return self.event_id(self._version), self._snapshot_json
+
+    def _fresh(self) -> bool:
+        return self._refreshed is not None and time.monotonic() - self._refreshed < 2 * self.interval
+
+    def updates(self, last_event_id: Optional[str], timeout: float) -> List[Event]:
+        """Events bringing a client at ``last_event_id`` up to date.
+
+        Blocks up to ``timeout`` seconds for a new version and returns an
+        empty list if none arrived.  Clients without a usable id get a
+        ``snapshot`` event, all others the ``delta`` events they missed.
+        """
+
+        self._touch()
+        version = self._parse_event_id(last_event_id)
+        if version is None or version > self._version:
+            event_id, data = self.snapshot()
+            return [(event_id, "snapshot", data)]
+
+        with self._changed:
+            self._changed.wait_for(lambda: self._version != version, timeout)
+        return self.backlog(last_event_id)
+
+    def backlog(self, last_event_id: Optional[str]) -> List[Event]:
+        """Events a client at ``last_event_id`` has missed, without waiting.
+
+        Like :meth:`updates`, but returns at once and never waits for a fresh
+        snapshot, so it is safe to call from an event loop.
+        """
+
+        version = self._parse_event_id(last_event_id)
+        with self._changed:
+            if version == self._version:
+                return []
+            oldest = self._deltas[0][0] if self._deltas else self._version + 1
+            if version is None or version > self._version or version < oldest - 1:
+                return [(self.event_id(self._version), "snapshot", self._snapshot_json)]
+            return [(self.event_id(v), "delta", data) for v, data in self._deltas if v > version]
+
+    def subscribe(self) -> None:
+        with self._changed:
+            self._subscribers += 1
+        metrics.count("live_subscriptions")
+        self._touch()
+
+    def unsubscribe(self) -> None:
+        with self._changed:
+            self._subscribers -= 1
+
+    @property
+    def subscribers(self) -> int:
+        return self._subscribers
+
+
+def default_aggregate(store: SensorLogStore, *, interval: float = 1.0) -> LiveAggregate:
+    """The aggregate the dashboards use: exported artifacts only, so torch is never imported."""
+
+    from ml.runtime import load_default_model
+
+    cascade = Cascade(load_model=lambda: load_default_model(checkpoint=False))
+    return LiveAggregate(store, interval=interval, cascade=cascade)
+
+
+def format_event(event: Event) -> str:
+    """One server-sent event on the wire."""
+
+    event_id, name, data = event
+    return f"id: {event_id}\nevent: {name}\ndata: {data}\n\n"
+
+
+def event_stream(
+    aggregate: LiveAggregate, last_event_id: Optional[str] = None, *, keepalive: float = 15.0
+) -> Iterator[str]:
+    """Server-sent events for one dashboard: a snapshot, then deltas.
+
+    A comment is sent every ``keepalive`` seconds without changes so proxies
+    keep the connection open and a closed client is noticed.
+    """
+
+    aggregate.subscribe()
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        event_id = last_event_id
+        while True:
+            events = aggregate.updates(event_id, keepalive)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            for event in events:
+                yield format_event(event)
+            event_id = events[-1][0]
+    finally:
+        aggregate.unsubscribe()
+
+
+__all__ = [
+    "DEFAULT_DEVICE",
+    "Event",
+    "LiveAggregate",
+    "RETRY_MS",
+    "SENSORS",
+    "default_aggregate",
+    "diff",
+    "event_stream",
+    "format_event",
+]
@@ -1,32 +1,19 @@
-from serial_to_JSON import serial_to_JSON
-from w2db import write2redis
-from vibrate import start_vibes, ping_server
-import serial
-import time
-import requests
-
+from server.frames import read_frames
+from server.w2db import write_columns
+from server.vibrate import start_vibes, ping_server
+import serial, time
 def main():
-    '''RUN AND READ HERE'''
+    '''RUN AND READ HERE
+
+    Uses the same bulk frame decoder as ``server.serial_to_JSON``, so both
+    gateways read the port identically.
+    '''
     ser = serial.Serial("/dev/ttyACM0", 115200, timeout=1)
-    while True:
-        line = ser.readline().decode("utf-8").strip()
-        if not line:
-            continue
-        else:
-            jsonline = serial_to_JSON(line)
-        if jsonline:
-            write2redis(jsonline)
-            
-        ser = serial.Serial("/dev/ttyAMA0", 11520, timeout=1)
-        time.sleep(2)
-        
+    motor = serial.Serial("/dev/ttyAMA0", 11520, timeout=1)
+    for batch in read_frames(ser):
+        for last_seq, missing in batch.gaps:
+            print(f"Lost {missing} frame(s) after sequence {last_seq}")
+        write_columns(*batch.columns())
         server_comf = ping_server("http://vibrator.d3llie.tech/vibrate")
-        if server_comf:
-            print("YAYYY IT WORKED")
-            start_vibes(ser)
-            time.sleep(2)
-        else:
-            print("It fr fr worked")
-            pass
-main()
-
+        if server_comf: print("YAYYY IT WORKED"); start_vibes(motor); time.sleep(2)
+        else: print("It fr fr worked")
@@ -0,0 +1,486 @@
+"""In-process metrics and span timing for ingest, storage and scoring.
+
+Hot paths wrap their work in :func:`span` (or decorate it with
+:func:`timed`), which records the duration into the
+``sensor_operation_seconds`` histogram and counts failures in
+``sensor_operation_errors_total``, both labelled by operation name:
+
+==================  ==================================================
+``serial.parse``    one ``Name:value`` line from the Arduino
+``upload``          one gateway POST to ``/receive``, retries included
+``receive``         one ``/receive`` request on the server
+``redis.write``     :meth:`SensorLogStore.bulk_push_columns`
+``redis.<read>``    ``fetch_recent``, ``fetch_range``, ``fetch_rollup`` ...
+``live.refresh``     one dashboard aggregate refresh (:mod:`server.live`)
+``model.load``      loading a checkpoint or inference artifact
+``model.forward``   one batched forward pass
+``llm.call``        one chat model request of the agent
+``tool.<name>``     one agent tool call
+==================  ==================================================
+
+Other events are tallied with :func:`count`, and current levels such as
+the gateway spool depth are :class:`Gauge` values set by their owner.
+:func:`render` produces the
+Prometheus text format served by ``/metrics`` in :mod:`server.server`.
+Recording costs one lock and a bisect per observation, cheap enough to stay
+on in production.
+
+Every process records into its own registry.  With several gunicorn workers
+set ``SENSOR_METRICS_DIR`` (``python -m server.serve`` does): each process
+then writes its registry to ``<dir>/<pid>.json`` every
+``SENSOR_METRICS_FLUSH`` seconds and at exit, and :func:`render` sums the
+counters and histograms of every file, so whichever worker answers a scrape
+reports the whole server.  Files of exited workers keep counting, so totals
+never go backwards; their gauges are dropped.
+
+Setting ``SENSOR_TRACE`` additionally logs every span with its parent as
+one JSON line, to stderr for ``SENSOR_TRACE=1`` or appended to the file it
+names otherwise; :func:`set_tracing` changes this at runtime.
+"""
+
+from __future__ import annotations
+
+import functools
+import inspect
+import itertools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple, TypeVar
+
+F = TypeVar("F", bound=Callable)
+
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+"""Histogram upper bounds in seconds, from 100µs serial parses to slow LLM calls."""
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def state(self) -> list:
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+    def merge(self, state: list) -> None:
+        with self._lock:
+            for labels, value in state:
+                labels = tuple(labels)
+                self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def samples(self) -> Iterator[Tuple[str, Sequence[str], LabelValues, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in sorted(items):
+            yield self.name, self.labelnames, labels, value
+
+
+class Gauge:
+    """Value that can go up and down, with optional labels."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    # Gauges of several processes add up, like the counters.
+    state = Counter.state
+    merge = Counter.merge
+
+    def samples(self) -> Iterator[Tuple[str, Sequence[str], LabelValues, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in sorted(items):
+            yield self.name, self.labelnames, labels, value
+
+
+class Histogram:
+    """Fixed-bucket histogram with optional labels.
+
+    Buckets are stored non-cumulatively so an observation touches a single
+    slot; :meth:`samples` accumulates them for the exposition format.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            slots = self._values.get(labels)
+            if slots is None:
+                slots = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            slots[index] += 1
+            slots[-1] += value
+
+    def count(self, *labels: str) -> int:
+        slots = self._values.get(labels)
+        return int(sum(slots[:-1])) if slots else 0
+
+    def total(self, *labels: str) -> float:
+        slots = self._values.get(labels)
+        return slots[-1] if slots else 0.0
+
+    def state(self) -> list:
+        with self._lock:
+            return [[list(labels), list(slots)] for labels, slots in self._values.items()]
+
+    def merge(self, state: list) -> None:
+        with self._lock:
+            for labels, slots in state:
+                labels = tuple(labels)
+                mine = self._values.get(labels)
+                if mine is None:
+                    self._values[labels] = list(slots)
+                else:
+                    self._values[labels] = [a + b for a, b in zip(mine, slots)]
+
+    def samples(self) -> Iterator[Tuple[str, Sequence[str], LabelValues, float]]:
+        with self._lock:
+            items = [(labels, list(slots)) for labels, slots in self._values.items()]
+        bucket_names = self.labelnames + ("le",)
+        for labels, slots in sorted(items):
+            cumulative = itertools.accumulate(slots[:-1])
+            for bound, value in zip(self.buckets + (math.inf,), cumulative):
+                yield f"{self.name}_bucket", bucket_names, labels + (_format_bound(bound),), value
+            yield f"{self.name}_sum", self.labelnames, labels, slots[-1]
+            yield f"{self.name}_count", self.labelnames, labels, sum(slots[:-1])
+
+
+class Registry:
+    """Named collection of metrics, rendered together by :meth:`render`."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, **kwargs)
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with a different type or labels")
+            return metric
+
+    def state(self) -> dict:
+        """JSON-serialisable values of every metric, for :meth:`merge` in another process."""
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {
+            metric.name: {"kind": metric.kind, "help": metric.help, "labels": list(metric.labelnames),
+                          "values": metric.state()}
+            for metric in metrics
+        }
+
+    def merge(self, state: dict, *, gauges: bool = True) -> None:
+        """Add the values of another registry's :meth:`state` to this one."""
+
+        kinds = {"counter": self.counter, "gauge": self.gauge, "histogram": self.histogram}
+        for name, metric in state.items():
+            if metric["kind"] == "gauge" and not gauges:
+                continue
+            kinds[metric["kind"]](name, metric["help"], metric["labels"]).merge(metric["values"])
+
+    def render(self) -> str:
+        """Prometheus text exposition of every metric."""
+
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, names, labels, value in metric.samples():
+                lines.append(f"{sample}{_format_labels(names, labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: LabelValues) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+REGISTRY = Registry()
+
+OPERATION_SECONDS = REGISTRY.histogram(
+    "sensor_operation_seconds", "Duration of instrumented operations.", ("operation",)
+)
+OPERATION_ERRORS = REGISTRY.counter(
+    "sensor_operation_errors_total", "Instrumented operations that raised an exception.", ("operation",)
+)
+EVENTS = REGISTRY.counter("sensor_events_total", "Counted events such as readings written.", ("event",))
+
+
+# ----------------------------------------------------------------------
+# Several processes
+# ----------------------------------------------------------------------
+METRICS_DIR = os.getenv("SENSOR_METRICS_DIR")
+"""Directory shared by the workers of one server, or ``None`` for per-process metrics."""
+
+FLUSH_INTERVAL = float(os.getenv("SENSOR_METRICS_FLUSH", "5"))
+
+
+def _state_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def write_state() -> None:
+    """Write this process's registry to ``SENSOR_METRICS_DIR`` for the other workers' scrapes."""
+
+    path = _state_path(os.getpid())
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(REGISTRY.state(), fh)
+    os.replace(tmp, path)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merged() -> Registry:
+    merged = Registry()
+    merged.merge(REGISTRY.state())
+    for name in os.listdir(METRICS_DIR):
+        stem, ext = os.path.splitext(name)
+        if ext != ".json" or not stem.isdigit() or int(stem) == os.getpid():
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name), encoding="utf-8") as fh:
+                state = json.load(fh)
+        except (OSError, ValueError):
+            continue  # replaced or removed while we were reading it
+        merged.merge(state, gauges=_alive(int(stem)))
+    return merged
+
+
+def _flush_forever() -> None:
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            write_state()
+        except OSError as exc:
+            print(f"Could not write metrics to {METRICS_DIR}: {exc}")
+
+
+def _start_flushing() -> None:
+    import atexit
+
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    threading.Thread(target=_flush_forever, name="metrics-flush", daemon=True).start()
+    atexit.register(write_state)
+
+
+if METRICS_DIR:
+    _start_flushing()
+
+
+# ----------------------------------------------------------------------
+# Tracing
+# ----------------------------------------------------------------------
+_current_span: ContextVar[Optional[int]] = ContextVar("sensor_span", default=None)
+_span_ids = itertools.count(1)
+_trace_lock = threading.Lock()
+_trace_target: Optional[str] = None
+_trace_file = None
+
+
+def set_tracing(target: Optional[str]) -> None:
+    """Log spans to stderr (``"1"``/``"stderr"``), append them to a file path, or stop (``None``)."""
+
+    global _trace_target, _trace_file
+    with _trace_lock:
+        if _trace_file is not None:
+            _trace_file.close()
+        _trace_file = None
+        _trace_target = target or None
+        if _trace_target is not None and _trace_target not in ("1", "stderr", "true"):
+            # One line-buffered handle for the life of the process.
+            _trace_file = open(_trace_target, "a", encoding="utf-8", buffering=1)
+
+
+def _emit(record: dict) -> None:
+    line = json.dumps(record, default=str)
+    with _trace_lock:
+        if _trace_file is not None:
+            _trace_file.write(line + "\n")
+        elif _trace_target is not None:
+            print(line, file=sys.stderr)
+
+
+set_tracing(os.getenv("SENSOR_TRACE"))
+
+
+# ----------------------------------------------------------------------
+# Recording helpers
+# ----------------------------------------------------------------------
+@contextmanager
+def span(operation: str, **attributes) -> Iterator[None]:
+    """Time the enclosed block as ``operation``; ``attributes`` only go to the trace."""
+
+    tracing = _trace_target is not None
+    if tracing:
+        span_id = next(_span_ids)
+        parent = _current_span.get()
+        token = _current_span.set(span_id)
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        OPERATION_SECONDS.observe(elapsed, operation)
+        if failed:
+            OPERATION_ERRORS.inc(1, operation)
+        if tracing:
+            _current_span.reset(token)
+            record = {"span": operation, "id": span_id, "parent": parent, "start": time.time() - elapsed,
+                      "ms": round(elapsed * 1e3, 3), "error": failed}
+            record.update(attributes)
+            _emit(record)
+
+
+def timed(operation: str) -> Callable[[F], F]:
+    """Decorator form of :func:`span` for plain and ``async`` functions."""
+
+    def decorate(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(operation):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _trace_target is not None:
+                with span(operation):
+                    return func(*args, **kwargs)
+            # Untraced fast path: this wraps per-line serial parsing.
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except BaseException:
+                OPERATION_ERRORS.inc(1, operation)
+                raise
+            finally:
+                OPERATION_SECONDS.observe(time.perf_counter() - started, operation)
+
+        return wrapper
+
+    return decorate
+
+
+def count(event: str, amount: float = 1.0) -> None:
+    """Add ``amount`` to the ``sensor_events_total`` counter of ``event``."""
+
+    EVENTS.inc(amount, event)
+
+
+def render() -> str:
+    """Prometheus text of this process, or of every worker when ``SENSOR_METRICS_DIR`` is set."""
+
+    if not METRICS_DIR:
+        return REGISTRY.render()
+    write_state()
+    return _merged().render()
+
+
+__all__ = [
+    "CONTENT_TYPE",
+    "Counter",
+    "EVENTS",
+    "Gauge",
+    "Histogram",
+    "LATENCY_BUCKETS",
+    "METRICS_DIR",
+    "OPERATION_ERRORS",
+    "OPERATION_SECONDS",
+    "REGISTRY",
+    "Registry",
+    "count",
+    "render",
+    "set_tracing",
+    "span",
+    "timed",
+    "write_state",
+]
@@ -7,19 +7,45 @@ class that knows how to push and retrieve JSON encoded readings.
 """
 
 import json
+import math
 import os
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Iterable, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
 
 try:  # pragma: no cover - optional dependency for documentation builds
     import redis
+    import redis.asyncio
+    import redis.asyncio.cluster
+    import redis.cluster
 except ImportError as exc:  # pragma: no cover - handled at runtime
     raise ImportError(
         "The `redis` package is required to use server.redis. Install it via\n"
         "`pip install redis` on your development machine."
     ) from exc
 
+from server.devices import check_device_id, registry_key, sensor_key
+from server.metrics import count, span, timed
+from server.rollups import (
+    MERGE_SCRIPT,
+    RAW_RETENTION,
+    TIERS,
+    RollupBucket,
+    RollupTier,
+    choose_tier,
+    group_by_sensor,
+    merge_args,
+    parse_member,
+    tier_key,
+)
+from server.timeseries import fill_gaps, pack_raw, raw_key, resample, unpack_raw
+
+Timestamp = Union[datetime, float, int]
+Series = Tuple[np.ndarray, np.ndarray]
+Devices = Union[None, str, Sequence[Optional[str]]]
+
 
 @dataclass
 class SensorReading:
@@ -51,9 +77,19 @@ class SensorReading:
 
     @classmethod
     def from_json( cls, payload: str, sensor_name : str) -> "SensorReading":
-        """Restore a :class:`SensorReading` from its JSON representation."""
+        """Restore a :class:`SensorReading` from its JSON representation.
+
+        Entries written by :meth:`to_json` carry their own timestamp; older
+        entries that only hold the bare value are stamped with the read time.
+        """
         data = json.loads(payload)
-        print(f"DATA: {data}")
+        if isinstance(data, dict):
+            timestamp = datetime.fromisoformat(data["timestamp"])
+            return cls(
+                sensor_name=sensor_name,
+                sensor_output=float(data["sensor_output"]),
+                timestamp=timestamp,
+            )
         # timestamp = datetime.fromisoformat(data["timestamp"]).astimezone(timezone.utc)
         timestamp = datetime.now()
         return cls(
@@ -67,8 +103,15 @@ class SensorLogStore:
     """High level wrapper around Redis lists used for sensor history.
 
     Each sensor is stored under a dedicated Redis key following the pattern
-    ``"{namespace}:{sensor_name}"``.  New readings are pushed to the head of
-    the list so that ``LRANGE`` can quickly return the most recent values.
+    ``"{namespace}{sensor_name}"``, or ``"{namespace}{<device>}:{sensor_name}"``
+    for readings of a specific device (see :mod:`server.devices`).  New
+    readings are pushed to the head of the list so that ``LRANGE`` can
+    quickly return the most recent values.  A sorted set ``"{key}:ts"``
+    indexes the same readings by timestamp for range queries, and
+    downsampled rollups live next to it under ``"{key}:rollup:{tier}"``.
+
+    Every read method takes an optional ``device``; ``None`` addresses the
+    device-less keys of a single-wearable deployment.
     """
 
     def __init__(
@@ -79,14 +122,333 @@ class SensorLogStore:
     ) -> None:
         self._redis = redis_client or create_redis_client()
         self._namespace = namespace
+        self._merge_rollup = self._redis.register_script(MERGE_SCRIPT)
+        if isinstance(self._redis, redis.cluster.RedisCluster):
+            # Pipelined EVALSHA cannot recover from NOSCRIPT on a cluster
+            # node, so load the rollup script on every primary up front.
+            self._redis.script_load(MERGE_SCRIPT)
 
     # ------------------------------------------------------------------
     # Redis connection helpers
     # ------------------------------------------------------------------
-    def _key(self, sensor_name: str) -> str:
-        return f"{self._namespace}{sensor_name}"
+    def _key(self, sensor_name: str, device: Optional[str] = None) -> str:
+        return sensor_key(sensor_name, device, self._namespace)
+
+    def devices(self) -> List[str]:
+        """Ids of every device that has written readings, sorted."""
+        return sorted(member.decode() for member in self._redis.smembers(registry_key(self._namespace)))
+
+    def clear(self, batch_size: int = 1000) -> int:
+        """Delete every key under this store's namespace and return how many were removed.
+
+        Refuses to run without a namespace, which would wipe the whole database.
+        """
+        if not self._namespace:
+            raise ValueError("clear() needs a namespaced store")
+        removed = 0
+        keys: List[bytes] = []
+        for key in self._redis.scan_iter(match=f"{self._namespace}*", count=batch_size):
+            keys.append(key)
+            if len(keys) >= batch_size:
+                removed += self._redis.delete(*keys)
+                keys = []
+        if keys:
+            removed += self._redis.delete(*keys)
+        return removed
+
+    def bulk_push(self, readings: Iterable[SensorReading], device: Optional[str] = None) -> int:
+        """Append ``readings`` to their sensor lists in one pipelined round trip.
+
+        Returns the number of readings written.
+        """
+        names, values, timestamps = [], [], []
+        for reading in readings:
+            timestamp = reading.timestamp
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            names.append(reading.sensor_name)
+            values.append(reading.sensor_output)
+            timestamps.append(timestamp.timestamp())
+        return self.bulk_push_columns(names, values, timestamps, device)
+
+    @timed("redis.write")
+    def bulk_push_columns(
+        self,
+        names: Sequence[str],
+        values: Sequence[float],
+        timestamps: Sequence[float],
+        devices: Devices = None,
+    ) -> int:
+        """Column-oriented variant of :meth:`bulk_push`.
+
+        ``timestamps`` are Unix seconds.  ``devices`` is one device id for
+        the whole batch or one per reading (``None`` entries use the
+        device-less keys).  Readings are grouped per device and sensor so
+        each series costs a single multi-value ``LPUSH`` no matter how large
+        the batch is, and no :class:`SensorReading` objects are created.  The
+        same round trip indexes the readings by time, trims the raw history
+        to ``RAW_RETENTION`` readings and folds the batch into every rollup
+        tier (see :mod:`server.rollups`).  NaN and infinite readings are
+        dropped and not counted as written.
+        """
+        if devices is None:
+            keys = [self._key(name) for name in names]
+            fleet = set()
+        elif isinstance(devices, str):
+            keys = [self._key(name, check_device_id(devices)) for name in names]
+            fleet = {devices}
+        else:
+            fleet = {check_device_id(device) for device in set(devices) if device is not None}
+            keys = [self._key(name, device) for name, device in zip(names, devices)]
+        sensor_of = dict(zip(keys, names))
+        grouped = group_by_sensor(keys, values, timestamps)
+        if not grouped:
+            return 0
+
+        pipe = self._redis.pipeline(transaction=False)
+        if fleet:
+            pipe.sadd(registry_key(self._namespace), *fleet)
+        for key, (sensor_values, sensor_times) in grouped.items():
+            name = sensor_of[key]
+            entries = [_encode_entry(name, v, t) for v, t in zip(sensor_values, sensor_times)]
+            # LPUSH inserts its arguments left to right, so the last (newest)
+            # reading of the batch ends up at the head of the list.
+            pipe.lpush(key, *entries)
+            pipe.ltrim(key, 0, RAW_RETENTION - 1)
+            pipe.zadd(raw_key(key), dict(zip(pack_raw(sensor_values, sensor_times), sensor_times)))
+            pipe.zremrangebyrank(raw_key(key), 0, -RAW_RETENTION - 1)
+            for tier in TIERS:
+                self._merge_rollup(
+                    keys=[tier_key(key, tier)],
+                    args=merge_args(sensor_values, sensor_times, tier),
+                    client=pipe,
+                )
+        pipe.execute()
+        written = sum(len(sensor_values) for sensor_values, _ in grouped.values())
+        count("readings_written", written)
+        return written
+
+    @timed("redis.fetch_rollup")
+    def fetch_rollup(
+        self,
+        sensor_name: str,
+        start: float,
+        end: float,
+        tier: RollupTier,
+        device: Optional[str] = None,
+    ) -> List[RollupBucket]:
+        """Return the ``tier`` buckets of ``sensor_name`` overlapping ``[start, end]``."""
+        first_bucket = math.floor(start / tier.seconds) * tier.seconds
+        members = self._redis.zrangebyscore(tier_key(self._key(sensor_name, device), tier), first_bucket, end)
+        return [parse_member(member) for member in members]
+
+    def fetch_history(
+        self,
+        sensor_name: str,
+        start: float,
+        end: float,
+        resolution: Optional[float] = None,
+        device: Optional[str] = None,
+    ) -> List[RollupBucket]:
+        """Return the history of ``sensor_name`` between two Unix timestamps.
+
+        The coarsest rollup tier whose buckets are no wider than
+        ``resolution`` seconds is used, so long ranges transfer a few
+        aggregates instead of every raw reading.  Without a resolution (or
+        when it is finer than one second), and for series without rollups,
+        raw readings are returned as single-reading buckets.
+        """
+        tier = choose_tier(resolution)
+        if tier is not None:
+            buckets = self.fetch_rollup(sensor_name, start, end, tier, device)
+            if buckets or self._redis.exists(tier_key(self._key(sensor_name, device), tier)):
+                return buckets
+
+        timestamps, values = self.fetch_range(sensor_name, start, end, device=device)
+        return [
+            RollupBucket(float(moment), 1, float(value), float(value), float(value))
+            for moment, value in zip(timestamps, values)
+        ]
 
-    def fetch_recent(self, sensor_name: str, limit: int = 256) -> List[SensorReading]:
+    @timed("redis.fetch_range")
+    def fetch_range(
+        self,
+        sensors: Union[str, Sequence[str]],
+        start: Timestamp,
+        end: Timestamp,
+        step: Optional[float] = None,
+        agg: str = "mean",
+        fill: Optional[str] = None,
+        device: Optional[str] = None,
+    ) -> Union[Series, Dict[str, Series]]:
+        """Return readings between ``start`` and ``end`` as NumPy arrays.
+
+        Parameters
+        ----------
+        sensors:
+            One sensor name, or several to fetch in the same round trip.
+        start, end:
+            Inclusive range as Unix seconds or datetimes.
+        step:
+            Resample onto a regular grid of this many seconds.  The coarsest
+            rollup tier no wider than ``step`` is read instead of raw data
+            whenever one exists.  Series without rollups (such as the
+            ``:anomaly`` scores written by :meth:`replace_range`) are
+            resampled from their raw readings.  ``None`` returns the raw
+            readings.
+        agg:
+            How readings inside a grid cell are combined: ``"mean"``,
+            ``"sum"``, ``"min"``, ``"max"``, ``"count"`` or ``"last"``.
+            Rollup buckets keep no latest value, so ``"last"`` always
+            resamples the raw readings.
+        fill:
+            ``None`` leaves empty cells as ``NaN``; ``"ffill"`` carries the
+            previous value forward and ``"linear"`` interpolates.
+        device:
+            Device the sensors belong to.
+
+        Returns
+        -------
+        ``(timestamps, values)`` for a single sensor name, otherwise a dict
+        mapping every sensor to its pair.
+        """
+        names = [sensors] if isinstance(sensors, str) else list(sensors)
+        start, end = _epoch(start), _epoch(end)
+        tier = choose_tier(step) if agg != "last" else None
+
+        pipe = self._redis.pipeline(transaction=False)
+        for name in names:
+            if tier is None:
+                pipe.zrangebyscore(raw_key(self._key(name, device)), start, end)
+            else:
+                first_bucket = math.floor(start / tier.seconds) * tier.seconds
+                pipe.zrangebyscore(tier_key(self._key(name, device), tier), first_bucket, end)
+                pipe.exists(tier_key(self._key(name, device), tier))
+        replies = pipe.execute()
+
+        if tier is None:
+            raw, rolled = dict(zip(names, replies)), {}
+        else:
+            rolled = {name: members for name, members, exists in zip(names, replies[::2], replies[1::2]) if exists}
+            raw = {}
+            missing = [name for name in names if name not in rolled]
+            if missing:
+                pipe = self._redis.pipeline(transaction=False)
+                for name in missing:
+                    pipe.zrangebyscore(raw_key(self._key(name, device)), start, end)
+                raw = dict(zip(missing, pipe.execute()))
+
+        series: Dict[str, Series] = {}
+        for name in names:
+            if name in raw:
+                timestamps, values = unpack_raw(raw[name])
+                if step is None:
+                    series[name] = (timestamps, values)
+                    continue
+                counts, totals, minima, maxima = np.ones_like(values), values, values, values
+            else:
+                buckets = [parse_member(member) for member in rolled[name]]
+                timestamps = np.array([b.start for b in buckets], dtype=np.float64)
+                counts = np.array([b.count for b in buckets], dtype=np.float64)
+                totals = np.array([b.total for b in buckets], dtype=np.float64)
+                minima = np.array([b.minimum for b in buckets], dtype=np.float64)
+                maxima = np.array([b.maximum for b in buckets], dtype=np.float64)
+
+            grid, resampled = resample(
+                timestamps, counts, totals, minima, maxima, start=start, end=end, step=step, agg=agg
+            )
+            series[name] = (grid, fill_gaps(grid, resampled, fill))
+
+        return series[names[0]] if isinstance(sensors, str) else series
+
+    def iter_range(
+        self,
+        sensor_name: str,
+        start: Timestamp,
+        end: Timestamp,
+        chunk_size: int = 100_000,
+        device: Optional[str] = None,
+    ) -> Iterator[Series]:
+        """Yield the raw readings between ``start`` and ``end`` in time-ordered chunks.
+
+        Each chunk is one ``ZRANGEBYSCORE ... LIMIT`` round trip of at most
+        ``chunk_size`` readings, so arbitrarily long ranges can be streamed
+        without holding them in memory.
+        """
+        key = raw_key(self._key(sensor_name, device))
+        low, end = _epoch(start), _epoch(end)
+        offset = 0
+        while True:
+            with span("redis.iter_range"):
+                members = self._redis.zrangebyscore(key, low, end, start=offset, num=chunk_size)
+            if not members:
+                return
+            timestamps, values = unpack_raw(members)
+            yield timestamps, values
+            if len(members) < chunk_size:
+                return
+            # Resume at the last timestamp, skipping the readings already sent.
+            last = timestamps[-1]
+            tail = int(np.count_nonzero(timestamps == last))
+            offset = offset + tail if last == low else tail
+            low = float(last)
+
+    def fetch_before(
+        self, sensor_name: str, moment: Timestamp, limit: int, device: Optional[str] = None
+    ) -> Series:
+        """The last ``limit`` raw readings strictly before ``moment``, in chronological order.
+
+        Used to give the first windows of a range their full history.
+        """
+        if limit <= 0:
+            return np.empty(0), np.empty(0)
+        key = raw_key(self._key(sensor_name, device))
+        members = self._redis.zrevrangebyscore(key, f"({_epoch(moment)!r}", "-inf", start=0, num=limit)
+        timestamps, values = unpack_raw(reversed(members))
+        return timestamps, values
+
+    @timed("redis.replace_range")
+    def replace_range(
+        self,
+        sensor_name: str,
+        timestamps: Sequence[float],
+        values: Sequence[float],
+        start: Timestamp,
+        end: Timestamp,
+        device: Optional[str] = None,
+    ) -> int:
+        """Replace the indexed readings of ``sensor_name`` in ``[start, end]`` with new ones.
+
+        Only the time index is written (no raw list or rollups), in one
+        ``MULTI`` round trip, so rewriting a derived series such as
+        backfilled anomaly scores is idempotent and readers never see half
+        a range.  The result is read back with :meth:`fetch_range`.
+        """
+        key = raw_key(self._key(sensor_name, device))
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.zremrangebyscore(key, _epoch(start), _epoch(end))
+        if len(timestamps):
+            # Plain floats: redis-py encodes NumPy scalars with their repr.
+            scores = np.asarray(timestamps, dtype=np.float64).tolist()
+            pipe.zadd(key, dict(zip(pack_raw(values, timestamps), scores)))
+        pipe.execute()
+        count("readings_replaced", len(timestamps))
+        return len(timestamps)
+
+    def fetch_range_readings(
+        self, sensor_name: str, start: Timestamp, end: Timestamp, device: Optional[str] = None
+    ) -> List[SensorReading]:
+        """Like :meth:`fetch_range` without resampling, as :class:`SensorReading` objects."""
+        timestamps, values = self.fetch_range(sensor_name, start, end, device=device)
+        return [
+            SensorReading(sensor_name, float(value), datetime.fromtimestamp(moment, tz=timezone.utc))
+            for moment, value in zip(timestamps, values)
+        ]
+
+    @timed("redis.fetch_recent")
+    def fetch_recent(
+        self, sensor_name: str, limit: int = 256, device: Optional[str] = None
+    ) -> List[SensorReading]:
         """Return the most recent readings for ``sensor_name``.
 
         Parameters
@@ -95,27 +457,207 @@ class SensorLogStore:
             Identifier for the desired sensor.
         limit:
             Maximum number of readings to return.
+        device:
+            Device the sensor belongs to.
         """
-        for key in self._redis.scan_iter("user:*"):
-            print(key)
-        raw_entries = self._redis.lrange(self._key(sensor_name), 0, limit - 1)
-        print(raw_entries)
-        readings = [SensorReading.from_json( entry.decode("utf-8"), sensor_name) for entry in raw_entries]
-        # Redis returns items in reverse chronological order because we push to
-        # the head of the list.  Reverse them so downstream code sees
-        # chronological sequences.
-        return list(reversed(readings))
+        raw_entries = self._redis.lrange(self._key(sensor_name, device), 0, limit - 1)
+        return _decode_entries(raw_entries, sensor_name)
 
+    @timed("redis.fetch_recent_fleet")
+    def fetch_recent_fleet(
+        self,
+        sensor_names: Iterable[str],
+        devices: Optional[Iterable[str]] = None,
+        limit: int = 256,
+    ) -> Dict[str, Dict[str, List[SensorReading]]]:
+        """Recent readings of every sensor on every device, in one pipelined round trip.
+
+        ``devices`` defaults to the registered fleet (:meth:`devices`).  On a
+        cluster the pipeline is split per node, and each node still answers
+        all of its devices at once.
+        """
+        devices = self.devices() if devices is None else list(devices)
+        sensor_names = list(sensor_names)
+        pipe = self._redis.pipeline(transaction=False)
+        for device in devices:
+            for name in sensor_names:
+                pipe.lrange(self._key(name, device), 0, limit - 1)
+        return _group_fleet(devices, sensor_names, pipe.execute())
+
+
+class AsyncSensorLogStore:
+    """``asyncio`` counterpart of :class:`SensorLogStore` for event loops.
+
+    Reads go through a shared ``redis.asyncio`` connection pool so that many
+    concurrent coroutines reuse a handful of sockets instead of blocking the
+    loop on a synchronous client.
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional["redis.asyncio.Redis"] = None,
+        *,
+        namespace: str = "",
+    ) -> None:
+        self._redis = redis_client or create_async_redis_client()
+        self._namespace = namespace
+
+    def _key(self, sensor_name: str, device: Optional[str] = None) -> str:
+        return sensor_key(sensor_name, device, self._namespace)
+
+    async def devices(self) -> List[str]:
+        """Ids of every device that has written readings, sorted."""
+
+        members = await self._redis.smembers(registry_key(self._namespace))
+        return sorted(member.decode() for member in members)
+
+    @timed("redis.fetch_recent")
+    async def fetch_recent(
+        self, sensor_name: str, limit: int = 256, device: Optional[str] = None
+    ) -> List[SensorReading]:
+        """Return the most recent readings for ``sensor_name`` in chronological order."""
+
+        raw_entries = await self._redis.lrange(self._key(sensor_name, device), 0, limit - 1)
+        return _decode_entries(raw_entries, sensor_name)
+
+    @timed("redis.fetch_recent_many")
+    async def fetch_recent_many(
+        self, sensor_names: Iterable[str], limit: int = 256, device: Optional[str] = None
+    ) -> Dict[str, List[SensorReading]]:
+        """Fetch the history of several sensors in a single pipelined round trip."""
+
+        sensor_names = list(sensor_names)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for name in sensor_names:
+                pipe.lrange(self._key(name, device), 0, limit - 1)
+            results = await pipe.execute()
+        return {
+            name: _decode_entries(raw_entries, name)
+            for name, raw_entries in zip(sensor_names, results)
+        }
+
+    @timed("redis.fetch_recent_fleet")
+    async def fetch_recent_fleet(
+        self,
+        sensor_names: Iterable[str],
+        devices: Optional[Iterable[str]] = None,
+        limit: int = 256,
+    ) -> Dict[str, Dict[str, List[SensorReading]]]:
+        """Async counterpart of :meth:`SensorLogStore.fetch_recent_fleet`."""
+
+        devices = await self.devices() if devices is None else list(devices)
+        sensor_names = list(sensor_names)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for device in devices:
+                for name in sensor_names:
+                    pipe.lrange(self._key(name, device), 0, limit - 1)
+            results = await pipe.execute()
+        return _group_fleet(devices, sensor_names, results)
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
 
-def create_redis_client() -> "redis.Redis":
-    """Create a Redis client using environment variables for configuration."""
 
-    host = os.getenv("REDIS_HOST", "localhost")
-    port = int(os.getenv("REDIS_PORT", "6379"))
-    db = int(os.getenv("REDIS_DB", "0"))
-    password = os.getenv("REDIS_PASSWORD")
+def _group_fleet(
+    devices: List[str], sensor_names: List[str], results: List[List[bytes]]
+) -> Dict[str, Dict[str, List[SensorReading]]]:
+    replies = iter(results)
+    return {
+        device: {name: _decode_entries(next(replies), name) for name in sensor_names}
+        for device in devices
+    }
 
-    return redis.Redis(host=host, port=port, db=db, password=password, decode_responses=False, username="default")
+
+def _epoch(timestamp: Timestamp) -> float:
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.timestamp()
+    return float(timestamp)
+
+
+def _encode_entry(sensor_name: str, sensor_output: float, timestamp: float) -> str:
+    # Same layout as ``SensorReading.to_json`` without building the dataclass.
+    return json.dumps(
+        {
+            "sensor_name": sensor_name,
+            "sensor_output": float(sensor_output),
+            "timestamp": datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat(),
+        }
+    )
+
+
+def _decode_entries(raw_entries: Iterable[bytes], sensor_name: str) -> List[SensorReading]:
+    readings = [SensorReading.from_json(entry.decode("utf-8"), sensor_name) for entry in raw_entries]
+    # Redis returns items in reverse chronological order because we push to
+    # the head of the list.  Reverse them so downstream code sees
+    # chronological sequences.
+    return list(reversed(readings))
+
+
+def _connection_settings() -> dict:
+    return {
+        "host": os.getenv("REDIS_HOST", "localhost"),
+        "port": int(os.getenv("REDIS_PORT", "6379")),
+        "db": int(os.getenv("REDIS_DB", "0")),
+        "password": os.getenv("REDIS_PASSWORD"),
+        "username": "default",
+        "socket_keepalive": True,
+        "health_check_interval": 30,
+    }
+
+
+def _cluster_mode() -> bool:
+    return os.getenv("REDIS_CLUSTER", "").lower() in ("1", "true", "yes")
+
+
+def _cluster_settings() -> dict:
+    settings = _connection_settings()
+    # Cluster nodes only have database 0, and health checks are per node.
+    settings.pop("db")
+    settings.pop("health_check_interval")
+    return settings
+
+
+def create_redis_client(max_connections: Optional[int] = None) -> "redis.Redis":
+    """Create a Redis client using environment variables for configuration.
+
+    The client owns a bounded connection pool shared by all threads of the
+    process.  redis-py pools notice when they are used from a forked child
+    and reconnect, but each web worker should still create its own client
+    after the fork (see ``server.server.get_log_store``).
+
+    With ``REDIS_CLUSTER=1`` a :class:`redis.cluster.RedisCluster` is
+    returned instead, seeded from ``REDIS_HOST``/``REDIS_PORT`` and with
+    ``max_connections`` per node; the device hash tags of
+    :mod:`server.devices` keep each device's keys on one slot.
+    """
+
+    if max_connections is None:
+        max_connections = int(os.getenv("REDIS_MAX_CONNECTIONS", "16"))
+    if _cluster_mode():
+        return redis.cluster.RedisCluster(max_connections=max_connections, **_cluster_settings())
+    pool = redis.ConnectionPool(
+        max_connections=max_connections,
+        decode_responses=False,
+        **_connection_settings(),
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+def create_async_redis_client(max_connections: Optional[int] = None) -> "redis.asyncio.Redis":
+    """Create a pooled ``redis.asyncio`` client configured like :func:`create_redis_client`."""
+
+    if max_connections is None:
+        max_connections = int(os.getenv("REDIS_MAX_CONNECTIONS", "16"))
+    if _cluster_mode():
+        return redis.asyncio.cluster.RedisCluster(max_connections=max_connections, **_cluster_settings())
+    pool = redis.asyncio.ConnectionPool(
+        max_connections=max_connections,
+        decode_responses=False,
+        **_connection_settings(),
+    )
+    return redis.asyncio.Redis(connection_pool=pool)
 
 
 def reading_from_dict(payload: dict) -> SensorReading:
@@ -133,8 +675,10 @@ def reading_from_dict(payload: dict) -> SensorReading:
 
 
 __all__ = [
+    "AsyncSensorLogStore",
     "SensorReading",
     "SensorLogStore",
+    "create_async_redis_client",
     "create_redis_client",
     "reading_from_dict",
 ]
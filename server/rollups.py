@@ -0,0 +1,182 @@
+"""Downsampled rollup tiers for long-range sensor history.
+
+Every ingested batch is folded into 1 second, 1 minute and 1 hour buckets
+holding ``count``, ``sum``, ``min`` and ``max``.  Each tier of a sensor is one
+Redis sorted set scored by the bucket start, so a time range is a single
+``ZRANGEBYSCORE``.  Members encode the aggregate itself::
+
+    "<bucket start>|<count>|<sum>|<min>|<max>"
+
+Batches are pre-aggregated on the client with NumPy and merged into Redis by
+a small Lua script, so one ingest costs one script call per sensor and tier
+regardless of the batch size, and concurrent writers never lose updates.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class RollupTier:
+    """One downsampling level: bucket width and how long buckets are kept."""
+
+    name: str
+    seconds: int
+    retention: float
+
+
+TIERS: Tuple[RollupTier, ...] = (
+    RollupTier("1s", 1, float(os.getenv("ROLLUP_1S_RETENTION", 2 * 86400))),
+    RollupTier("1m", 60, float(os.getenv("ROLLUP_1M_RETENTION", 60 * 86400))),
+    RollupTier("1h", 3600, float(os.getenv("ROLLUP_1H_RETENTION", 5 * 365 * 86400))),
+)
+"""Tiers from finest to coarsest; retention is in seconds."""
+
+RAW_RETENTION = int(os.getenv("RAW_RETENTION", "100000"))
+"""Maximum number of raw readings kept per sensor."""
+
+# KEYS[1]: tier key.  ARGV[1]: retention cutoff ('' to keep everything),
+# then groups of (bucket, count, sum, min, max).
+MERGE_SCRIPT = """
+local key = KEYS[1]
+for i = 2, #ARGV, 5 do
+    local bucket = ARGV[i]
+    local count = tonumber(ARGV[i + 1])
+    local total = tonumber(ARGV[i + 2])
+    local low = tonumber(ARGV[i + 3])
+    local high = tonumber(ARGV[i + 4])
+    local old = redis.call('ZRANGEBYSCORE', key, bucket, bucket)
+    if old[1] then
+        local c, s, mn, mx = string.match(old[1], '^[^|]*|([^|]*)|([^|]*)|([^|]*)|([^|]*)$')
+        count = count + tonumber(c)
+        total = total + tonumber(s)
+        low = math.min(low, tonumber(mn))
+        high = math.max(high, tonumber(mx))
+        redis.call('ZREM', key, old[1])
+    end
+    redis.call('ZADD', key, bucket, bucket .. '|' .. string.format('%d', count) .. '|' ..
+        string.format('%.17g', total) .. '|' .. string.format('%.17g', low) .. '|' ..
+        string.format('%.17g', high))
+end
+if ARGV[1] ~= '' then
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', '(' .. ARGV[1])
+end
+return #ARGV
+"""
+
+
+@dataclass
+class RollupBucket:
+    """Aggregate of every reading of one sensor inside ``[start, start + width)``."""
+
+    start: float
+    count: int
+    total: float
+    minimum: float
+    maximum: float
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else float("nan")
+
+
+def tier_key(sensor_key: str, tier: RollupTier) -> str:
+    return f"{sensor_key}:rollup:{tier.name}"
+
+
+def choose_tier(resolution: Optional[float]) -> Optional[RollupTier]:
+    """Return the coarsest tier whose buckets are no wider than ``resolution``.
+
+    ``None`` means the request is finer than every tier and must be served
+    from raw readings.
+    """
+
+    if resolution is None:
+        return None
+    chosen = None
+    for tier in TIERS:
+        if tier.seconds <= resolution:
+            chosen = tier
+    return chosen
+
+
+def aggregate(
+    values: Sequence[float], timestamps: Sequence[float], tier: RollupTier
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorised ``(bucket, count, sum, min, max)`` of one sensor's batch.
+
+    Non-finite readings are ignored: a single NaN would poison the stored
+    bucket for good once merged.
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    finite = np.isfinite(values) & np.isfinite(timestamps)
+    if not finite.all():
+        values, timestamps = values[finite], timestamps[finite]
+    buckets = np.floor(timestamps / tier.seconds).astype(np.int64) * tier.seconds
+    unique, inverse = np.unique(buckets, return_inverse=True)
+    counts = np.bincount(inverse, minlength=unique.size)
+    sums = np.bincount(inverse, weights=values, minlength=unique.size)
+    minima = np.full(unique.size, np.inf)
+    maxima = np.full(unique.size, -np.inf)
+    np.minimum.at(minima, inverse, values)
+    np.maximum.at(maxima, inverse, values)
+    return unique, counts, sums, minima, maxima
+
+
+def merge_args(values: Sequence[float], timestamps: Sequence[float], tier: RollupTier) -> List[str]:
+    """``ARGV`` for :data:`MERGE_SCRIPT` covering one sensor's batch.
+
+    Retention is measured from the newest reading of the batch rather than
+    the wall clock, so bulk-loading old history keeps its rollups.
+    """
+
+    buckets = aggregate(values, timestamps, tier)
+    newest = float(buckets[0][-1]) if buckets[0].size else 0.0
+    args = [repr(newest - tier.retention) if tier.retention > 0 else ""]
+    for bucket, count, total, low, high in zip(*buckets):
+        args.extend((str(int(bucket)), str(int(count)), repr(float(total)), repr(float(low)), repr(float(high))))
+    return args
+
+
+def parse_member(member: bytes) -> RollupBucket:
+    start, count, total, low, high = member.decode("utf-8").split("|")
+    return RollupBucket(float(start), int(count), float(total), float(low), float(high))
+
+
+def group_by_sensor(
+    names: Sequence[str], values: Sequence[float], timestamps: Sequence[float]
+) -> Dict[str, Tuple[List[float], List[float]]]:
+    """Split parallel columns into per-sensor ``(values, timestamps)``, dropping non-finite readings."""
+
+    grouped: Dict[str, Tuple[List[float], List[float]]] = {}
+    for name, value, timestamp in zip(names, values, timestamps):
+        value, timestamp = float(value), float(timestamp)
+        if not (math.isfinite(value) and math.isfinite(timestamp)):
+            continue
+        sensor_values, sensor_times = grouped.setdefault(name, ([], []))
+        sensor_values.append(value)
+        sensor_times.append(timestamp)
+    return grouped
+
+
+__all__ = [
+    "MERGE_SCRIPT",
+    "RAW_RETENTION",
+    "TIERS",
+    "RollupBucket",
+    "RollupTier",
+    "aggregate",
+    "choose_tier",
+    "group_by_sensor",
+    "merge_args",
+    "parse_member",
+    "tier_key",
+]
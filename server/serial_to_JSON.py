@@ -1,30 +1,53 @@
-import json 
-import requests
+import argparse
+import json
+import os
 import serial
 
+from server.frames import parse_line, read_frames
+from server.uploader import DEFAULT_URL, BatchUploader
+
+
 def serial_to_JSON(data):
-    try:
-        name, value = data.split(":")
-        new_data = {name.strip():str(float(value.strip()))}
-        json_str = json.dumps(new_data)
-        print(json_str)
-        return json_str
-    except ValueError:
+    parsed = parse_line(data)
+    if parsed is None:
         print(f"Skipping invalid line: {data}")
         return None
+    name, value = parsed
+    new_data = {name:str(value)}
+    json_str = json.dumps(new_data)
+    print(json_str)
+    return json_str
 
 
 
 def main() -> None:
-    """Read from the serial port and forward each measurement to the Flask app."""
-
-    ser = serial.Serial("/dev/ttyACM0", 115200, timeout=1)
-    while True:
-        line = ser.readline().decode("utf-8").strip()
-        if not line:
-            continue
-        else:
-            jsonline = serial_to_JSON(line)
-        requests.post("http://utd.d3llie.tech/recieve", json=jsonline)
-        
-main()
\ No newline at end of file
+    """Read from the serial port and forward measurements to the Flask app in batches.
+
+    Binary frames and the older ``Name:value`` text lines are both decoded
+    (see :mod:`server.frames`), draining the port in bulk reads.
+    """
+
+    parser = argparse.ArgumentParser(description="Forward serial sensor readings to /receive.")
+    parser.add_argument("--port", default="/dev/ttyACM0")
+    parser.add_argument("--url", default=DEFAULT_URL)
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between uploads.")
+    parser.add_argument("--spool", default="gateway_spool.jsonl",
+                        help="File holding readings that could not be uploaded yet.")
+    parser.add_argument("--no-gzip", action="store_true", help="Send uncompressed bodies.")
+    parser.add_argument("--device", default=os.getenv("DEVICE_ID"),
+                        help="Id of this wearable (default: $DEVICE_ID); omit for a single-device deployment.")
+    args = parser.parse_args()
+
+    ser = serial.Serial(args.port, 115200, timeout=1)
+    uploader = BatchUploader(
+        args.url, interval=args.interval, spool_path=args.spool, compress=not args.no_gzip, device=args.device
+    )
+    with uploader:
+        for batch in read_frames(ser):
+            for last_seq, missing in batch.gaps:
+                print(f"Lost {missing} frame(s) after sequence {last_seq}")
+            uploader.add_columns(*batch.columns())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Production entry point for the sensor receiver.
+
+``python server/server.py`` starts Flask's single-process development server.
+This module runs the same WSGI app under gunicorn instead: several
+pre-forked worker processes, each with a small thread pool, HTTP keep-alive
+and its own lazily created Redis connection pool.
+
+Example::
+
+    python -m server.serve --workers 4 --threads 8 --bind 0.0.0.0:5000
+
+Every option can also be set through the environment (``SERVER_WORKERS``,
+``SERVER_THREADS``, ``SERVER_BIND``, ``SERVER_KEEPALIVE``, ``SERVER_TIMEOUT``),
+which is convenient for systemd units and containers.  The workers share
+their metrics through ``SENSOR_METRICS_DIR`` (a fresh temporary directory
+unless it is set), so ``/metrics`` reports the whole server whichever worker
+answers the scrape.  ``--max-streams``
+caps the dashboard streams per worker (see ``LIVE_MAX_STREAMS`` in
+:mod:`server.server`); route ``/api/`` to :mod:`server.stream` to serve any
+number of dashboards without tying up request threads.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import multiprocessing
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+try:  # pragma: no cover - optional dependency for the production server
+    from gunicorn.app.base import BaseApplication
+except ImportError as exc:  # pragma: no cover - handled at runtime
+    raise ImportError(
+        "The `gunicorn` package is required to use server.serve. Install it via\n"
+        "`pip install gunicorn` on the serving machine."
+    ) from exc
+
+
+def default_workers() -> int:
+    """Gunicorn's usual ``2 * cores + 1`` rule of thumb."""
+
+    return multiprocessing.cpu_count() * 2 + 1
+
+
+def _post_fork(server: Any, worker: Any) -> None:
+    # Nothing should be inherited from the master, but make sure a store
+    # created before the fork (for example by an import-time health check)
+    # is never reused by a worker.
+    from server.server import reset_log_store
+
+    reset_log_store()
+
+
+class SensorServer(BaseApplication):
+    """Embed gunicorn so the app can be served with ``python -m server.serve``."""
+
+    def __init__(self, options: Optional[Dict[str, Any]] = None) -> None:
+        self.options = options or {}
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key.lower(), value)
+        self.cfg.set("post_fork", _post_fork)
+
+    def load(self):
+        from server.server import app
+
+        return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the sensor receiver with gunicorn.")
+    parser.add_argument("--bind", default=os.getenv("SERVER_BIND", "0.0.0.0:5000"),
+                        help="Address to listen on.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVER_WORKERS", default_workers())),
+                        help="Number of worker processes.")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("SERVER_THREADS", "4")),
+                        help="Request threads per worker.")
+    parser.add_argument("--max-streams", type=int, default=None,
+                        help="Open dashboard streams per worker (default: half the threads).")
+    parser.add_argument("--keepalive", type=int, default=int(os.getenv("SERVER_KEEPALIVE", "15")),
+                        help="Seconds to keep idle client connections open.")
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("SERVER_TIMEOUT", "30")),
+                        help="Seconds before a silent worker is restarted.")
+    args = parser.parse_args()
+
+    # Every open /api/stream pins a request thread; keep the rest for /receive.
+    max_streams = args.max_streams if args.max_streams is not None else max(args.threads // 2, 1)
+    os.environ["LIVE_MAX_STREAMS"] = str(min(max_streams, args.threads - 1))
+
+    # Set before the workers import server.metrics; stale files of an earlier
+    # run would otherwise be added to this one's totals.
+    metrics_dir = os.environ.setdefault("SENSOR_METRICS_DIR", tempfile.mkdtemp(prefix="sensor-metrics-"))
+    for stale in glob.glob(os.path.join(metrics_dir, "*.json")):
+        os.remove(stale)
+
+    options = {
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        # ``gthread`` serves keep-alive connections from the worker thread pool.
+        "worker_class": "gthread",
+        "keepalive": args.keepalive,
+        "timeout": args.timeout,
+        # The app is imported in every worker, never in the master, so no
+        # Redis connection can be created before the fork.
+        "preload_app": False,
+        "accesslog": "-",
+    }
+    SensorServer(options).run()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -1,13 +1,76 @@
 """Flask application that receives sensor readings and stores them in Redis."""
 from __future__ import annotations
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 import os
+import threading
+from typing import Optional
 
-from server.redis import SensorLogStore, reading_from_dict
+from server import metrics
+from server.ingest import IngestError, decode_body, to_columns
+from server.live import RETRY_MS, LiveAggregate, default_aggregate, event_stream
+from server.redis import SensorLogStore
 
 app = Flask(__name__)
-log_store = SensorLogStore()
+
+_log_store: Optional[SensorLogStore] = None
+_log_store_pid: Optional[int] = None
+_live: Optional[LiveAggregate] = None
+_live_pid: Optional[int] = None
+_live_lock = threading.Lock()
+
+DASHBOARD_ORIGIN = os.getenv("DASHBOARD_ORIGIN")
+"""Origin allowed to read ``/api/*`` from the static dashboard pages.
+
+Unset means same-origin only: the live readings are health data, so other
+sites must never be allowed to read them by default.
+"""
+
+LIVE_MAX_STREAMS = int(os.getenv("LIVE_MAX_STREAMS", "2"))
+"""Open ``/api/stream`` connections per worker.
+
+Each stream holds a request thread for as long as the dashboard is open, so
+the cap must stay below the worker's thread count to leave threads for
+``/receive`` (``python -m server.serve`` sets it to half the threads).  Serve
+the dashboards from :mod:`server.stream` instead when more than a handful
+are open.
+"""
+
+_stream_slots = threading.BoundedSemaphore(LIVE_MAX_STREAMS)
+
+
+def get_log_store() -> SensorLogStore:
+    """Return this process's :class:`SensorLogStore`, creating it on first use.
+
+    The store (and its Redis connection pool) is built lazily and rebuilt
+    whenever the process id changes, so a pre-forking server never shares
+    sockets between workers.
+    """
+
+    global _log_store, _log_store_pid
+    if _log_store is None or _log_store_pid != os.getpid():
+        _log_store = SensorLogStore()
+        _log_store_pid = os.getpid()
+    return _log_store
+
+
+def reset_log_store(store: Optional[SensorLogStore] = None) -> None:
+    """Forget the current store so the next request creates a fresh one, or serve ``store`` instead."""
+
+    global _log_store, _log_store_pid
+    _log_store = store
+    _log_store_pid = None if store is None else os.getpid()
+
+
+def get_live_aggregate() -> LiveAggregate:
+    """Return this process's dashboard aggregate, starting its refresh thread on first use."""
+
+    global _live, _live_pid
+    with _live_lock:
+        if _live is None or _live_pid != os.getpid():
+            _live = default_aggregate(get_log_store(), interval=float(os.getenv("LIVE_INTERVAL", "1.0"))).start()
+            _live_pid = os.getpid()
+        return _live
 
 
 @app.route("/")
@@ -17,36 +80,93 @@ def hp() -> str:
 @app.route("/vibrate")
 def vibrate() -> str:
 
-    out = jsonify({"anomaly_detected" : f"{os.getenv("ANOMALY_STATUS")}"}) 
-    return out 
+    out = jsonify({"anomaly_detected" : f"{os.getenv('ANOMALY_STATUS')}"})
+    return out
+
+@app.route("/metrics")
+def metrics_endpoint() -> Response:
+    """Prometheus scrape endpoint, summed over every worker when ``SENSOR_METRICS_DIR`` is set."""
+
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.after_request
+def allow_dashboards(response: Response) -> Response:
+    if DASHBOARD_ORIGIN and request.path.startswith("/api/"):
+        response.headers["Access-Control-Allow-Origin"] = DASHBOARD_ORIGIN
+    return response
+
+
+@app.route("/api/snapshot")
+def live_snapshot() -> Response:
+    """Latest values and status of every device (see :mod:`server.live`)."""
+
+    version, body = get_live_aggregate().snapshot()
+    response = Response(body, content_type="application/json")
+    response.set_etag(version)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+@app.route("/api/stream")
+def live_stream() -> Response:
+    """Server-sent events: one ``snapshot``, then ``delta`` events with changed fields only."""
+
+    if not _stream_slots.acquire(blocking=False):
+        # Dashboards fall back to /api/snapshot and try again later.
+        metrics.count("live_streams_refused")
+        response = jsonify({"error": "Too many open streams on this worker"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(RETRY_MS // 1000)
+        return response
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+    response = Response(
+        event_stream(get_live_aggregate(), last_event_id),
+        content_type="text/event-stream",
+        # ``X-Accel-Buffering`` stops nginx from holding events back.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Runs when the server closes the response, even if it never started streaming.
+    response.call_on_close(_stream_slots.release)
+    return response
+
 
 @app.route("/receive", methods=["POST"])
+@metrics.timed("receive")
 def process_json():
-    """Parse a list of sensor readings and persist them in Redis."""
+    """Parse a batch of sensor readings and persist them in Redis.
 
-    try:
-        responses = request.get_json()
+    Accepts the row or columnar formats described in :mod:`server.ingest`,
+    encoded as JSON or MessagePack and optionally gzip-compressed, and
+    acknowledges with counts only.
+    """
 
-        if not isinstance(responses, list):
-            return jsonify({"error": "Expected a list of JSON objects"}), 400
+    try:
+        payload = decode_body(
+            request.get_data(cache=False),
+            request.content_type,
+            request.headers.get("Content-Encoding"),
+        )
+        batch = to_columns(payload, device=request.headers.get("X-Device-Id"))
 
-        parsed_data = []
-        readings = []
-        for response in responses:
-            sensor_name = response.get("sensor_name")
-            sensor_output = response.get("sensor_output")
-            if sensor_name is None or sensor_output is None:
-                continue
-            parsed_data.append({"sensor_name": sensor_name, "sensor_output": sensor_output})
-            readings.append(reading_from_dict(response))
+        if batch.names:
+            get_log_store().bulk_push_columns(batch.names, batch.values, batch.timestamps, batch.devices)
 
-        if readings:
-            log_store.bulk_push(readings)
+        return jsonify({"status": "success", "accepted": len(batch), "skipped": batch.skipped}), 200
 
-        return jsonify({"status": "success", "data": parsed_data}), 200
+    # ``timed`` only sees exceptions that escape, so failures are counted here.
+    except IngestError as exc:
+        metrics.OPERATION_ERRORS.inc(1, "receive")
+        metrics.count("receive_rejected")
+        return jsonify({"error": str(exc)}), 400
 
     except Exception as exc:  # pragma: no cover - defensive fallback
-        return jsonify({"error": f"Couldn't process request. Error: {str(exc)}"}), 400
+        # Storage failures are not the gateway's fault: 503 tells it to keep
+        # the readings and retry later.
+        metrics.OPERATION_ERRORS.inc(1, "receive")
+        metrics.count("receive_errors")
+        return jsonify({"error": f"Couldn't process request. Error: {str(exc)}"}), 503
 
 
 if __name__ == "__main__":
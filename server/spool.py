@@ -0,0 +1,188 @@
+"""Durable on-disk spool for readings captured on the gateway.
+
+Readings are appended to a SQLite database in WAL mode before anything
+touches the network, so capture keeps running at line rate whatever the
+state of Redis or the cloudflared tunnel.  :class:`SpoolDrainer` replays the
+spool in insertion order and in large batches from a background thread and
+only deletes rows once the sink has accepted them.  After every batch it
+publishes the spool depth and the age of the oldest unsent reading as the
+``sensor_spool_depth`` and ``sensor_spool_oldest_age_seconds`` gauges of
+:mod:`server.metrics`.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from server.metrics import REGISTRY
+
+SpooledReading = Tuple[int, str, float, float]
+"""``(id, sensor_name, value, timestamp)`` as stored in the spool."""
+
+SPOOL_DEPTH = REGISTRY.gauge("sensor_spool_depth", "Readings waiting in the gateway spool.")
+SPOOL_OLDEST_AGE = REGISTRY.gauge(
+    "sensor_spool_oldest_age_seconds", "Age of the oldest reading waiting in the gateway spool."
+)
+
+
+class SqliteSpool:
+    """Append-only queue of readings backed by a SQLite WAL database."""
+
+    def __init__(self, path: Union[str, Path] = "gateway_spool.db") -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL only fsyncs at checkpoints: a power cut may lose the last
+        # few transactions but never corrupts the database.
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "name TEXT NOT NULL, value REAL NOT NULL, ts REAL NOT NULL)"
+        )
+        # Counted once here and then kept up to date by ``append_many`` and
+        # ``ack``, so publishing the depth after every batch is free.
+        self._depth = self._conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+    def append(self, sensor_name: str, value: float, timestamp: Optional[float] = None) -> None:
+        self.append_many([(sensor_name, value, time.time() if timestamp is None else timestamp)])
+
+    def append_many(self, rows: Iterable[Tuple[str, float, float]]) -> None:
+        """Append ``(sensor_name, value, timestamp)`` rows in one transaction.
+
+        A failing row rolls the whole batch back, so the connection is never
+        left inside an open transaction.
+        """
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                cursor = self._conn.executemany("INSERT INTO readings (name, value, ts) VALUES (?, ?, ?)", rows)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            self._depth += cursor.rowcount
+
+    def peek(self, limit: int) -> List[SpooledReading]:
+        """Return up to ``limit`` of the oldest unsent readings."""
+
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, name, value, ts FROM readings ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+
+    def ack(self, last_id: int) -> None:
+        """Forget every reading up to and including ``last_id``."""
+
+        with self._lock:
+            self._depth -= self._conn.execute("DELETE FROM readings WHERE id <= ?", (last_id,)).rowcount
+
+    def depth(self) -> int:
+        """Number of unsent readings."""
+
+        with self._lock:
+            return self._depth
+
+    def oldest_age(self) -> float:
+        """Seconds since the oldest unsent reading was captured (0 when empty)."""
+
+        with self._lock:
+            row = self._conn.execute("SELECT ts FROM readings ORDER BY id LIMIT 1").fetchone()
+        return max(time.time() - row[0], 0.0) if row else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {"depth": self.depth(), "oldest_unsent_age_s": self.oldest_age()}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SpoolDrainer:
+    """Replay a :class:`SqliteSpool` into ``sink`` from a background thread.
+
+    Parameters
+    ----------
+    spool:
+        Spool to drain.
+    sink:
+        Called with a list of :data:`SpooledReading` in insertion order; it
+        must raise if the batch was not stored.
+    batch_size:
+        Maximum readings handed to ``sink`` at once.
+    interval:
+        Seconds to wait when the spool is empty.
+    max_backoff:
+        Upper bound of the exponential backoff after failed batches.
+    """
+
+    def __init__(
+        self,
+        spool: SqliteSpool,
+        sink: Callable[[List[SpooledReading]], None],
+        *,
+        batch_size: int = 5000,
+        interval: float = 0.5,
+        max_backoff: float = 30.0,
+    ) -> None:
+        self.spool = spool
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def drain_once(self) -> int:
+        """Send one batch; return how many readings were delivered."""
+
+        rows = self.spool.peek(self.batch_size)
+        if not rows:
+            return 0
+        self.sink(rows)
+        self.spool.ack(rows[-1][0])
+        return len(rows)
+
+    def start(self) -> "SpoolDrainer":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="spool-drainer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def report(self) -> None:
+        """Publish the spool depth and oldest-unsent age as gauges."""
+
+        SPOOL_DEPTH.set(self.spool.depth())
+        SPOOL_OLDEST_AGE.set(self.spool.oldest_age())
+
+    def _run(self) -> None:
+        backoff = self.interval
+        while not self._stop.is_set():
+            try:
+                sent = self.drain_once()
+            except Exception as exc:
+                self.report()
+                print(f"Spool drain failed, retrying in {backoff:.1f}s: {exc}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            backoff = self.interval
+            self.report()
+            if sent < self.batch_size:
+                self._stop.wait(self.interval)
+
+
+__all__ = ["SPOOL_DEPTH", "SPOOL_OLDEST_AGE", "SpoolDrainer", "SpooledReading", "SqliteSpool"]
@@ -0,0 +1,261 @@
+"""Dashboard stream server on asyncio.
+
+Under gunicorn's ``gthread`` workers every open ``/api/stream`` pins one
+request thread for as long as the dashboard stays open, so the receiver
+(:mod:`server.server`) can only afford a couple of streams per worker.  This
+process serves ``/api/stream`` and ``/api/snapshot`` from a single event
+loop instead: an open dashboard costs a socket and its write buffer, not a
+thread, so hundreds of them can stay connected.
+
+One :class:`~server.live.LiveAggregate` refreshes the fleet as usual.  A
+single waiter thread blocks on it for new versions and wakes the loop,
+which sends every client the events it is missing
+(:meth:`LiveAggregate.backlog`).  The event payloads are serialised once
+and shared, and clients that cannot keep up are disconnected and resume
+with ``Last-Event-ID``.
+
+Run it next to the receiver and route ``/api/`` to it (or point the
+dashboards' ``sensor-api`` meta tag at it)::
+
+    python -m server.stream --bind 0.0.0.0:5001
+
+``DASHBOARD_ORIGIN`` and ``LIVE_INTERVAL`` work as they do for the receiver.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs
+
+from server import metrics
+from server.live import RETRY_MS, LiveAggregate, format_event
+
+DASHBOARD_ORIGIN = os.getenv("DASHBOARD_ORIGIN")
+"""Origin allowed to read the streams cross-origin; unset means same-origin only."""
+
+KEEPALIVE = 15.0
+"""Seconds without changes before a keep-alive comment is sent."""
+
+MAX_BUFFERED = 256 * 1024
+"""Bytes a client may fall behind before it is disconnected."""
+
+REQUEST_TIMEOUT = 10.0
+"""Seconds a client gets to send its request headers."""
+
+_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+@dataclass(eq=False)
+class _Client:
+    writer: asyncio.StreamWriter
+    last_event_id: Optional[str]
+
+
+class StreamServer:
+    """Serve the live aggregate to any number of dashboards from one event loop.
+
+    Parameters
+    ----------
+    aggregate:
+        Aggregate to publish; it is started on :meth:`serve`.
+    keepalive:
+        Seconds without changes before every client gets a keep-alive comment.
+    """
+
+    def __init__(self, aggregate: LiveAggregate, *, keepalive: float = KEEPALIVE) -> None:
+        self.aggregate = aggregate
+        self.keepalive = keepalive
+        self._clients: Set[_Client] = set()
+        self._active = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    async def serve(self, host: str, port: int) -> None:
+        """Listen on ``host:port`` until cancelled."""
+
+        self._loop = asyncio.get_running_loop()
+        self.aggregate.start()
+        threading.Thread(target=self._wait_for_updates, name="stream-waiter", daemon=True).start()
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"Serving dashboard streams on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    # ------------------------------------------------------------------
+    # Fan-out
+    # ------------------------------------------------------------------
+    def _wait_for_updates(self) -> None:
+        # The only thread that blocks on the aggregate, however many clients are open.
+        event_id: Optional[str] = None
+        while True:
+            self._active.wait()
+            events = self.aggregate.updates(event_id, self.keepalive)
+            if events:
+                event_id = events[-1][0]
+            self._loop.call_soon_threadsafe(self._publish, bool(events))
+
+    def _publish(self, changed: bool) -> None:
+        for client in list(self._clients):
+            if changed:
+                self._send(client)
+            else:
+                self._write(client, b": keepalive\n\n")
+
+    def _send(self, client: _Client) -> None:
+        events = self.aggregate.backlog(client.last_event_id)
+        if events:
+            self._write(client, "".join(format_event(event) for event in events).encode("utf-8"))
+            client.last_event_id = events[-1][0]
+
+    def _write(self, client: _Client, data: bytes) -> None:
+        transport = client.writer.transport
+        if transport.is_closing():
+            return
+        if transport.get_write_buffer_size() > MAX_BUFFERED:
+            # A stalled client would hold every event in memory; it resumes
+            # from its Last-Event-ID when it reconnects.
+            metrics.count("live_streams_dropped")
+            transport.abort()
+            return
+        client.writer.write(data)
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(_read_request(reader), REQUEST_TIMEOUT)
+            if request is None:
+                await self._respond(writer, 400, b'{"error":"Malformed request"}')
+                return
+            method, path, query, headers = request
+            if method not in ("GET", "HEAD"):
+                await self._respond(writer, 405, b'{"error":"Method not allowed"}')
+            elif path == "/api/stream":
+                last_event_id = headers.get("last-event-id") or (query.get("lastEventId") or [None])[0]
+                await self._stream(reader, writer, last_event_id)
+            elif path == "/api/snapshot":
+                await self._snapshot(writer, headers, include_body=method == "GET")
+            else:
+                await self._respond(writer, 404, b'{"error":"Not found"}')
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, last_event_id: Optional[str]
+    ) -> None:
+        writer.write(
+            _head(
+                200,
+                {
+                    "Content-Type": "text/event-stream",
+                    "Cache-Control": "no-cache",
+                    # ``X-Accel-Buffering`` stops nginx from holding events back.
+                    "X-Accel-Buffering": "no",
+                },
+            )
+            + f"retry: {RETRY_MS}\n\n".encode("utf-8")
+        )
+        client = _Client(writer, last_event_id)
+        self._clients.add(client)
+        self.aggregate.subscribe()
+        self._active.set()
+        try:
+            self._send(client)
+            # Clients never send anything after the request; EOF means they left.
+            while await reader.read(1024):
+                pass
+        finally:
+            self._clients.discard(client)
+            self.aggregate.unsubscribe()
+            if not self._clients:
+                self._active.clear()
+
+    async def _snapshot(self, writer: asyncio.StreamWriter, headers: Dict[str, str], include_body: bool) -> None:
+        # ``snapshot`` may wait for a refresh when the aggregate was idle.
+        version, body = await asyncio.get_running_loop().run_in_executor(None, self.aggregate.snapshot)
+        etag = f'"{version}"'
+        if headers.get("if-none-match") == etag:
+            await self._respond(writer, 304, b"", {"ETag": etag})
+            return
+        await self._respond(
+            writer, 200, body.encode("utf-8"), {"ETag": etag, "Cache-Control": "no-cache"}, include_body
+        )
+
+    async def _respond(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        body: bytes,
+        headers: Optional[Dict[str, str]] = None,
+        include_body: bool = True,
+    ) -> None:
+        headers = {"Content-Type": "application/json", **(headers or {}), "Content-Length": str(len(body))}
+        writer.write(_head(status, headers) + (body if include_body else b""))
+        await writer.drain()
+
+
+Request = Tuple[str, str, Dict[str, List[str]], Dict[str, str]]
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """``(method, path, query, headers)`` of the next request, or ``None`` if it is malformed."""
+
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        return None
+    request_line, *lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+    parts = request_line.split(" ")
+    if len(parts) != 3:
+        return None
+    method, target, _ = parts
+    path, _, query = target.partition("?")
+    headers = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return method, path, parse_qs(query), headers
+
+
+def _head(status: int, headers: Dict[str, str]) -> bytes:
+    if DASHBOARD_ORIGIN:
+        headers = {**headers, "Access-Control-Allow-Origin": DASHBOARD_ORIGIN}
+    lines = [f"HTTP/1.1 {status} {_REASONS[status]}", "Connection: close"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve the live dashboard streams from one asyncio process.")
+    parser.add_argument("--bind", default=os.getenv("STREAM_BIND", "0.0.0.0:5001"), help="Address to listen on.")
+    parser.add_argument("--interval", type=float, default=float(os.getenv("LIVE_INTERVAL", "1.0")),
+                        help="Seconds between fleet refreshes while dashboards are open.")
+    args = parser.parse_args()
+
+    from server.live import default_aggregate
+    from server.redis import SensorLogStore
+
+    host, _, port = args.bind.rpartition(":")
+    server = StreamServer(default_aggregate(SensorLogStore(), interval=args.interval))
+    try:
+        asyncio.run(server.serve(host or "0.0.0.0", int(port)))
+    except KeyboardInterrupt:
+        pass
+
+
+__all__ = ["StreamServer"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Vectorised helpers behind :meth:`server.redis.SensorLogStore.fetch_range`.
+
+Raw readings are indexed per sensor in a sorted set scored by timestamp.
+Every member is the 16 byte little-endian pair ``(timestamp, value)`` so a
+whole range decodes with one ``np.frombuffer`` call instead of parsing JSON
+reading by reading.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+RAW_DTYPE = np.dtype([("timestamp", "<f8"), ("value", "<f8")])
+"""Record layout of raw index members, also used by :mod:`server.history_io` files."""
+
+AGGREGATES = ("mean", "sum", "min", "max", "count", "last")
+FILL_METHODS = (None, "ffill", "linear")
+
+
+def raw_key(sensor_key: str) -> str:
+    return f"{sensor_key}:ts"
+
+
+def pack_raw(values: Sequence[float], timestamps: Sequence[float]) -> list:
+    """Encode readings as sorted-set members (one bytes object per reading)."""
+
+    packed = np.empty(len(values), dtype=RAW_DTYPE)
+    packed["timestamp"] = timestamps
+    packed["value"] = values
+    blob = packed.tobytes()
+    size = RAW_DTYPE.itemsize
+    return [blob[i:i + size] for i in range(0, len(blob), size)]
+
+
+def unpack_raw(members: Iterable[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode members written by :func:`pack_raw` into ``(timestamps, values)``."""
+
+    records = np.frombuffer(b"".join(members), dtype=RAW_DTYPE)
+    return records["timestamp"].copy(), records["value"].copy()
+
+
+def resample(
+    starts: np.ndarray,
+    counts: np.ndarray,
+    totals: np.ndarray,
+    minima: np.ndarray,
+    maxima: np.ndarray,
+    *,
+    start: float,
+    end: float,
+    step: float,
+    agg: str = "mean",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Aggregate pre-bucketed data onto a regular grid of width ``step``.
+
+    The inputs describe buckets (raw readings are buckets with a count of
+    one).  Grid cells without data are ``NaN`` (``0`` for ``count``/``sum``).
+    """
+
+    if agg not in AGGREGATES:
+        raise ValueError(f"agg must be one of {AGGREGATES}, got {agg!r}")
+    if step <= 0:
+        raise ValueError("step must be positive")
+
+    origin = np.floor(start / step) * step
+    n_cells = max(int(np.floor((end - origin) / step)) + 1, 0)
+    grid = origin + step * np.arange(n_cells)
+
+    cells = np.floor((np.asarray(starts) - origin) / step).astype(np.int64)
+    inside = (cells >= 0) & (cells < n_cells)
+    cells = cells[inside]
+    counts, totals = np.asarray(counts, dtype=np.float64)[inside], np.asarray(totals, dtype=np.float64)[inside]
+
+    cell_counts = np.bincount(cells, weights=counts, minlength=n_cells)
+    if agg == "count":
+        return grid, cell_counts
+    if agg == "sum":
+        return grid, np.bincount(cells, weights=totals, minlength=n_cells)
+
+    out = np.full(n_cells, np.nan)
+    if agg == "mean":
+        sums = np.bincount(cells, weights=totals, minlength=n_cells)
+        np.divide(sums, cell_counts, out=out, where=cell_counts > 0)
+    elif agg == "min":
+        np.fmin.at(out, cells, np.asarray(minima, dtype=np.float64)[inside])
+    elif agg == "max":
+        np.fmax.at(out, cells, np.asarray(maxima, dtype=np.float64)[inside])
+    else:  # last
+        # Inputs are time ordered, so the highest input index per cell is the latest.
+        latest = np.full(n_cells, -1)
+        np.maximum.at(latest, cells, np.arange(cells.size))
+        present = latest >= 0
+        out[present] = (totals / counts)[latest[present]]
+    return grid, out
+
+
+def fill_gaps(timestamps: np.ndarray, values: np.ndarray, method: Optional[str]) -> np.ndarray:
+    """Fill ``NaN`` gaps by carrying the last value forward or interpolating."""
+
+    if method not in FILL_METHODS:
+        raise ValueError(f"fill must be one of {FILL_METHODS}, got {method!r}")
+    missing = np.isnan(values)
+    if method is None or not missing.any() or missing.all():
+        return values
+
+    if method == "ffill":
+        # Leading gaps map to index 0, which is itself NaN, and stay empty.
+        index = np.where(~missing, np.arange(values.size), 0)
+        np.maximum.accumulate(index, out=index)
+        return values[index]
+
+    return np.interp(timestamps, timestamps[~missing], values[~missing])
+
+
+__all__ = [
+    "AGGREGATES",
+    "FILL_METHODS",
+    "RAW_DTYPE",
+    "fill_gaps",
+    "pack_raw",
+    "raw_key",
+    "resample",
+    "unpack_raw",
+]
@@ -0,0 +1,344 @@
+"""Gateway-side batching uploader for the ``/receive`` endpoint.
+
+The Raspberry Pi gateway used to POST every serial line on its own, opening
+a new connection each time.  :class:`BatchUploader` instead buffers readings,
+sends one gzip-compressed columnar batch per interval over a persistent
+keep-alive session, retries with exponential backoff and spools batches it
+could not deliver to a local file so they survive outages and restarts.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import requests
+
+from server.metrics import count, span
+
+DEFAULT_URL = "http://utd.d3llie.tech/receive"
+REJECTED_STATUSES = frozenset({400, 413, 415, 422})
+"""Statuses meaning the payload itself is invalid; anything else is retried and spooled."""
+
+
+class FileSpool:
+    """Append-only JSON-lines file holding columnar batches awaiting upload.
+
+    Delivered batches are not rewritten away.  A ``.offset`` file next to
+    the spool records where the first undelivered line starts, much like
+    the row ids :class:`server.spool.SqliteSpool` acknowledges, so reading
+    the next chunk and acknowledging it cost the same whatever the size of
+    the backlog.  Both files are removed once everything is delivered.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.offset_path = self.path.with_name(self.path.name + ".offset")
+
+    def append(self, batch: Dict[str, list]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab+") as handle:
+            line = json.dumps(batch).encode("utf-8") + b"\n"
+            if handle.tell():
+                # Terminate a torn last line so it cannot swallow this batch.
+                handle.seek(-1, os.SEEK_END)
+                if handle.read(1) != b"\n":
+                    line = b"\n" + line
+            handle.write(line)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def offset(self) -> int:
+        """Byte offset of the first undelivered line."""
+
+        try:
+            return int(self.offset_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def __bool__(self) -> bool:
+        try:
+            return self.path.stat().st_size > self.offset()
+        except FileNotFoundError:
+            return False
+
+    def peek(self, limit: int) -> Tuple[Dict[str, list], int]:
+        """Merge the oldest undelivered batches, up to about ``limit`` readings.
+
+        Returns the merged batch and the offset to :meth:`ack` once it has
+        been delivered.  Unreadable lines are skipped.
+        """
+
+        merged: Dict[str, list] = {"names": [], "values": [], "timestamps": []}
+        if not self.path.exists():
+            return merged, 0
+        position = self.offset()
+        with open(self.path, "rb") as handle:
+            handle.seek(position)
+            while len(merged["names"]) < limit:
+                line = handle.readline()
+                if not line:
+                    break
+                position += len(line)
+                try:
+                    batch = json.loads(line)
+                    columns = [batch[column] for column in merged]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                for column, values in zip(merged, columns):
+                    merged[column].extend(values)
+        return merged, position
+
+    def ack(self, offset: int) -> None:
+        """Mark everything before ``offset`` as delivered."""
+
+        try:
+            drained = offset >= self.path.stat().st_size
+        except FileNotFoundError:
+            drained = True
+        if drained:
+            self.clear()
+            return
+        tmp = self.offset_path.with_name(self.offset_path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as handle:
+            handle.write(str(offset))
+            handle.flush()
+            os.fsync(handle.fileno())
+        tmp.replace(self.offset_path)
+
+    def clear(self) -> None:
+        for path in (self.path, self.offset_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class BatchUploader:
+    """Buffer readings and ship them to ``/receive`` once per ``interval``.
+
+    Parameters
+    ----------
+    url:
+        Full URL of the receive endpoint.
+    interval:
+        Seconds between uploads when running in the background.
+    max_batch:
+        Upload early once this many readings are buffered.
+    compress:
+        Send gzip-compressed bodies (``Content-Encoding: gzip``).
+    spool_path:
+        File used to keep batches that could not be delivered.
+    max_retries, backoff:
+        A failed upload is retried ``max_retries`` times, sleeping
+        ``backoff * 2**attempt`` seconds in between, before it is spooled.
+        While a backlog is spooled each interval makes a single attempt.
+    dead_letter_after:
+        A spooled chunk the server answered with an error this many times
+        in a row is moved to ``<spool_path>.dead`` so newer readings can
+        go through.  Network errors never dead-letter a chunk.
+    device:
+        Id of the wearable this gateway serves; sent with every batch so the
+        server stores its readings under that device.
+    """
+
+    def __init__(
+        self,
+        url: str = DEFAULT_URL,
+        *,
+        interval: float = 1.0,
+        max_batch: int = 1000,
+        compress: bool = True,
+        spool_path: Union[str, Path] = "gateway_spool.jsonl",
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 10.0,
+        device: Optional[str] = None,
+        dead_letter_after: int = 5,
+    ) -> None:
+        self.url = url
+        self.device = device
+        self.interval = interval
+        self.max_batch = max_batch
+        self.compress = compress
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.dead_letter_after = dead_letter_after
+        self.spool = FileSpool(spool_path)
+        self.dead_letters = FileSpool(f"{spool_path}.dead")
+        self._failed_offset: Optional[int] = None
+        self._failures = 0
+
+        self._session = requests.Session()
+        self._session.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+        self._lock = threading.Lock()
+        self._names: List[str] = []
+        self._values: List[float] = []
+        self._timestamps: List[float] = []
+        self._stop = threading.Event()
+        self._full = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+    def add(self, sensor_name: str, value: float, timestamp: Optional[float] = None) -> None:
+        """Buffer one reading; ``timestamp`` defaults to now (Unix seconds)."""
+
+        with self._lock:
+            self._names.append(sensor_name)
+            self._values.append(float(value))
+            self._timestamps.append(time.time() if timestamp is None else timestamp)
+            if len(self._names) >= self.max_batch:
+                self._full.set()
+
+    def add_columns(self, names: List[str], values: List[float], timestamps: List[float]) -> None:
+        """Buffer many readings at once, e.g. everything decoded from one serial read."""
+
+        with self._lock:
+            self._names.extend(names)
+            self._values.extend(values)
+            self._timestamps.extend(timestamps)
+            if len(self._names) >= self.max_batch:
+                self._full.set()
+
+    # ------------------------------------------------------------------
+    # Upload side
+    # ------------------------------------------------------------------
+    def flush(self) -> int:
+        """Upload everything buffered plus any spooled backlog.
+
+        Returns the number of readings delivered; undeliverable readings are
+        written to the spool instead.
+        """
+
+        with self._lock:
+            batch = {"names": self._names, "values": self._values, "timestamps": self._timestamps}
+            self._names, self._values, self._timestamps = [], [], []
+
+        if not self.spool:
+            if not batch["names"]:
+                return 0
+            if self._post(batch, self.max_retries) in (200, *REJECTED_STATUSES):
+                return len(batch["names"])
+            self._spool(batch)
+            return 0
+
+        # Spooled readings are older, so they go first.
+        if batch["names"]:
+            self._spool(batch)
+        delivered = 0
+        while True:
+            # A long outage can leave a large backlog; replay it in bounded chunks.
+            chunk, offset = self.spool.peek(self.max_batch * 10)
+            size = len(chunk["names"])
+            if not size:
+                self.spool.ack(offset)
+                break
+            status = self._post(chunk, 0)
+            if status in (200, *REJECTED_STATUSES):
+                delivered += size
+            elif not self._give_up(chunk, self.spool.offset(), status):
+                break
+            self.spool.ack(offset)
+            self._failed_offset, self._failures = None, 0
+        return delivered
+
+    def _spool(self, batch: Dict[str, list]) -> None:
+        self.spool.append(batch)
+        count("readings_spooled", len(batch["names"]))
+
+    def _give_up(self, chunk: Dict[str, list], start: int, status: Optional[int]) -> bool:
+        """Count a failure of the chunk at ``start`` and dead-letter it once it keeps failing."""
+
+        if status is None:
+            return False  # the server was unreachable, not the chunk's fault
+        if start != self._failed_offset:
+            self._failed_offset, self._failures = start, 0
+        self._failures += 1
+        if self._failures < self.dead_letter_after:
+            return False
+        size = len(chunk["names"])
+        print(f"Moving {size} readings to {self.dead_letters.path} after {self._failures} failed uploads")
+        self.dead_letters.append(chunk)
+        count("readings_dead_lettered", size)
+        return True
+
+    def _post(self, batch: Dict[str, list], retries: int) -> Optional[int]:
+        """Upload ``batch`` and return the last HTTP status, or ``None`` if the server was unreachable."""
+
+        payload = batch if self.device is None else {**batch, "device": self.device}
+        body = json.dumps(payload).encode("utf-8")
+        headers = {}
+        if self.compress:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+
+        status = None
+        with span("upload", readings=len(batch["names"]), bytes=len(body)):
+            for attempt in range(retries + 1):
+                try:
+                    response = self._session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+                    status = response.status_code
+                    if status == 200:
+                        count("readings_uploaded", len(batch["names"]))
+                        return status
+                    if status in REJECTED_STATUSES:
+                        # The server rejected the payload itself.  Retrying or
+                        # spooling it would only block every later upload.
+                        print(f"Dropping rejected batch ({status}): {response.text[:200]}")
+                        count("readings_rejected", len(batch["names"]))
+                        return status
+                except requests.RequestException as exc:
+                    status = None
+                    print(f"Upload failed (attempt {attempt + 1}): {exc}")
+                count("upload_retries")
+                if attempt < retries:
+                    time.sleep(self.backoff * 2 ** attempt)
+        return status
+
+    # ------------------------------------------------------------------
+    # Background thread
+    # ------------------------------------------------------------------
+    def start(self) -> "BatchUploader":
+        """Upload in a daemon thread every ``interval`` seconds."""
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="uploader", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self) -> None:
+        """Stop the background thread and upload what is left."""
+
+        self._stop.set()
+        self._full.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self._session.close()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._full.wait(self.interval)
+            self._full.clear()
+            try:
+                self.flush()
+            except Exception as exc:  # pragma: no cover - keep the uploader alive
+                print(f"Uploader error: {exc}")
+
+    def __enter__(self) -> "BatchUploader":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+__all__ = ["BatchUploader", "DEFAULT_URL", "FileSpool"]
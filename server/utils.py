@@ -1,26 +1,206 @@
-import asyncio, time
-from server.redis import SensorLogStore
-from ml.model import AutoEncoder, anomaly_score
-from ml.rag_memory import VectorMemory  # you'll write this
+"""Asynchronous monitoring loop that scores sensors and escalates anomalies.
+
+Every tick reads the recent history of all sensors (of every device in
+fleet mode) in one pipelined ``redis.asyncio`` round trip, scores them
+together on a dedicated inference thread (cheap statistical detectors
+first, then one batched autoencoder forward pass for the sensors they are
+unsure about), queues the results for the anomaly memory and hands
+anomalous sensors to the agent as independent tasks.  Nothing on the event
+loop blocks, so a slow LLM call never delays the next scoring tick.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ml.detectors import Cascade
+from ml.memory_writer import BatchedMemoryWriter
+from ml.rag_memory import LocalVectorMemory
+from ml.runtime import DEFAULT_THRESHOLD, find_artifact, load_scorer, reconstruction_errors
+from server.redis import AsyncSensorLogStore
+
+SENSORS = ("HeartRate", "Temp", "AccelX", "AccelY", "AccelZ")
+
+
+async def monitor_sensors(
+    model,
+    memory=None,
+    agent=None,
+    *,
+    interval: float = 5,
+    threshold: Optional[float] = None,
+    sensors: Iterable[str] = SENSORS,
+    limit: int = 64,
+    store: Optional[AsyncSensorLogStore] = None,
+    cascade: bool = True,
+    fleet: bool = False,
+) -> None:
+    """Score ``sensors`` every ``interval`` seconds until cancelled.
+
+    Parameters
+    ----------
+    model:
+        :class:`ml.runtime.Scorer` for an exported artifact, or a trained
+        :class:`ml.model.AutoEncoder` in evaluation mode.  ``None`` scores
+        with the statistical detectors alone.
+    memory:
+        Anomaly memory receiving every score.  Defaults to an in-memory
+        :class:`ml.rag_memory.LocalVectorMemory`.
+    agent:
+        Optional agent exposing ``invoke``; called for scores above
+        ``threshold``.
+    threshold:
+        Reconstruction error that counts as an anomaly; defaults to the
+        threshold calibrated into ``model``.
+    cascade:
+        Settle clear cases with :class:`ml.detectors.Cascade` and only run
+        the autoencoder on uncertain windows.  ``False`` scores every window
+        with the autoencoder.
+    fleet:
+        Score ``sensors`` on every registered device (see
+        :mod:`server.devices`) instead of the device-less keys.
+    """
+
+    sensors = tuple(sensors)
+    store = store or AsyncSensorLogStore()
+    memory = memory if memory is not None else LocalVectorMemory()
+    loop = asyncio.get_running_loop()
+    analyses: Dict[str, asyncio.Task] = {}
+    if threshold is None:
+        threshold = getattr(model, "threshold", DEFAULT_THRESHOLD)
+    scorer = Cascade(model, threshold=threshold) if cascade else None
+
+    # A single inference thread keeps torch's own thread pool from being
+    # oversubscribed while the loop stays free for I/O.
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference") as executor:
+        async with BatchedMemoryWriter(memory, flush_interval=interval) as writer:
+            try:
+                while True:
+                    started = time.monotonic()
+                    if fleet:
+                        histories = await store.fetch_recent_fleet(sensors, limit=limit)
+                    else:
+                        histories = {None: await store.fetch_recent_many(sensors, limit=limit)}
+                    labels: List[Tuple[Optional[str], str]] = [
+                        (device, name)
+                        for device, readings_by_sensor in histories.items()
+                        for name, readings in readings_by_sensor.items()
+                        if readings
+                    ]
+                    windows = [[r.sensor_output for r in histories[device][name]] for device, name in labels]
+                    if scorer is not None:
+                        results = await loop.run_in_executor(
+                            executor, scorer.score_many, [name for _, name in labels], windows
+                        )
+                        verdicts = [(result.score, result.anomaly) for result in results]
+                    else:
+                        scores = await loop.run_in_executor(executor, reconstruction_errors, model, windows)
+                        verdicts = [(score, score > threshold) for score in scores]
+
+                    now = datetime.now(timezone.utc)
+                    for (device, sensor), values, (score, anomalous) in zip(labels, windows, verdicts):
+                        # The anomaly memory is indexed by sensor type, not device.
+                        writer.submit(sensor, score, values, now)
+                        if anomalous:
+                            where = sensor if device is None else f"{sensor} on {device}"
+                            print(f"🚨 Detected anomaly in {where}: {score:.4f}")
+                            if agent is not None:
+                                _dispatch_analysis(agent, sensor, score, analyses, device)
+
+                    elapsed = time.monotonic() - started
+                    await asyncio.sleep(max(interval - elapsed, 0))
+            finally:
+                for task in analyses.values():
+                    task.cancel()
+                await store.aclose()
+
+
+def _dispatch_analysis(
+    agent: Any, sensor: str, score: float, analyses: Dict[str, asyncio.Task], device: Optional[str] = None
+) -> None:
+    """Start an agent analysis for ``sensor`` unless one is still running."""
+
+    label = sensor if device is None else f"{device}/{sensor}"
+    running = analyses.get(label)
+    if running is not None and not running.done():
+        return
+
+    async def analyze() -> None:
+        subject = sensor if device is None else f"{sensor} on device {device}"
+        question = {"input": f"Analyze {subject} with anomaly score {score}"}
+        try:
+            answer = await asyncio.to_thread(agent.invoke, question)
+            print(f"\n[{label}] {answer}")
+        except Exception as exc:
+            print(f"⚠️ Agent analysis failed for {label}: {exc}")
+
+    analyses[label] = asyncio.create_task(analyze())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Score sensors continuously and escalate anomalies.")
+    parser.add_argument("--interval", type=float, default=5, help="Seconds between scoring ticks.")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="Reconstruction error that counts as an anomaly "
+                             "(default: the threshold calibrated at training time).")
+    parser.add_argument("--memory-path", default=None,
+                        help="Directory for the persistent anomaly memory.")
+    parser.add_argument("--no-agent", action="store_true", help="Only score, never call the LLM agent.")
+    parser.add_argument("--int8", action="store_true",
+                        help="Score with the torch checkpoint quantized to dynamic int8.")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch intra-op threads for checkpoint scoring (default: $TORCH_NUM_THREADS or all CPUs).")
+    parser.add_argument("--no-cascade", action="store_true",
+                        help="Score every window with the autoencoder instead of statistical detectors first.")
+    parser.add_argument("--fleet", action="store_true",
+                        help="Score every registered device instead of a single device-less wearable.")
+    args = parser.parse_args()
+
+    # The exported artifact avoids importing torch; fall back to the checkpoint.
+    if find_artifact() is not None and not args.int8:
+        model = load_scorer()
+    else:
+        from ml.inference import configure_threads, load_autoencoder
+
+        configure_threads(args.threads, interop_threads=1)
+        model, _ = load_autoencoder(quantize=args.int8)
+    if not getattr(model, "calibrated", False) and args.threshold is None:
+        # The default threshold means nothing on a model trained before calibration.
+        if args.no_cascade:
+            parser.error("the autoencoder has no calibrated threshold; retrain it with "
+                         "`python -m ml.train` or pass --threshold")
+        print("Ignoring the autoencoder: it has no calibrated threshold. Retrain it with `python -m ml.train`; "
+              "scoring with the statistical detectors only.")
+        model = None
+    agent = None
+    if not args.no_agent:
+        from ml.rag_agent import build_agent
+
+        agent = build_agent()
+
+    memory = LocalVectorMemory(args.memory_path)
+    try:
+        asyncio.run(
+            monitor_sensors(
+                model,
+                memory,
+                agent,
+                interval=args.interval,
+                threshold=args.threshold,
+                cascade=not args.no_cascade,
+                fleet=args.fleet,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        memory.flush()
 
-async def monitor_sensors(model, memory, interval=5):
-    store = SensorLogStore()
-    while True:
-        for sensor in ["HeartRate", "Temp", "AccelX", "AccelY", "AccelZ"]:
-            readings = store.fetch_recent(sensor, limit=64)
-            values = [r.sensor_output for r in readings]
-            if not values: continue
-
-            x = torch.tensor(values, dtype=torch.float32)
-            with torch.no_grad():
-                recon = model(x)
-                score = anomaly_score(recon, x).mean().item()
-
-            memory.add_entry(sensor, score, values, datetime.now(timezone.utc))
-            if score > 0.1:  # adjust threshold
-                print(f"🚨 Detected anomaly in {sensor}: {score:.4f}")
-                # Trigger the agent to analyze context
-                agent.invoke({"input": f"Analyze {sensor} with anomaly score {score}"})
-        await asyncio.sleep(interval)
 
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -1,62 +1,161 @@
-import os
-import redis
+"""Gateway writer: spool readings locally and replay them to Redis.
+
+``write2redis`` used to start a cloudflared tunnel and open a Redis
+connection for every single line, silently dropping the reading whenever
+either step failed.  It now only appends to the local SQLite spool; a
+background :class:`~server.spool.SpoolDrainer` owns the tunnel and the Redis
+connection and replays the spool in order, in pipelined batches, as soon as
+the upstream is reachable.
+"""
+
 import json
+import math
+import os
+import signal
 import subprocess
-import 
-def write2redis(jsonline): 
-        LOCAL_PORT = 63792
-        HOSTNAME = "redis.d3llie.tech"
-        LOCAL_HOST = "127.0.0.1"
-        SERVICE_TOKEN_SECRET="4e0f730142c2a5a1e2889125de517265ab7430e42c00e39778908953a5f8ed5e"
-        SERVICE_TOKEN_ID="5f5f6f7f70032ed235556225e80bb9b1.access"
-    
-        try: 
+import threading
+import time
+from typing import List, Optional
+
+import redis
+
+from server.devices import check_device_id, sensor_key
+from server.spool import SpoolDrainer, SpooledReading, SqliteSpool
+
+LOCAL_PORT = 63792
+HOSTNAME = "redis.d3llie.tech"
+LOCAL_HOST = "127.0.0.1"
+STREAM_KEY = "stream"
+SPOOL_PATH = os.getenv("GATEWAY_SPOOL", "gateway_spool.db")
+DEVICE_ID = os.getenv("DEVICE_ID")
+
+
+class RedisTunnelSink:
+    """Write spooled readings to the Redis stream through a cloudflared tunnel.
+
+    The tunnel process and the Redis client are created on first use and
+    recreated after a failure, so an outage only costs a reconnect.  With a
+    ``device`` the stream is that device's ``{<device>}:stream`` key.
+
+    The cloudflared service token is read from ``SERVICE_TOKEN_ID`` and
+    ``SERVICE_TOKEN_SECRET``; construction fails when either is unset.
+    """
+
+    def __init__(self, stream_key: str = STREAM_KEY, device: Optional[str] = None) -> None:
+        self._token_id = os.getenv("SERVICE_TOKEN_ID")
+        self._token_secret = os.getenv("SERVICE_TOKEN_SECRET")
+        if not self._token_id or not self._token_secret:
+            raise RuntimeError(
+                "Set SERVICE_TOKEN_ID and SERVICE_TOKEN_SECRET to the cloudflared service token "
+                f"for {HOSTNAME} before starting the gateway writer."
+            )
+        if device is not None:
+            stream_key = sensor_key(stream_key, check_device_id(device))
+        self.stream_key = stream_key
+        self._proc: Optional[subprocess.Popen] = None
+        self._redis: Optional[redis.Redis] = None
+
+    def _connect(self) -> redis.Redis:
+        if self._proc is None or self._proc.poll() is not None:
             cloudflared_cmd = [
                 "cloudflared", "access", "tcp",
                 "--hostname", HOSTNAME,
                 "--url", f"{LOCAL_HOST}:{LOCAL_PORT}",
-                "--service-token-id", SERVICE_TOKEN_ID,
-                "--service-token-secret", SERVICE_TOKEN_SECRET,
+                "--service-token-id", self._token_id,
+                "--service-token-secret", self._token_secret,
             ]
-
-        # Output status information
-            print(f"Starting Cloudflare proxy on {LOCAL_HOST}:{LOCAL_PORT} → redis.d3llie.tech ...")
-
-    # Make the actual subprocess to handle our connection
-            proc = subprocess.Popen(
+            print(f"Starting Cloudflare proxy on {LOCAL_HOST}:{LOCAL_PORT} → {HOSTNAME} ...")
+            self._proc = subprocess.Popen(
                 cloudflared_cmd,
-                stdout=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
                 stderr=subprocess.PIPE,
                 text=True,
             )
-    # Wait briefly for the tunnel to come up
+            # Wait briefly for the tunnel to come up
             time.sleep(0.5)
-
-            if proc.poll() is not None:
-                stderr = proc.stderr.read()
+            if self._proc.poll() is not None:
+                stderr = self._proc.stderr.read()
+                self._proc = None
                 raise RuntimeError(f"cloudflared exited early:\n{stderr}")
-        except:
-            pass
-    # The main connection initialization block
-        try:
-            r = redis.Redis(
-                host=f'{LOCAL_HOST}',
+            self._redis = None
+
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=LOCAL_HOST,
                 port=LOCAL_PORT,
                 username="default",
                 password=os.getenv("REDIS_PASSWORD"),
                 decode_responses=True,
+                socket_keepalive=True,
             )
-        
-        except Exception as e:
-            print(
-                f"Failed to establish SQL connection!\nFailed with exception: {e}")
-            if proc.poll() is None:
-                proc.send_signal(signal.SIGINT)  # Tell it to close
-                try:
+        return self._redis
+
+    def __call__(self, rows: List[SpooledReading]) -> None:
+        client = self._connect()
+        try:
+            pipe = client.pipeline(transaction=False)
+            for _, name, value, timestamp in rows:
+                pipe.xadd(self.stream_key, {name: str(value), "ts": repr(timestamp)})
+            pipe.execute()
+        except redis.RedisError:
+            # Drop the connection so the next attempt reconnects from scratch.
+            self._redis = None
+            raise
+
+    def close(self) -> None:
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.send_signal(signal.SIGINT)  # Tell it to close
+            try:
                 # Give it the chance to exit gracefully
-                    proc.wait(timeout=3)
-                except subprocess.TimeoutExpired:
-                    proc.kill()  # Kill it if it takes too long
-    
-        jsonline = json.loads(jsonline)
-        r.xadd("stream", jsonline)
+                self._proc.wait(timeout=3)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()  # Kill it if it takes too long
+        self._proc = None
+        self._redis = None
+
+
+_spool: Optional[SqliteSpool] = None
+_drainer: Optional[SpoolDrainer] = None
+_init_lock = threading.Lock()
+
+
+def get_spool() -> SqliteSpool:
+    """Return the process-wide spool, starting its drainer on first use."""
+
+    global _spool, _drainer
+    with _init_lock:
+        if _spool is None:
+            # Build the sink first so a missing service token fails before anything is spooled.
+            sink = RedisTunnelSink(device=DEVICE_ID)
+            _spool = SqliteSpool(SPOOL_PATH)
+            _drainer = SpoolDrainer(_spool, sink).start()
+    return _spool
+
+
+def write2redis(jsonline):
+    """Spool a ``{"Name": "value"}`` JSON line for delivery to Redis.
+
+    NaN and infinite values are dropped; SQLite would store NaN as NULL.
+    """
+
+    data = json.loads(jsonline)
+    now = time.time()
+    rows = [(name, float(value), now) for name, value in data.items()]
+    get_spool().append_many(row for row in rows if math.isfinite(row[1]))
+
+
+def write_columns(names, values, timestamps):
+    """Spool decoded ``(names, values, timestamps)`` columns for delivery to Redis.
+
+    The bulk counterpart of :func:`write2redis` for
+    :meth:`server.frames.DecodedFrames.columns`; non-finite values are dropped.
+    """
+
+    rows = zip(names, map(float, values), timestamps)
+    get_spool().append_many(row for row in rows if math.isfinite(row[1]))
+
+
+def spool_stats():
+    """Depth and oldest-unsent age of the gateway spool."""
+
+    return get_spool().stats()
@@ -0,0 +1,122 @@
+"""Sensor queries behind the agent tools, usable without LangChain.
+
+:mod:`tool.sensor_tool` wraps these functions as LangChain tools for the
+agent; scripts that only want the answers import them from here and skip
+the LangChain import entirely.  The Redis store and the cascade (with its
+lazily loaded model) are built on the first call and reused afterwards.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from ml.detectors import Cascade
+from ml.runtime import load_default_model
+from server.redis import SensorLogStore
+
+_store: Optional[SensorLogStore] = None
+_cascade: Optional[Cascade] = None
+_lock = threading.Lock()
+
+
+def _get_store() -> SensorLogStore:
+    global _store
+    with _lock:
+        if _store is None:
+            _store = SensorLogStore()
+        return _store
+
+
+def _get_cascade() -> Cascade:
+    global _cascade
+    with _lock:
+        if _cascade is None:
+            # No explicit threshold: the model's calibrated one applies.
+            _cascade = Cascade(load_model=load_default_model)
+        return _cascade
+
+
+def detect_anomalies(sensor_name: str, limit: int = 128, device: str = "") -> str:
+    """Check recent readings for anomalies.
+
+    Cheap statistical detectors decide clear cases; the trained autoencoder
+    is only loaded and run when they are unsure.  ``device`` selects one
+    wearable of a fleet.
+    """
+
+    store = _get_store()
+    readings = store.fetch_recent(sensor_name, limit=limit, device=device or None)
+    if not readings:
+        return f"No readings found for {sensor_name}"
+
+    values = [r.sensor_output for r in readings]
+    result = _get_cascade().score({sensor_name: values})[sensor_name]
+
+    if result.anomaly:
+        status = "⚠️ anomaly detected" 
+        os.environ["ANOMALY_STATUS"] = "1"
+    else:
+        os.environ["ANOMALY_STATUS"] = "0"
+        status = "✅ normal"
+    if result.reconstruction_error is not None:
+        detail = f"reconstruction_error={result.reconstruction_error:.4f}"
+    else:
+        detail = f"{result.reason}_score={result.classical:.2f}"
+    latest_timestamp = readings[-1].timestamp
+    if latest_timestamp.tzinfo is None:
+        latest_timestamp = latest_timestamp.replace(tzinfo=timezone.utc)
+    else:
+        latest_timestamp = latest_timestamp.astimezone(timezone.utc)
+    return (
+        f"Sensor {sensor_name} @ {latest_timestamp.isoformat()}: "
+        f"{detail}, status={status}"
+    )
+
+def sensor_data_retriever(
+    sensor_name: str, limit: int = 10, resolution_seconds: float = 0, device: str = ""
+) -> str:
+    """Return a compact table with the latest sensor readings.
+
+    With ``resolution_seconds`` set, return the last ``limit`` buckets of that
+    width (mean/min/max/count) from the rollup tiers instead of raw values.
+    ``device`` selects one wearable of a fleet.
+    """
+
+    store = _get_store()
+    device = device or None
+    if resolution_seconds > 0:
+        end = time.time()
+        buckets = store.fetch_history(
+            sensor_name, end - limit * resolution_seconds, end, resolution=resolution_seconds, device=device
+        )
+        if not buckets:
+            return f"No readings found for {sensor_name}"
+        lines = ["timestamp,mean,min,max,count"]
+        for bucket in buckets[-limit:]:
+            timestamp = datetime.fromtimestamp(bucket.start, tz=timezone.utc)
+            lines.append(
+                f"{timestamp.isoformat()},{bucket.mean:.4f},{bucket.minimum:.4f},"
+                f"{bucket.maximum:.4f},{bucket.count}"
+            )
+        return "\n".join(lines)
+
+    readings = store.fetch_recent(sensor_name, limit=limit, device=device)
+    if not readings:
+        return f"No readings found for {sensor_name}"
+
+    lines = ["timestamp,value"]
+    for reading in readings[-limit:]:
+        timestamp = reading.timestamp
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        else:
+            timestamp = timestamp.astimezone(timezone.utc)
+        lines.append(f"{timestamp.isoformat()},{reading.sensor_output:.4f}")
+    return "\n".join(lines)
+
+
+__all__ = ["detect_anomalies", "sensor_data_retriever"]